@@ -0,0 +1,92 @@
+"""
+Local stand-in for the AI similarity endpoint, for testing the AI client.
+Answers POST requests with deterministic results derived from the text hash and can
+simulate latency and failures.
+Usage: python ai_stub_server.py [--port 8765] [--delay 0.2] [--fail-rate 0.1]
+Then run the app with AI_SIMILARITY_ENDPOINT=http://127.0.0.1:8765/similarity and any
+AI_SIMILARITY_API_KEY other than demo_key.
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def stub_results(text):
+    """Deterministic results for a text, shaped like the real endpoint's response."""
+    text_hash = hashlib.md5(text.encode()).hexdigest()
+    score = (int(text_hash[0], 16) % 10) / 10.0
+    if score <= 0.1 or not text:
+        return []
+
+    start = int(text_hash[1:5], 16) % max(1, len(text))
+    end = min(len(text), start + 40)
+    return [{
+        'document_name': f"Stub source {text_hash[:6]}",
+        'document_type': "Published Material",
+        'similarity_score': score,
+        'matching_blocks': [{
+            'a_start': start,
+            'a_end': end,
+            'b_start': 0,
+            'b_end': end - start,
+            'size': end - start,
+            'text': text[start:end],
+        }],
+        'source': "Stub Corpus",
+    }]
+
+
+def make_handler(delay, fail_rate):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b'{}')
+
+            if delay:
+                time.sleep(delay)
+
+            if random.random() < fail_rate:
+                self._reply(503, {'error': 'simulated failure'})
+                return
+
+            self._reply(200, {'results': stub_results(payload.get('text', ''))})
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            print(f"[stub] {self.address_string()} {format % args}")
+
+    return StubHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub AI similarity endpoint")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.delay, args.fail_rate))
+    print(f"Stub AI similarity endpoint on http://{args.host}:{args.port}/similarity")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Deterministic synthetic corpus for the Paperlit benchmarks.
+Essays are built from seeded random sentences over a Zipf-weighted vocabulary, so the
+same seed always gives the same texts. Passages copied from other essays can be planted
+at a controlled rate, and texts can be written out as .txt or simple generated .pdf files.
+"""
+import random
+from typing import List, NamedTuple, Tuple
+
+VOCABULARY_SIZE = 5000
+PDF_LINE_CHARS = 90
+PDF_PAGE_LINES = 50
+
+
+class PlantedText(NamedTuple):
+    text: str
+    # (source index, number of characters copied from it)
+    planted: List[Tuple[int, int]]
+
+
+class CorpusGenerator:
+    """Seeded generator of essays and plagiarised variants."""
+
+    def __init__(self, seed: int = 42):
+        self.random = random.Random(seed)
+        syllables = ['ka', 'to', 're', 'mi', 'lan', 'so', 'vel', 'ni', 'dor', 'ha', 'pe', 'qui', 'str', 'um']
+        words = set()
+        while len(words) < VOCABULARY_SIZE:
+            words.add(''.join(self.random.choice(syllables) for _ in range(self.random.randint(1, 4))))
+        self.vocabulary = sorted(words)
+        self.weights = [1.0 / (rank + 1) for rank in range(len(self.vocabulary))]
+
+    def sentence(self) -> str:
+        words = self.random.choices(self.vocabulary, self.weights, k=self.random.randint(8, 24))
+        return ' '.join(words).capitalize() + '.'
+
+    def essay(self, words: int) -> str:
+        """An essay of about the given number of words, in paragraphs of a few sentences."""
+        paragraphs = []
+        count = 0
+        while count < words:
+            sentences = []
+            for _ in range(self.random.randint(3, 7)):
+                sentences.append(self.sentence())
+                count += sentences[-1].count(' ') + 1
+                if count >= words:
+                    break
+            paragraphs.append(' '.join(sentences))
+        return '\n\n'.join(paragraphs)
+
+    def plagiarise(self, text: str, sources: List[str], rate: float, passage_words: int = 60) -> PlantedText:
+        """
+        Replace about rate of the words of text with passages of passage_words words copied
+        from random sources. Returns the new text and what was planted.
+        """
+        words = text.split(' ')
+        if not sources or rate <= 0:
+            return PlantedText(text, [])
+
+        planted = []
+        passages = max(1, int(len(words) * rate / passage_words))
+        spacing = len(words) // passages
+        output = []
+        for index in range(passages):
+            output.extend(words[index * spacing:index * spacing + spacing - passage_words])
+            source_index = self.random.randrange(len(sources))
+            source_words = sources[source_index].split(' ')
+            start = self.random.randrange(max(1, len(source_words) - passage_words))
+            passage = source_words[start:start + passage_words]
+            output.extend(passage)
+            planted.append((source_index, len(' '.join(passage))))
+        output.extend(words[passages * spacing:])
+        return PlantedText(' '.join(output), planted)
+
+    def corpus(self, documents: int, words: int) -> List[str]:
+        return [self.essay(words) for _ in range(documents)]
+
+
+def write_text(path: str, text: str) -> str:
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return path
+
+
+def _pdf_lines(text: str) -> List[str]:
+    # Wrap on word boundaries so extraction gives back whole words
+    lines = []
+    for paragraph in text.split('\n'):
+        line = ''
+        for word in paragraph.split(' '):
+            if line and len(line) + 1 + len(word) > PDF_LINE_CHARS:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path: str, text: str) -> str:
+    """Write text as a minimal multi-page PDF using the built-in Helvetica font."""
+    lines = _pdf_lines(text)
+    pages = [lines[i:i + PDF_PAGE_LINES] for i in range(0, len(lines), PDF_PAGE_LINES)] or [[]]
+
+    objects = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for index, page_lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * index, 5 + 2 * index
+        kids.append(f"{page_id} 0 R")
+        escaped = [line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') for line in page_lines]
+        stream = "BT /F1 10 Tf 40 780 Td 14 TL " + ' '.join(f"({line}) '" for line in escaped) + " ET"
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        objects[content_id] = f"<< /Length {len(stream.encode('latin-1'))} >>\nstream\n{stream}\nendstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(output)
+        output += f"{number} 0 obj\n{objects[number]}\nendobj\n".encode('latin-1')
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    for number in sorted(objects):
+        output += f"{offsets[number]:010d} 00000 n \n".encode('latin-1')
+    output += (f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+               f"startxref\n{xref}\n%%EOF\n").encode('latin-1')
+
+    with open(path, 'wb') as f:
+        f.write(output)
+    return path
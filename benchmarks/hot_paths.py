@@ -0,0 +1,178 @@
+"""
+Micro-benchmarks of the similarity and extraction hot paths.
+Times find_matching_blocks, calculate_similarity, calculate_originality and
+extract_text_from_file on a deterministic synthetic corpus across document and corpus
+sizes, and reports the median time, throughput and peak traced memory of each case.
+Results can be saved as a named baseline and compared against later.
+Usage:
+    python benchmarks/hot_paths.py [--quick] [--only NAME] [--save NAME] [--compare NAME]
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import tracemalloc
+from contextlib import redirect_stdout
+from typing import Callable, List
+
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import CorpusGenerator, write_text, write_pdf
+from src.services.plagiarism_service import find_matching_blocks, calculate_similarity, calculate_originality
+from src.utils.file_extract import extract_text_from_file
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+DOCUMENT_WORDS = [500, 2000, 8000]
+CORPUS_SIZES = [5, 20, 80]
+CORPUS_DOCUMENT_WORDS = 1500
+PLAGIARISM_RATE = 0.2
+QUICK_DOCUMENT_WORDS = [500, 2000]
+QUICK_CORPUS_SIZES = [5, 20]
+
+
+class Case:
+    """One benchmark case: a callable and the amount of work it does per call."""
+
+    def __init__(self, name: str, params: str, run: Callable[[], object], work: int, unit: str):
+        self.name = name
+        self.params = params
+        self.run = run
+        self.work = work
+        self.unit = unit
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}[{self.params}]"
+
+
+def build_cases(workdir: str, document_words: List[int], corpus_sizes: List[int]) -> List[Case]:
+    generator = CorpusGenerator(seed=42)
+    cases = []
+
+    for words in document_words:
+        source = generator.essay(words)
+        suspect = generator.plagiarise(generator.essay(words), [source], PLAGIARISM_RATE).text
+        chars = len(suspect) + len(source)
+        cases.append(Case('find_matching_blocks', f"words={words}",
+                          lambda a=suspect, b=source: find_matching_blocks(a, b), chars, 'chars'))
+        cases.append(Case('calculate_similarity', f"words={words}",
+                          lambda a=suspect, b=source: calculate_similarity(a, b), chars, 'chars'))
+
+        text_path = write_text(os.path.join(workdir, f"essay_{words}.txt"), suspect)
+        pdf_path = write_pdf(os.path.join(workdir, f"essay_{words}.pdf"), suspect)
+        cases.append(Case('extract_text_from_file', f"txt,words={words}",
+                          lambda path=text_path: extract_text_from_file(path), len(suspect), 'chars'))
+        cases.append(Case('extract_text_from_file', f"pdf,words={words}",
+                          lambda path=pdf_path: extract_text_from_file(path), len(suspect), 'chars'))
+
+    for size in corpus_sizes:
+        previous = generator.corpus(size, CORPUS_DOCUMENT_WORDS)
+        new_text = generator.plagiarise(generator.essay(CORPUS_DOCUMENT_WORDS), previous[:3], PLAGIARISM_RATE).text
+        names = [f"Document {i + 1}" for i in range(size)]
+        cases.append(Case('calculate_originality', f"docs={size},words={CORPUS_DOCUMENT_WORDS}",
+                          lambda t=new_text, p=previous, n=names: calculate_originality(t, p, n), size, 'docs'))
+    return cases
+
+
+def measure(case: Case, repeat: int) -> dict:
+    """Median wall time over repeat runs, then one traced run for the peak allocation."""
+    sink = io.StringIO()
+    timings = []
+    with redirect_stdout(sink):
+        case.run()  # warm-up
+        for _ in range(repeat):
+            started = time.perf_counter()
+            case.run()
+            timings.append(time.perf_counter() - started)
+            sink.seek(0)
+            sink.truncate()
+
+        tracemalloc.start()
+        case.run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    seconds = statistics.median(timings)
+    return {
+        'seconds': seconds,
+        'throughput': case.work / seconds if seconds else 0.0,
+        'unit': case.unit,
+        'peak_bytes': peak,
+    }
+
+
+def load_baseline(name: str) -> dict:
+    with open(os.path.join(BASELINE_DIR, f"{name}.json"), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(name: str, results: dict) -> str:
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = os.path.join(BASELINE_DIR, f"{name}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the similarity and extraction hot paths")
+    parser.add_argument('--quick', action='store_true', help="Smaller documents and corpora")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case (median is reported)")
+    parser.add_argument('--only', help="Run only cases whose function name contains this text")
+    parser.add_argument('--save', metavar='NAME', help="Save the results as baselines/NAME.json")
+    parser.add_argument('--compare', metavar='NAME', help="Compare against baselines/NAME.json")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Relative slowdown reported as a regression (default 0.2 = 20%%)")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.compare)['results'] if args.compare else {}
+    document_words = QUICK_DOCUMENT_WORDS if args.quick else DOCUMENT_WORDS
+    corpus_sizes = QUICK_CORPUS_SIZES if args.quick else CORPUS_SIZES
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory(prefix='paperlit-bench-') as workdir:
+        cases = build_cases(workdir, document_words, corpus_sizes)
+        if args.only:
+            cases = [case for case in cases if args.only in case.name]
+
+        print(f"{'case':<52} {'median':>10} {'throughput':>18} {'peak':>9} {'vs base':>8}")
+        for case in cases:
+            result = measure(case, args.repeat)
+            results[case.key] = result
+
+            change = ''
+            previous = baseline.get(case.key)
+            if previous:
+                ratio = result['seconds'] / previous['seconds'] if previous['seconds'] else 1.0
+                change = f"{ratio - 1:+.0%}"
+                if ratio > 1 + args.tolerance:
+                    regressions.append(case.key)
+                    change += ' !'
+            print(f"{case.key:<52} {result['seconds'] * 1000:>8.1f}ms "
+                  f"{result['throughput']:>12,.0f} {result['unit']}/s "
+                  f"{result['peak_bytes'] / 1e6:>7.1f}MB {change:>8}")
+
+    if args.save:
+        print(f"Baseline saved to {save_baseline(args.save, results)}")
+    if regressions:
+        print(f"{len(regressions)} cases slower than the baseline by more than {args.tolerance:.0%}:")
+        for key in regressions:
+            print(f"  {key}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Precision/recall of MinHash LSH near-duplicate detection for different signature
+lengths and band counts, on a synthetic corpus of essays and lightly edited copies.
+Usage:
+    python benchmarks/minhash_lsh.py [--essays 20] [--words 1500] [--threshold 0.85]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from itertools import combinations
+
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.services.fingerprint_index import tokenize, kgram_hashes
+from src.services.minhash import _permutations, compute_signature, band_buckets, estimate_jaccard
+
+# (signature length, bands) pairs compared by default
+CONFIGS = [(64, 8), (64, 16), (128, 16), (128, 32), (256, 32), (256, 64)]
+# Fraction of words changed in the edited copies of each essay
+EDIT_RATES = [0.01, 0.03, 0.05, 0.1, 0.2, 0.4]
+
+
+def make_corpus(essays: int, words: int, seed: int = 7) -> list:
+    rnd = random.Random(seed)
+    vocabulary = [f"w{i}" for i in range(3000)]
+    weights = [1.0 / (i + 1) for i in range(len(vocabulary))]
+
+    def essay():
+        return rnd.choices(vocabulary, weights, k=words)
+
+    def edit(tokens, rate):
+        tokens = list(tokens)
+        for _ in range(int(len(tokens) * rate)):
+            position = rnd.randrange(len(tokens))
+            operation = rnd.random()
+            if operation < 0.4:
+                tokens[position] = rnd.choice(vocabulary)
+            elif operation < 0.7:
+                tokens.insert(position, rnd.choice(vocabulary))
+            else:
+                del tokens[position]
+        return tokens
+
+    corpus = []
+    for _ in range(essays):
+        base = essay()
+        corpus.append(' '.join(base))
+        corpus.extend(' '.join(edit(base, rate)) for rate in EDIT_RATES)
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--essays', type=int, default=20, help="Original essays (each gets edited copies)")
+    parser.add_argument('--words', type=int, default=1500, help="Words per essay")
+    parser.add_argument('--threshold', type=float, default=0.85, help="Jaccard similarity counted as near-duplicate")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.essays, args.words)
+    shingles = [set(kgram_hashes(tokenize(text))) for text in corpus]
+    pairs = list(combinations(range(len(corpus)), 2))
+    exact = {(i, j): len(shingles[i] & shingles[j]) / len(shingles[i] | shingles[j]) for i, j in pairs}
+    relevant = {pair for pair, jaccard in exact.items() if jaccard >= args.threshold}
+    print(f"{len(corpus)} documents, {len(pairs)} pairs, {len(relevant)} with Jaccard >= {args.threshold}")
+    print(f"{'perms':>5} {'bands':>5} {'~thresh':>7} {'candidates':>10} {'precision':>9} {'recall':>6} "
+          f"{'mean err':>8} {'ms/doc':>7}")
+
+    for permutations, bands in CONFIGS:
+        hash_functions = _permutations(permutations)
+        started = time.perf_counter()
+        signatures = [compute_signature(text, hash_functions) for text in corpus]
+        per_document = (time.perf_counter() - started) / len(corpus) * 1000
+
+        buckets = {}
+        for index, signature in enumerate(signatures):
+            for band, bucket in enumerate(band_buckets(signature, bands)):
+                buckets.setdefault((band, bucket), []).append(index)
+        candidates = {pair for members in buckets.values() for pair in combinations(members, 2)}
+
+        detected = {pair for pair in candidates
+                    if estimate_jaccard(signatures[pair[0]], signatures[pair[1]]) >= args.threshold}
+        true_positives = len(detected & relevant)
+        precision = true_positives / len(detected) if detected else 1.0
+        recall = true_positives / len(relevant) if relevant else 1.0
+        error = sum(abs(estimate_jaccard(signatures[i], signatures[j]) - exact[(i, j)])
+                    for i, j in candidates) / max(1, len(candidates))
+        approximate_threshold = (1 / bands) ** (bands / permutations)
+        print(f"{permutations:>5} {bands:>5} {approximate_threshold:>7.2f} {len(candidates):>10} "
+              f"{precision:>9.3f} {recall:>6.3f} {error:>8.3f} {per_document:>7.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Maintenance commands for Paperlit.
+Usage:
+    python maintenance.py rebuild-text-store [--force]
+    python maintenance.py rebuild-fingerprints
+    python maintenance.py rebuild-corpus
+    python maintenance.py rebuild-minhash
+    python maintenance.py ai-cache [--clear]
+    python maintenance.py reconcile-storage [--dry-run]
+    python maintenance.py grant-admin <username> [--revoke]
+    python maintenance.py set-institution <username> [<institution>]
+"""
+import os
+import sys
+import argparse
+
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from src.app import app
+from src.services.storage import resolve_path
+
+
+def rebuild_text_store_command(args):
+    """Re-extract document texts into the extracted-text store."""
+    from src.services.text_store import rebuild_text_store
+
+    with app.app_context():
+        stats = rebuild_text_store(resolve_path, force=args.force)
+    print(f"Text store rebuilt: {stats}")
+
+
+def rebuild_fingerprints_command(args):
+    """Re-fingerprint every document into the winnowing index."""
+    from src.services.text_store import get_document_text
+    from src.services.fingerprint_index import rebuild_fingerprint_index
+
+    def load_text(document):
+        file_path = None if document.content_hash else resolve_path(document)
+        return get_document_text(document, file_path)
+
+    with app.app_context():
+        stats = rebuild_fingerprint_index(load_text)
+    print(f"Fingerprint index rebuilt: {stats}")
+
+
+def rebuild_corpus_command(args):
+    """Recompute institution scopes and document counts of the corpus index."""
+    from src.services.corpus_search import rebuild_corpus_index
+
+    with app.app_context():
+        stats = rebuild_corpus_index()
+    print(f"Corpus index rebuilt: {stats}")
+
+
+def rebuild_minhash_command(args):
+    """Recompute the MinHash signature and LSH buckets of every document."""
+    from src.services.text_store import get_document_text
+    from src.services.minhash import rebuild_minhash_index
+
+    def load_text(document):
+        file_path = None if document.content_hash else resolve_path(document)
+        return get_document_text(document, file_path)
+
+    with app.app_context():
+        stats = rebuild_minhash_index(load_text)
+    print(f"MinHash index rebuilt: {stats}")
+
+
+def ai_cache_command(args):
+    """Show the AI result cache counters, or empty the cache."""
+    from src.services.ai_cache import get_ai_cache
+
+    cache = get_ai_cache()
+    if cache is None:
+        print("AI result cache is disabled (AI_CACHE_ENABLED=false)")
+        return
+    if args.clear:
+        cache.clear()
+        print("AI result cache cleared")
+    print(f"AI result cache: {cache.stats()}")
+
+
+def reconcile_storage_command(args):
+    """Rewrite legacy document file paths to canonical storage keys."""
+    from src.services.storage import reconcile_storage
+
+    with app.app_context():
+        stats = reconcile_storage(dry_run=args.dry_run)
+    print(f"Storage reconciled{' (dry run)' if args.dry_run else ''}: {stats}")
+
+
+def grant_admin_command(args):
+    """Grant (or revoke) admin rights, which open /admin and request profiling."""
+    from src.models import db, User
+
+    with app.app_context():
+        user = User.query.filter_by(username=args.username).first()
+        if user is None:
+            sys.exit(f"No user named {args.username!r}.")
+        user.is_admin = not args.revoke
+        db.session.commit()
+    print(f"{args.username} is {'no longer ' if args.revoke else ''}an admin.")
+
+
+def set_institution_command(args):
+    """Set (or clear) the verified institution whose corpus a user's documents join."""
+    from src.models import db, User
+    from src.services.corpus_search import move_user_documents
+
+    with app.app_context():
+        user = User.query.filter_by(username=args.username).first()
+        if user is None:
+            sys.exit(f"No user named {args.username!r}.")
+        user.verified_institution = args.institution
+        db.session.commit()
+        moved = move_user_documents(user.id, args.institution)
+    print(f"{args.username} is {'at ' + repr(args.institution) if args.institution else 'in no institution'}; "
+          f"{moved} documents moved.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paperlit maintenance commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild_text = subparsers.add_parser('rebuild-text-store', help="Re-extract document texts into the text store")
+    rebuild_text.add_argument('--force', action='store_true', help="Re-extract even entries that are up to date")
+    rebuild_text.set_defaults(func=rebuild_text_store_command)
+
+    rebuild_fingerprints = subparsers.add_parser('rebuild-fingerprints', help="Rebuild the winnowing fingerprint index")
+    rebuild_fingerprints.set_defaults(func=rebuild_fingerprints_command)
+
+    rebuild_corpus = subparsers.add_parser('rebuild-corpus', help="Rebuild the institution-wide corpus index")
+    rebuild_corpus.set_defaults(func=rebuild_corpus_command)
+
+    rebuild_minhash = subparsers.add_parser('rebuild-minhash', help="Rebuild MinHash signatures and LSH buckets")
+    rebuild_minhash.set_defaults(func=rebuild_minhash_command)
+
+    ai_cache = subparsers.add_parser('ai-cache', help="Show AI result cache hit/miss counters")
+    ai_cache.add_argument('--clear', action='store_true', help="Remove all cached results")
+    ai_cache.set_defaults(func=ai_cache_command)
+
+    reconcile = subparsers.add_parser('reconcile-storage', help="Move legacy uploads to canonical storage keys")
+    reconcile.add_argument('--dry-run', action='store_true', help="Report the changes without applying them")
+    reconcile.set_defaults(func=reconcile_storage_command)
+
+    grant_admin = subparsers.add_parser('grant-admin', help="Give a user admin rights (request profiling)")
+    grant_admin.add_argument('username')
+    grant_admin.add_argument('--revoke', action='store_true', help="Take the rights away instead")
+    grant_admin.set_defaults(func=grant_admin_command)
+
+    set_institution = subparsers.add_parser('set-institution', help="Assign the institution whose corpus a user joins")
+    set_institution.add_argument('username')
+    set_institution.add_argument('institution', nargs='?', help="Omit to remove the user from any corpus")
+    set_institution.set_defaults(func=set_institution_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 """
-Migration script to add the similarity_details column to the documents table in PostgreSQL.
-Run this script to update the database schema.
+Migration script to add new columns to the documents table in PostgreSQL.
+New tables are created by db.create_all() when the app is imported.
+Run this script to update the database schema. It also moves similarity details
+still stored as JSON into the similarity_matches and matching_blocks tables.
 """
+import json
 import os
 import sys
 import psycopg2
@@ -11,9 +14,48 @@ from psycopg2 import sql
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
 from src.app import app
+from src.models import db, Document, SimilarityMatch
+
+# (column name, SQL type) pairs added to the documents table when missing
+DOCUMENT_COLUMNS = [
+    ('similarity_details', 'TEXT'),
+    ('content_hash', 'VARCHAR(64)'),
+    ('fingerprint_count', 'INTEGER'),
+    ('analysis_status', 'VARCHAR(20)'),
+    ('top_match_name', 'VARCHAR(255)'),
+    ('match_count', 'INTEGER'),
+    ('original_filename', 'VARCHAR(255)'),
+    ('analyzed_content_hash', 'VARCHAR(64)'),
+    ('minhash_signature', 'BYTEA'),
+    ('batch_id', 'INTEGER REFERENCES bulk_batches(id) ON DELETE SET NULL'),
+]
+
+# Columns added to tables that earlier versions of this script created
+TABLE_COLUMNS = [
+    ('users', [('is_admin', 'BOOLEAN NOT NULL DEFAULT FALSE'), ('verified_institution', 'VARCHAR(100)')]),
+    ('documents', DOCUMENT_COLUMNS),
+    ('similarity_matches', [('matched_content_hash', 'VARCHAR(64)'),
+                            ('near_duplicate', 'BOOLEAN NOT NULL DEFAULT FALSE')]),
+    ('analysis_jobs', [('reuse_stats', 'TEXT'), ('profile_requested', 'BOOLEAN NOT NULL DEFAULT FALSE')]),
+    ('document_fingerprints', [('scope', 'VARCHAR(100)')]),
+    ('extracted_texts', [('shingles', 'BYTEA'), ('page_map', 'BYTEA')]),
+]
+
+# Columns no longer used, dropped when present
+DROPPED_COLUMNS = [
+    ('rendered_views', 'matches_html'),
+]
+
+# (table name, index name, column names) of indexes created when missing
+TABLE_INDEXES = [
+    ('documents', 'ix_documents_content_hash', ('content_hash',)),
+    ('documents', 'ix_documents_user_uploaded', ('user_id', 'uploaded_at', 'id')),
+    ('documents', 'ix_documents_batch_id', ('batch_id',)),
+    ('document_fingerprints', 'ix_document_fingerprints_scope_hash', ('scope', 'hash', 'document_id')),
+]
 
 def migrate_postgres_database():
-    """Add similarity_details column to documents table if it doesn't exist."""
+    """Add missing columns and indexes to existing tables."""
     with app.app_context():
 
 
@@ -60,21 +102,41 @@ def migrate_postgres_database():
             conn.autocommit = True
             cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_name = 'documents' AND column_name = 'similarity_details'
-            """)
-            column_exists = cursor.fetchone() is not None
+            for table_name, columns in TABLE_COLUMNS:
+                for column_name, column_type in columns:
+                    cursor.execute("""
+                        SELECT column_name
+                        FROM information_schema.columns
+                        WHERE table_name = %s AND column_name = %s
+                    """, (table_name, column_name))
+                    column_exists = cursor.fetchone() is not None
+
+                    if not column_exists:
+                        print(f"Adding {column_name} column to {table_name} table...")
+                        cursor.execute(
+                            sql.SQL("ALTER TABLE {} ADD COLUMN {} {}").format(
+                                sql.Identifier(table_name), sql.Identifier(column_name), sql.SQL(column_type)
+                            )
+                        )
+                        print("Column added successfully.")
+                    else:
+                        print(f"{column_name} column already exists.")
+
+            for table_name, column_name in DROPPED_COLUMNS:
+                cursor.execute(
+                    sql.SQL("ALTER TABLE IF EXISTS {} DROP COLUMN IF EXISTS {}").format(
+                        sql.Identifier(table_name), sql.Identifier(column_name)
+                    )
+                )
 
-            if not column_exists:
-                print("Adding similarity_details column to documents table...")
+            for table_name, index_name, column_names in TABLE_INDEXES:
                 cursor.execute(
-                    sql.SQL("ALTER TABLE documents ADD COLUMN similarity_details TEXT")
+                    sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} ({})").format(
+                        sql.Identifier(index_name),
+                        sql.Identifier(table_name),
+                        sql.SQL(', ').join(sql.Identifier(name) for name in column_names)
+                    )
                 )
-                print("Column added successfully.")
-            else:
-                print("similarity_details column already exists.")
 
             conn.close()
             print("Database migration completed successfully.")
@@ -83,5 +145,51 @@ def migrate_postgres_database():
             print(f"Error during database migration: {e}")
             return
 
+# Documents converted per commit while backfilling match tables
+BACKFILL_BATCH_SIZE = 100
+
+def backfill_similarity_matches():
+    """Move JSON similarity_details into the match tables. Works on any database."""
+    with app.app_context():
+        converted = 0
+        skipped = 0
+        last_id = 0
+        while True:
+            documents = Document.query.filter(Document.similarity_details.isnot(None), Document.id > last_id) \
+                .order_by(Document.id).limit(BACKFILL_BATCH_SIZE).all()
+            if not documents:
+                break
+
+            for document in documents:
+                last_id = document.id
+                try:
+                    details = json.loads(document.similarity_details)
+                except json.JSONDecodeError:
+                    print(f"Skipping document {document.id}: similarity_details is not valid JSON")
+                    skipped += 1
+                    continue
+                document.set_similarity_details(details)
+                converted += 1
+
+            db.session.commit()
+            print(f"Backfilled match tables for {converted} documents...")
+
+        print(f"Match table backfill completed: {converted} converted, {skipped} skipped.")
+
+def backfill_match_summaries():
+    """Fill top_match_name and match_count of documents whose matches are already in the tables."""
+    with app.app_context():
+        counts = db.session.query(SimilarityMatch.document_id, db.func.count(SimilarityMatch.id)) \
+            .join(Document, Document.id == SimilarityMatch.document_id) \
+            .filter(Document.match_count.is_(None)).group_by(SimilarityMatch.document_id).all()
+        for document_id, match_count in counts:
+            top_match = SimilarityMatch.query.filter_by(document_id=document_id).order_by(SimilarityMatch.rank).first()
+            Document.query.filter_by(id=document_id).update(
+                {'match_count': match_count, 'top_match_name': top_match.document_name}, synchronize_session=False)
+        db.session.commit()
+        print(f"Match summaries filled for {len(counts)} documents.")
+
 if __name__ == "__main__":
     migrate_postgres_database()
+    backfill_similarity_matches()
+    backfill_match_summaries()
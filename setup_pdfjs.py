@@ -22,75 +22,99 @@ PDFJS_DIR = os.path.join(STATIC_DIR, "pdfjs")
 # Custom highlight script
 HIGHLIGHT_SCRIPT = """/**
  * Custom PDF.js extension for PaperLit to highlight text in PDFs
+ *
+ * Blocks normally arrive with the pages and text items they cover (computed by the server
+ * when the PDF was extracted), so nothing is searched. The item range is checked against the
+ * page's text layer when the page renders; if it does not match, the block is looked up on
+ * that page only. Blocks without page coordinates (PDFs extracted before page maps existed)
+ * fall back to searching every page, with each page's text content fetched once.
  */
 
 // Store highlights
 let currentHighlights = [];
 let highlightColor = 'rgba(255, 255, 0, 0.3)';
 
-// Function to find text in PDF pages
+// Text content of each page, fetched at most once per document
+const pageTextCache = new Map();
+
+async function getPageTextItems(pdfDocument, pageNum) {
+  if (!pageTextCache.has(pageNum)) {
+    pageTextCache.set(pageNum, pdfDocument.getPage(pageNum)
+      .then(page => page.getTextContent())
+      .then(textContent => textContent.items.map(item => item.str || '')));
+  }
+  return pageTextCache.get(pageNum);
+}
+
+// Text without whitespace, since PDF.js and the server split lines and words differently
+function normalizeText(text) {
+  return text.replace(/\\s+/g, '');
+}
+
+// Function to find the items of one page that hold the given text
+function locateInItems(textItems, textToFind) {
+  const needle = normalizeText(textToFind);
+  if (!needle) {
+    return null;
+  }
+
+  let joined = '';
+  const owners = [];
+  for (let i = 0; i < textItems.length; i++) {
+    const itemText = normalizeText(textItems[i]);
+    joined += itemText;
+    for (let c = 0; c < itemText.length; c++) {
+      owners.push(i);
+    }
+  }
+
+  // A block can continue on the next page, so match its start, or failing that its end
+  const probe = needle.slice(0, 40);
+  let index = joined.indexOf(probe);
+  if (index !== -1) {
+    const last = Math.min(index + needle.length, joined.length) - 1;
+    return { startItem: owners[index], endItem: owners[last] };
+  }
+  const tail = needle.slice(-40);
+  index = joined.indexOf(tail);
+  if (index !== -1) {
+    const first = Math.max(0, index + tail.length - needle.length);
+    return { startItem: owners[first], endItem: owners[index + tail.length - 1] };
+  }
+  return null;
+}
+
+// Whether the items the server named still hold (part of) the block's text
+function itemsMatch(textItems, highlight) {
+  const itemsText = normalizeText(textItems.slice(highlight.startItem, highlight.endItem + 1).join(''));
+  const blockText = normalizeText(highlight.text || '');
+  if (!itemsText || !blockText) {
+    return false;
+  }
+  return blockText.includes(itemsText.slice(0, 16)) || itemsText.includes(blockText.slice(0, 16));
+}
+
+// Function to find text in PDF pages (blocks without page coordinates)
 async function findTextInPDF(PDFViewerApplication, textToFind) {
   const highlights = [];
   const pdfDocument = PDFViewerApplication.pdfDocument;
-  
+
   if (!pdfDocument) {
     console.error('PDF document not loaded');
     return highlights;
   }
-  
-  const numPages = pdfDocument.numPages;
-  
-  for (let pageNum = 1; pageNum <= numPages; pageNum++) {
+
+  for (let pageNum = 1; pageNum <= pdfDocument.numPages; pageNum++) {
     try {
-      const page = await pdfDocument.getPage(pageNum);
-      const textContent = await page.getTextContent();
-      const textItems = textContent.items;
-      
-      // Simple text search (can be improved for better accuracy)
-      const text = textItems.map(item => item.str).join(' ');
-      
-      let startIndex = 0;
-      let index;
-      
-      // Find all occurrences of the text
-      while ((index = text.indexOf(textToFind, startIndex)) !== -1) {
-        // Find the text item that contains this text
-        let charCount = 0;
-        let startItem = -1;
-        let endItem = -1;
-        
-        for (let i = 0; i < textItems.length; i++) {
-          const itemLength = textItems[i].str.length;
-          
-          if (charCount <= index && index < charCount + itemLength) {
-            startItem = i;
-          }
-          
-          if (charCount <= index + textToFind.length && 
-              index + textToFind.length <= charCount + itemLength) {
-            endItem = i;
-            break;
-          }
-          
-          charCount += itemLength + 1; // +1 for the space we added when joining
-        }
-        
-        if (startItem !== -1 && endItem !== -1) {
-          highlights.push({
-            pageNum,
-            startItem,
-            endItem,
-            text: textToFind
-          });
-        }
-        
-        startIndex = index + textToFind.length;
+      const location = locateInItems(await getPageTextItems(pdfDocument, pageNum), textToFind);
+      if (location) {
+        highlights.push({ pageNum, startItem: location.startItem, endItem: location.endItem, text: textToFind, verified: true });
       }
     } catch (error) {
       console.error(`Error processing page ${pageNum}:`, error);
     }
   }
-  
+
   return highlights;
 }
 
@@ -98,11 +122,16 @@ async function findTextInPDF(PDFViewerApplication, textToFind) {
 function highlightTextOnPages(PDFViewerApplication, highlights, color) {
   // Clear existing highlights first
   clearHighlights(PDFViewerApplication);
-  
+
   // Store the new highlights
   currentHighlights = highlights;
   highlightColor = color || 'rgba(255, 255, 0, 0.3)';
-  
+
+  // Jump to the first highlighted page; the others are applied as their pages render
+  if (highlights.length > 0 && PDFViewerApplication.page !== highlights[0].pageNum) {
+    PDFViewerApplication.page = highlights[0].pageNum;
+  }
+
   // Apply highlights to visible pages
   applyHighlightsToVisiblePages(PDFViewerApplication);
 }
@@ -110,18 +139,19 @@ function highlightTextOnPages(PDFViewerApplication, highlights, color) {
 // Function to apply highlights to currently visible pages
 function applyHighlightsToVisiblePages(PDFViewerApplication) {
   const pdfViewer = PDFViewerApplication.pdfViewer;
-  
+
   if (!pdfViewer) {
     console.error('PDF viewer not available');
     return;
   }
-  
+
   const visiblePages = pdfViewer._getVisiblePages().views;
-  
-  for (const pageView of visiblePages) {
-    const pageNumber = pageView.id;
+
+  for (const visible of visiblePages) {
+    const pageView = visible.view || visible;
+    const pageNumber = visible.id;
     const pageHighlights = currentHighlights.filter(h => h.pageNum === pageNumber);
-    
+
     if (pageHighlights.length > 0) {
       applyHighlightsToPage(pageView, pageHighlights);
     }
@@ -131,16 +161,28 @@ function applyHighlightsToVisiblePages(PDFViewerApplication) {
 // Function to apply highlights to a specific page
 function applyHighlightsToPage(pageView, highlights) {
   const textLayer = pageView.textLayer;
-  
+
   if (!textLayer || !textLayer.textContentItemsStr) {
     return; // Text layer not ready
   }
-  
+
   const textItems = textLayer.textContentItemsStr;
   const textDivs = textLayer.textDivs;
-  
+
   for (const highlight of highlights) {
-    // Simple approach: highlight all divs between start and end
+    if (!highlight.verified) {
+      // Server item numbers can drift from PDF.js's; re-locate on this page when they do
+      if (!itemsMatch(textItems, highlight)) {
+        const location = locateInItems(textItems, highlight.text || '');
+        if (!location) {
+          continue;
+        }
+        highlight.startItem = location.startItem;
+        highlight.endItem = location.endItem;
+      }
+      highlight.verified = true;
+    }
+
     for (let i = highlight.startItem; i <= highlight.endItem; i++) {
       if (i >= 0 && i < textDivs.length) {
         const div = textDivs[i];
@@ -153,22 +195,22 @@ function applyHighlightsToPage(pageView, highlights) {
 // Function to clear all highlights
 function clearHighlights(PDFViewerApplication) {
   const pdfViewer = PDFViewerApplication.pdfViewer;
-  
+
   if (!pdfViewer) {
     return;
   }
-  
+
   // Clear highlights from all pages
   for (let i = 0; i < pdfViewer._pages.length; i++) {
     const pageView = pdfViewer._pages[i];
-    
+
     if (pageView && pageView.textLayer && pageView.textLayer.textDivs) {
       for (const div of pageView.textLayer.textDivs) {
         div.style.backgroundColor = '';
       }
     }
   }
-  
+
   // Reset stored highlights
   currentHighlights = [];
 }
@@ -178,40 +220,55 @@ document.addEventListener('webviewerloaded', function() {
   // Wait for the PDF viewer to initialize
   window.PDFViewerApplication.initializedPromise.then(() => {
     const PDFViewerApplication = window.PDFViewerApplication;
-    
+
     // Notify the parent window that the PDF is loaded
     window.parent.postMessage({ type: 'PDF_LOADED' }, '*');
-    
+
     // Listen for messages from the parent window
     window.addEventListener('message', async function(event) {
       if (!event.data || !event.data.type) return;
-      
+
       switch (event.data.type) {
         case 'HIGHLIGHT_TEXT':
           if (event.data.blocks && Array.isArray(event.data.blocks)) {
             const highlights = [];
-            
-            // Process each block to find text in the PDF
+
             for (const block of event.data.blocks) {
-              if (block.text) {
+              if (block.spans && block.spans.length > 0) {
+                // Page and text items from the server's page map
+                for (const span of block.spans) {
+                  highlights.push({
+                    pageNum: span.page,
+                    startItem: span.start_item,
+                    endItem: span.end_item,
+                    text: block.text
+                  });
+                }
+              } else if (block.text) {
                 const blockHighlights = await findTextInPDF(PDFViewerApplication, block.text);
                 highlights.push(...blockHighlights);
               }
             }
-            
+
             // Apply the highlights
             highlightTextOnPages(PDFViewerApplication, highlights, event.data.color);
           }
           break;
-          
+
         case 'CLEAR_HIGHLIGHTS':
           clearHighlights(PDFViewerApplication);
           break;
       }
     });
-    
+
+    // Item numbers and text belong to one document; start over when another is opened
+    PDFViewerApplication.eventBus.on('documentloaded', function() {
+      pageTextCache.clear();
+      currentHighlights = [];
+    });
+
     // Add event listener for page rendering to reapply highlights
-    PDFViewerApplication.eventBus.on('pagerendered', function() {
+    PDFViewerApplication.eventBus.on('textlayerrendered', function() {
       if (currentHighlights.length > 0) {
         applyHighlightsToVisiblePages(PDFViewerApplication);
       }
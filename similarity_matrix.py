@@ -0,0 +1,200 @@
+"""
+All-pairs similarity report for a course (a set of users) or an institution.
+Each pair of their documents is compared once. Pairs sharing fewer than --min-shared
+winnowed fingerprints are left out unless --all-pairs is given, and missing pairs can be
+read as 0. Rows go to the output as they are computed: one CSV file, or a directory of
+Parquet part files (needs pyarrow). A checkpoint next to the output records the finished
+rows, so an interrupted run continues with --resume.
+Usage:
+    python similarity_matrix.py --user alice --user bob --output cohort.csv
+    python similarity_matrix.py --institution "Example University" --output matrix --format parquet [--resume]
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+
+import pandas as pd
+
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from src.app import app
+from src.services.all_pairs import select_documents, load_texts, candidate_pairs, identical_pairs, compare_rows
+from src.services.corpus_search import CORPUS_MAX_TERM_DOCUMENTS
+from src.services.fingerprint_index import CANDIDATE_MIN_SHARED
+from src.services.parallel_compare import PARALLEL_COMPARE_WORKERS
+
+COLUMNS = ['document_a', 'document_b', 'name_a', 'name_b', 'user_a', 'user_b', 'similarity',
+           'matched_chars', 'blocks', 'shared_fingerprints', 'method']
+
+
+class CsvOutput:
+    """One CSV file; on resume it is cut back to the size recorded by the checkpoint."""
+
+    def __init__(self, path: str, resume_state: dict = None):
+        self.path = path
+        if resume_state:
+            self.file = open(path, 'r+', encoding='utf-8', newline='')
+            self.file.truncate(resume_state['bytes'])
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file = open(path, 'w', encoding='utf-8', newline='')
+            pd.DataFrame(columns=COLUMNS).to_csv(self.file, index=False)
+            self.file.flush()
+
+    def state(self) -> dict:
+        return {'bytes': os.path.getsize(self.path)}
+
+    def write(self, frame: pd.DataFrame) -> dict:
+        frame.to_csv(self.file, header=False, index=False)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.state()
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetOutput:
+    """A directory of part-NNNNN.parquet files; parts written after the last checkpoint are dropped on resume."""
+
+    def __init__(self, path: str, resume_state: dict = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            sys.exit("Parquet output needs the 'pyarrow' module (pip install pyarrow).")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = resume_state['parts'] if resume_state else 0
+        for filename in os.listdir(path):
+            if filename.startswith('part-') and filename.endswith('.parquet') \
+                    and int(filename[5:10]) >= self.parts:
+                os.remove(os.path.join(path, filename))
+
+    def state(self) -> dict:
+        return {'parts': self.parts}
+
+    def write(self, frame: pd.DataFrame) -> dict:
+        frame.to_parquet(os.path.join(self.path, f"part-{self.parts:05d}.parquet"), index=False)
+        self.parts += 1
+        return self.state()
+
+    def close(self) -> None:
+        pass
+
+
+def settings_key(args, document_ids) -> str:
+    """Identifies a run, so --resume refuses a checkpoint written for different inputs."""
+    settings = [document_ids, args.min_shared, args.max_term_documents, args.all_pairs, args.format]
+    return hashlib.sha256(json.dumps(settings).encode()).hexdigest()
+
+
+def load_checkpoint(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, key: str, done: set, output_state: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'settings': key, 'done': sorted(done), 'output': output_state}, f)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the all-pairs similarity of a cohort's documents")
+    parser.add_argument('--user', action='append', default=[], help="Username to include (repeatable)")
+    parser.add_argument('--user-id', action='append', type=int, default=[], help="User id to include (repeatable)")
+    parser.add_argument('--institution', help="Include every user assigned to this institution")
+    parser.add_argument('--output', required=True, help="CSV file, or directory for Parquet parts")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--workers', type=int, default=PARALLEL_COMPARE_WORKERS, help="Comparison processes")
+    parser.add_argument('--min-shared', type=int, default=CANDIDATE_MIN_SHARED,
+                        help="Fingerprints a pair must share to be compared")
+    parser.add_argument('--max-term-documents', type=int, default=CORPUS_MAX_TERM_DOCUMENTS,
+                        help="Ignore fingerprints found in more documents than this when pairing")
+    parser.add_argument('--all-pairs', action='store_true', help="Compare every pair, without pruning")
+    parser.add_argument('--flush-rows', type=int, default=10000, help="Result rows per write and checkpoint")
+    parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint of an earlier run")
+    args = parser.parse_args()
+
+    if not (args.user or args.user_id or args.institution):
+        parser.error("give at least one --user, --user-id or --institution")
+
+    checkpoint_path = f"{args.output.rstrip(os.sep)}.checkpoint.json"
+    started = time.perf_counter()
+
+    with app.app_context():
+        documents = select_documents(args.user_id, args.user, args.institution)
+        document_ids = [document.id for document in documents]
+        key = settings_key(args, document_ids)
+
+        checkpoint = load_checkpoint(checkpoint_path)
+        if checkpoint and not args.resume:
+            sys.exit(f"{checkpoint_path} exists; pass --resume to continue that run or delete it to start over.")
+        if args.resume and checkpoint and checkpoint['settings'] != key:
+            sys.exit("The checkpoint was written for different documents or settings; delete it to start over.")
+        done = set(checkpoint['done']) if args.resume and checkpoint else set()
+
+        print(f"Loading the text of {len(documents)} documents")
+        texts = load_texts(documents)
+        info = {document.id: (document.document_name, document.user_id) for document in documents}
+
+        identical = identical_pairs(documents)
+        rows = candidate_pairs(documents, texts, args.min_shared, args.max_term_documents, args.all_pairs)
+        for a, others in identical.items():
+            same = set(others)
+            rows[a] = [(b, shared) for b, shared in rows.get(a, []) if b not in same]
+        rows = {a: rows[a] for a in sorted(rows) if a not in done}
+
+        total_pairs = len(documents) * (len(documents) - 1) // 2
+        candidate_count = sum(len(others) for others in rows.values()) + \
+            sum(len(others) for a, others in identical.items() if a not in done)
+        print(f"{candidate_count} of {total_pairs} pairs to compute in {len(rows)} rows"
+              + (f" ({len(done)} rows already done)" if done else ""))
+
+    output_class = CsvOutput if args.format == 'csv' else ParquetOutput
+    output = output_class(args.output, checkpoint['output'] if done else None)
+    save_checkpoint(checkpoint_path, key, done, output.state())
+
+    buffer = []
+    buffered_rows = []
+    written_pairs = 0
+
+    def flush():
+        nonlocal buffer, buffered_rows
+        if buffer:
+            frame = pd.DataFrame(buffer, columns=COLUMNS)
+            state = output.write(frame)
+            done.update(buffered_rows)
+            save_checkpoint(checkpoint_path, key, done, state)
+        buffer = []
+        buffered_rows = []
+
+    for a, results in compare_rows(rows, texts, args.workers):
+        for b in identical.get(a, []):
+            results.append({'document_a': a, 'document_b': b, 'similarity': 1.0, 'matched_chars': len(texts[a]),
+                            'blocks': 1, 'shared_fingerprints': None, 'method': 'identical'})
+        for result in results:
+            result['name_a'], result['user_a'] = info[result['document_a']]
+            result['name_b'], result['user_b'] = info[result['document_b']]
+        buffer.extend(results)
+        buffered_rows.append(a)
+        written_pairs += len(results)
+        if len(buffer) >= args.flush_rows:
+            flush()
+            print(f"{len(done)} rows done, {written_pairs} pairs, {time.perf_counter() - started:.0f}s")
+    flush()
+    output.close()
+
+    print(f"Wrote {written_pairs} pairs to {args.output} in {time.perf_counter() - started:.1f}s")
+    os.remove(checkpoint_path)
+
+
+if __name__ == "__main__":
+    main()
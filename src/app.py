@@ -1,6 +1,16 @@
 from flask import Flask, render_template, redirect, url_for, request, flash, session, send_file, current_app
-from src.models import db, User, Document
+from src.models import db, User, Document, SimilarityMatch
+from src.services.text_store import release_text
+from src.services.fingerprint_index import remove_document as remove_document_fingerprints
+from src.services.minhash import remove_signature
+from src.services.analysis_jobs import cancel_jobs, start_worker_threads
+from src.services.document_listing import list_documents
+from src.services.storage import resolve_path, release_file, display_filename
+from src.services.metrics import METRICS_TOKEN, render_metrics, stage_timer
+from src.services.profiling import install_request_profiling
+from src.services.rendered_view import get_rendered_view
 from werkzeug.security import generate_password_hash, check_password_hash
+import hmac
 import logging
 import os
 import time
@@ -12,6 +22,7 @@ load_dotenv()
 
 
 from src.blueprints.plagiarism import plagiarism_bp
+from src.blueprints.admin import admin_bp
 
 
 app = Flask(__name__, instance_relative_config=True)
@@ -28,7 +39,16 @@ app.config['UPLOAD_FOLDER'] = os.getenv('UPLOAD_FOLDER', os.path.join(project_ro
 
 db.init_app(app)
 
-logging.basicConfig(level=logging.DEBUG)
+# Level of the application's own log records; the structured events use LOG_EVENTS_LEVEL
+logging.basicConfig(level=getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO))
+
+@app.before_request
+def start_analysis_workers():
+    # In-process analysis workers; set ANALYSIS_WORKER_THREADS=0 when running worker.py instead
+    start_worker_threads(app)
+
+# Opt-in cProfile profiling of flagged or sampled requests (see services/profiling.py)
+install_request_profiling(app)
 
 @app.route('/home')
 def home():
@@ -41,12 +61,15 @@ def home():
 
     user_id = session['user_id']
     user = User.query.get(user_id)
-    documents = Document.query.filter_by(user_id=user_id).order_by(Document.uploaded_at.desc()).all()
+    documents, newer_cursor, older_cursor = list_documents(
+        user_id, before=request.args.get('before'), after=request.args.get('after'))
 
     return render_template('home.html',
                           username=session['user'],
                           user=user,
                           documents=documents,
+                          newer_cursor=newer_cursor,
+                          older_cursor=older_cursor,
                           edit_mode=edit_mode,
                           editing_document_id=editing_document_id,
                           editing_document_name=editing_document_name)
@@ -103,30 +126,6 @@ def logout():
     return redirect(url_for('login_register'))
 
 
-def get_document_file_path(document):
-    stored_path = document.file_path
-
-    if 'src/src' in stored_path:
-        stored_path = stored_path.replace('src/src', 'src')
-
-    filename_only = os.path.basename(stored_path)
-
-    possible_paths = [
-        stored_path,
-        os.path.join(project_root, 'uploads', filename_only),
-        os.path.join(project_root, 'src', 'uploads', filename_only),
-    ]
-
-    for path in possible_paths:
-        if os.path.exists(path):
-            return path
-
-    for root, _, files in os.walk(project_root):
-        if filename_only in files:
-            return os.path.join(root, filename_only)
-
-    return None
-
 @app.route('/download_document/<int:document_id>')
 def download_document(document_id):
     if 'user' not in session:
@@ -138,10 +137,10 @@ def download_document(document_id):
         flash('Document not found or access denied.', 'danger')
         return redirect(url_for('home'))
 
-    file_path = get_document_file_path(document)
+    file_path = resolve_path(document)
 
     if file_path:
-        return send_file(file_path, as_attachment=True)
+        return send_file(file_path, as_attachment=True, download_name=display_filename(document))
 
     flash("File not found on server.", "danger")
     current_app.logger.error(f"File not found for document ID: {document_id}, path: {document.file_path}")
@@ -161,28 +160,35 @@ def view_document(document_id):
         flash('Document not found or access denied.', 'danger')
         return redirect(url_for('home'))
 
-    file_path = get_document_file_path(document)
+    if document.analysis_status == 'failed':
+        flash('The originality check for this document failed. Upload the document again to retry.', 'danger')
+        return redirect(url_for('home'))
+
+    if document.originality_score is None:
+        flash('The originality check for this document is still running.', 'info')
+        return redirect(url_for('home'))
+
+    with stage_timer('view_document', 'resolve_file'):
+        file_path = resolve_path(document)
 
     if not file_path:
         flash("File not found on server.", "danger")
         return redirect(url_for('home'))
 
-    from src.utils.file_extract import extract_text_from_file
-    document_text = extract_text_from_file(file_path)
-
-    similarity_details = document.get_similarity_details()
+    with stage_timer('view_document', 'load_view'):
+        view = get_rendered_view(document, file_path)
 
     ext = os.path.splitext(file_path)[1].lower()
 
-    return render_template(
-        'view_document.html',
-        user=user,
-        document=document,
-        document_text=document_text,
-        similarity_details=similarity_details,
-        file_extension=ext,
-        file_path=file_path
-    )
+    with stage_timer('view_document', 'render'):
+        return render_template(
+            'view_document.html',
+            user=user,
+            document=document,
+            view=view,
+            file_extension=ext,
+            file_path=file_path
+        )
 
 @app.route('/serve_document/<int:document_id>')
 def serve_document(document_id):
@@ -193,7 +199,7 @@ def serve_document(document_id):
     if document.user_id != session['user_id']:
         return "Access denied", 403
 
-    file_path = get_document_file_path(document)
+    file_path = resolve_path(document)
 
     if not file_path:
         return "File not found", 404
@@ -215,14 +221,19 @@ def delete_document(document_id):
         return redirect(url_for('home'))
 
     try:
-        file_path = get_document_file_path(document)
-
-        if file_path and os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Deleted file: {file_path}")
-
+        file_key = document.file_path
+        content_hash = document.content_hash
+        held_hashes = cancel_jobs(document.id)
+        remove_document_fingerprints(document.id)
+        remove_signature(document.id)
+        document.set_similarity_details(None)
+        SimilarityMatch.query.filter_by(matched_document_id=document.id) \
+            .update({'matched_document_id': None}, synchronize_session=False)
         db.session.delete(document)
         db.session.commit()
+        release_file(file_key)
+        for stored_hash in [content_hash] + held_hashes:
+            release_text(stored_hash)
 
         flash('Document deleted successfully.', 'success')
     except Exception as e:
@@ -315,6 +326,18 @@ def edit_profile():
 
     return render_template('edit_profile.html', user=user)
 
+@app.route('/metrics')
+def metrics():
+    # Prometheus scrape endpoint for all web and worker processes
+    if METRICS_TOKEN:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f"Bearer {METRICS_TOKEN}".encode()):
+            return "Unauthorized", 401
+    elif request.remote_addr not in ('127.0.0.1', '::1'):
+        # Without a token, only a scraper on the same host is answered
+        return "Forbidden", 403
+    return current_app.response_class(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(500)
 def internal_error(error):
     logging.error(f"Server Error: {error}")
@@ -326,6 +349,7 @@ def not_found_error(error):
     return render_template('404.html'), 404
 
 app.register_blueprint(plagiarism_bp)
+app.register_blueprint(admin_bp)
 
 with app.app_context():
     db.create_all()
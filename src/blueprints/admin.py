@@ -0,0 +1,37 @@
+"""
+Blueprint for admin pages in Paperlit (stored request profiles).
+"""
+from flask import Blueprint, session, render_template, abort, current_app
+from src.services.profiling import is_profile_admin, PROFILING_ENABLED, PROFILE_HEADER, PROFILE_SAMPLE_RATE
+from src.models import db, RequestProfile
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+@admin_bp.before_request
+def require_admin():
+    # Not found rather than forbidden, so the pages are not advertised
+    if not is_profile_admin(session.get('user_id')):
+        abort(404)
+
+@admin_bp.route('/profiles')
+def list_profiles():
+    profiles = db.session.query(RequestProfile.id, RequestProfile.created_at, RequestProfile.kind,
+                                RequestProfile.endpoint, RequestProfile.method, RequestProfile.path,
+                                RequestProfile.username, RequestProfile.trigger, RequestProfile.status_code,
+                                RequestProfile.duration_ms) \
+        .order_by(RequestProfile.id.desc()).limit(100).all()
+    return render_template('admin_profiles.html', profiles=profiles, profiling_enabled=PROFILING_ENABLED,
+                           profile_header=PROFILE_HEADER, sample_rate=PROFILE_SAMPLE_RATE)
+
+@admin_bp.route('/profiles/<int:profile_id>')
+def view_profile(profile_id):
+    profile = db.session.get(RequestProfile, profile_id) or abort(404)
+    return render_template('admin_profile.html', profile=profile)
+
+@admin_bp.route('/profiles/<int:profile_id>/download')
+def download_profile(profile_id):
+    profile = db.session.get(RequestProfile, profile_id) or abort(404)
+    # The pstats file format, readable with pstats, snakeviz or gprof2dot
+    response = current_app.response_class(profile.stats, mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="paperlit-profile-{profile.id}.prof"'
+    return response
@@ -1,12 +1,18 @@
 """
 Blueprint for plagiarism/originality checking and document upload in Paperlit.
 """
-from flask import Blueprint, request, redirect, url_for, flash, session, render_template, current_app as app
-from werkzeug.utils import secure_filename
+from flask import Blueprint, request, redirect, url_for, flash, session, render_template, jsonify
 import os
-from src.utils.file_extract import extract_text_from_file
-from src.services.plagiarism_service import calculate_originality
-from src.models import db, Document
+from src.services.storage import save_upload, release_file
+from src.services.text_store import release_text
+from src.services.analysis_jobs import enqueue_analysis, get_document_progress
+from src.services.metrics import UPLOADS, stage_timer
+from src.services.profiling import is_request_profiled
+from src.services.bulk_upload import create_batch, get_batch_progress
+from src.services.match_pages import match_summaries, match_blocks
+from src.utils.http import json_response
+from src.utils.events import log_event
+from src.models import db, Document, BulkBatch
 
 plagiarism_bp = Blueprint('plagiarism', __name__)
 
@@ -38,90 +44,132 @@ def upload_document():
         # Remove the editing document name from session
         session.pop('editing_document_name', None)
 
-        # If editing, delete the old file if it exists
-        if existing_document.file_path:
-            # Try to find the old file
-            project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-            possible_paths = [
-                os.path.join(project_root, 'uploads', existing_document.file_path),
-                os.path.join(project_root, 'src', 'uploads', existing_document.file_path),
-                existing_document.file_path  # In case it's already a full path
-            ]
-
-            for path in possible_paths:
-                if os.path.exists(path):
-                    try:
-                        os.remove(path)
-                        print(f"Deleted old file: {path}")
-                    except Exception as e:
-                        print(f"Error deleting old file: {e}")
-                    break
-
-    filename = secure_filename(document_file.filename)
     user_id = session['user_id']
-    upload_folder = app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
-    save_path = os.path.join(upload_folder, filename)
-    document_file.save(save_path)
-
-    # Extract text and calculate originality
-    print(f"Extracting text from new document: {save_path}")
-    new_text = extract_text_from_file(save_path)
-
-    # Get previous documents from the same user
-    previous_docs = Document.query.filter(Document.user_id==user_id, Document.id != None).all()
-    print(f"Found {len(previous_docs)} previous documents for comparison")
-
-    # Extract text from previous documents
-    previous_texts = []
-    doc_names = []
-    for doc in previous_docs:
-        if doc.file_path:
-            # Try to find the file in the uploads directory
-            project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-            possible_paths = [
-                os.path.join(project_root, 'uploads', doc.file_path),
-                os.path.join(project_root, 'src', 'uploads', doc.file_path),
-                doc.file_path  # In case it's already a full path
-            ]
-
-            for path in possible_paths:
-                if os.path.exists(path):
-                    print(f"Found previous document at: {path}")
-                    text = extract_text_from_file(path)
-                    if text:
-                        previous_texts.append(text)
-                        doc_names.append(doc.document_name)
-                    break
-
-    print(f"Extracted text from {len(previous_texts)} previous documents")
-
-    # Calculate originality score and get similarity details
-    originality_score, similarity_details = calculate_originality(new_text, previous_texts, doc_names)
-
-    # Ensure originality score is between 0 and 1
-    originality_score = max(0.0, min(1.0, originality_score))
-
-    # If editing, update the existing document
-    if editing and existing_document:
-        existing_document.document_name = document_name
-        existing_document.file_path = filename
-        existing_document.originality_score = originality_score
-        existing_document.set_similarity_details(similarity_details)
-        db.session.commit()
-        flash(f'Document updated successfully! New originality score: {originality_score:.2%}', 'success')
-    else:
-        # Create a new document
-        new_document = Document(
-            user_id=user_id,
-            document_name=document_name,
-            file_path=filename,  # Store just the filename for consistency
-            originality_score=originality_score
-        )
-        # Store similarity details
-        new_document.set_similarity_details(similarity_details)
-        db.session.add(new_document)
-        db.session.commit()
-        flash(f'Document uploaded successfully! Originality score: {originality_score:.2%}', 'success')
+    # Identical content is stored once; the hash is computed while the file is written
+    with stage_timer('upload_document', 'store_file'):
+        stored = save_upload(document_file)
+    original_filename = os.path.basename(document_file.filename or '')[:255]
+
+    # The analysis itself runs in the background; the document stays pending until it finishes
+    with stage_timer('upload_document', 'save_document'):
+        if editing and existing_document:
+            previous_content_hash = existing_document.content_hash
+            previous_file_path = existing_document.file_path
+            existing_document.document_name = document_name
+            existing_document.file_path = stored.storage_key
+            existing_document.original_filename = original_filename
+            existing_document.originality_score = None
+            # The previous match rows stay until the re-analysis replaces them, which lets it
+            # update them incrementally
+            existing_document.top_match_name = None
+            existing_document.match_count = None
+            existing_document.content_hash = stored.content_hash
+            job = enqueue_analysis(existing_document, previous_content_hash, profile_requested=is_request_profiled())
+            # A job still queued from an earlier edit analyses this content instead, and holds
+            # the content it was queued from; the skipped version is nobody's any more
+            skipped_hash = previous_content_hash if job.previous_content_hash != previous_content_hash else None
+            db.session.commit()
+            release_file(previous_file_path)
+            if skipped_hash and skipped_hash != stored.content_hash:
+                release_text(skipped_hash)
+            UPLOADS.inc(kind='replace')
+            log_event('upload.replaced', document_id=existing_document.id, content_hash=stored.content_hash[:12])
+            flash('Document updated successfully! The originality check is running.', 'success')
+        else:
+            # Create a new document
+            new_document = Document(
+                user_id=user_id,
+                document_name=document_name,
+                file_path=stored.storage_key,
+                original_filename=original_filename,
+                content_hash=stored.content_hash
+            )
+            db.session.add(new_document)
+            db.session.flush()
+            enqueue_analysis(new_document, profile_requested=is_request_profiled())
+            db.session.commit()
+            UPLOADS.inc(kind='new')
+            log_event('upload.created', document_id=new_document.id, content_hash=stored.content_hash[:12])
+            flash('Document uploaded successfully! The originality check is running.', 'success')
 
     return redirect(url_for('home'))
+
+@plagiarism_bp.route('/document_status/<int:document_id>')
+def document_status(document_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    document = Document.query.get_or_404(document_id)
+    if document.user_id != session['user_id']:
+        return jsonify({'error': 'Access denied'}), 403
+
+    return jsonify(get_document_progress(document))
+
+@plagiarism_bp.route('/document_matches/<int:document_id>')
+def document_matches(document_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    document = Document.query.get_or_404(document_id)
+    if document.user_id != session['user_id']:
+        return jsonify({'error': 'Access denied'}), 403
+
+    return json_response(match_summaries(document, request.args.get('page', type=int),
+                                         request.args.get('per_page', type=int)))
+
+@plagiarism_bp.route('/document_matches/<int:document_id>/<int:rank>/blocks')
+def document_match_blocks(document_id, rank):
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    document = Document.query.get_or_404(document_id)
+    if document.user_id != session['user_id']:
+        return jsonify({'error': 'Access denied'}), 403
+
+    blocks = match_blocks(document, rank, request.args.get('page', type=int), request.args.get('per_page', type=int))
+    if blocks is None:
+        return jsonify({'error': 'Match not found'}), 404
+    return json_response(blocks)
+
+@plagiarism_bp.route('/upload_batch', methods=['POST'])
+def upload_batch():
+    if 'user' not in session or 'user_id' not in session:
+        flash('You need to log in first.', 'danger')
+        return redirect(url_for('login_register'))
+
+    # Any number of .txt/.pdf files and .zip archives of them; analysed together in the background
+    uploads = [upload for upload in request.files.getlist('document_files') if upload and upload.filename]
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if not uploads:
+        if wants_json:
+            return jsonify({'error': 'No files uploaded'}), 400
+        flash('Select at least one file or zip archive.', 'warning')
+        return redirect(url_for('home'))
+
+    batch, skipped = create_batch(session['user_id'], uploads)
+    if batch is None:
+        if wants_json:
+            return jsonify({'error': 'No supported files found', 'skipped_files': skipped}), 400
+        flash('No .txt or .pdf files were found in the upload.', 'warning')
+        return redirect(url_for('home'))
+
+    UPLOADS.inc(batch.total_files, kind='bulk')
+    if wants_json:
+        return jsonify({'batch_id': batch.id, 'total_files': batch.total_files, 'skipped_files': skipped,
+                        'status_url': url_for('plagiarism.batch_status', batch_id=batch.id)}), 202
+    message = f'{batch.total_files} documents uploaded. The originality check of the batch is running.'
+    if skipped:
+        message += f' {len(skipped)} files were skipped.'
+    flash(message, 'success')
+    return redirect(url_for('home'))
+
+@plagiarism_bp.route('/batch_status/<int:batch_id>')
+def batch_status(batch_id):
+    if 'user' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    batch = BulkBatch.query.get_or_404(batch_id)
+    if batch.user_id != session['user_id']:
+        return jsonify({'error': 'Access denied'}), 403
+
+    return jsonify(get_batch_progress(batch))
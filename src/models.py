@@ -16,11 +16,18 @@ class User(db.Model):
     bio = db.Column(db.Text, nullable=True)
     avatar_path = db.Column(db.String(255), nullable=True, default='images/avatar-placeholder.png')
     institution = db.Column(db.String(100), nullable=True)
+    # Corpus scope, set with `maintenance.py set-institution`; never set from a form
+    verified_institution = db.Column(db.String(100), nullable=True)
+    # Granted with `maintenance.py grant-admin`; never set from a form
+    is_admin = db.Column(db.Boolean, nullable=False, default=False)
 
     documents = db.relationship('Document', backref='user', lazy=True)
 
 class Document(db.Model):
     __tablename__ = 'documents'
+    __table_args__ = (
+        db.Index('ix_documents_user_uploaded', 'user_id', 'uploaded_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     document_name = db.Column(db.String(255), nullable=False)
@@ -28,17 +35,254 @@ class Document(db.Model):
     uploaded_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     originality_score = db.Column(db.Float, nullable=True)
     similarity_details = db.Column(db.Text, nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True, index=True)
+    fingerprint_count = db.Column(db.Integer, nullable=True)
+    analysis_status = db.Column(db.String(20), nullable=True, default='complete')
+
+    original_filename = db.Column(db.String(255), nullable=True)
+    # Content the stored match results were computed for
+    analyzed_content_hash = db.Column(db.String(64), nullable=True)
+
+    # Bulk upload this document arrived in, analysed by the batch instead of its own job
+    batch_id = db.Column(db.Integer, db.ForeignKey('bulk_batches.id', ondelete='SET NULL'), nullable=True, index=True)
+
+    # Packed MinHash signature of the text (see services/minhash.py)
+    minhash_signature = db.Column(db.LargeBinary, nullable=True)
+
+    # Summary of the match tables so the document list never loads them
+    top_match_name = db.Column(db.String(255), nullable=True)
+    match_count = db.Column(db.Integer, nullable=True)
 
     def set_similarity_details(self, details):
-        if details:
-            self.similarity_details = json.dumps(details)
-        else:
-            self.similarity_details = None
+        """Replace the stored match results of this document with those in details."""
+        match_ids = db.select(SimilarityMatch.id).where(SimilarityMatch.document_id == self.id)
+        MatchingBlock.query.filter(MatchingBlock.match_id.in_(match_ids)).delete(synchronize_session=False)
+        SimilarityMatch.query.filter_by(document_id=self.id).delete(synchronize_session=False)
+        self.similarity_details = None
+        # The cached page is rebuilt from the new results
+        RenderedView.query.filter_by(document_id=self.id).delete(synchronize_session=False)
+
+        similar_documents = (details or {}).get('similar_documents', [])
+        self.match_count = len(similar_documents) if details is not None else None
+        self.top_match_name = similar_documents[0].get('document_name') if similar_documents else None
+
+        matched_ids = [item['document_id'] for item in similar_documents if item.get('document_id')]
+        matched_hashes = dict(db.session.query(Document.id, Document.content_hash)
+                              .filter(Document.id.in_(matched_ids))) if matched_ids else {}
+
+        for rank, item in enumerate(similar_documents):
+            match = SimilarityMatch(
+                document_id=self.id,
+                matched_document_id=item.get('document_id'),
+                matched_content_hash=matched_hashes.get(item.get('document_id')),
+                rank=rank,
+                document_name=item.get('document_name', ''),
+                document_type=item.get('document_type'),
+                source=item.get('source'),
+                similarity_score=item.get('similarity_score', 0.0),
+                near_duplicate=bool(item.get('near_duplicate')),
+            )
+            match.blocks = [
+                MatchingBlock(position=position, a_start=block.get('a_start', 0), a_end=block.get('a_end', 0),
+                              b_start=block.get('b_start', 0), b_end=block.get('b_end', 0),
+                              size=block.get('size', 0), text=block.get('text', ''))
+                for position, block in enumerate(item.get('matching_blocks', []))
+            ]
+            db.session.add(match)
 
     def get_similarity_details(self):
+        """Match results in the dict layout produced by calculate_originality."""
         if self.similarity_details:
+            # Not yet migrated to the match tables
             try:
                 return json.loads(self.similarity_details)
             except json.JSONDecodeError:
                 return {}
-        return {}
+
+        matches = SimilarityMatch.query.filter_by(document_id=self.id) \
+            .options(db.selectinload(SimilarityMatch.blocks)).order_by(SimilarityMatch.rank).all()
+        if not matches and self.originality_score is None:
+            return {}
+
+        similar_documents = [match.to_dict() for match in matches]
+        details = {
+            'overall_originality': self.originality_score if self.originality_score is not None else 1.0,
+            'max_similarity': max((item['similarity_score'] for item in similar_documents), default=0.0),
+            'similar_documents': similar_documents,
+        }
+        ai_sources = [match.source for match in matches if match.source]
+        if ai_sources:
+            details['ai_detected_similarities'] = len(ai_sources)
+            details['ai_similarity_sources'] = ai_sources
+        return details
+
+class SimilarityMatch(db.Model):
+    __tablename__ = 'similarity_matches'
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    matched_document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='SET NULL'), nullable=True, index=True)
+    rank = db.Column(db.Integer, nullable=False, default=0)
+    document_name = db.Column(db.String(255), nullable=False)
+    document_type = db.Column(db.String(50), nullable=True)
+    source = db.Column(db.String(100), nullable=True)
+    similarity_score = db.Column(db.Float, nullable=False, index=True)
+    # Content of the matched document when it was compared, so the result can be reused
+    matched_content_hash = db.Column(db.String(64), nullable=True)
+    # Score is a MinHash estimate and no blocks were matched
+    near_duplicate = db.Column(db.Boolean, nullable=False, default=False)
+
+    blocks = db.relationship('MatchingBlock', lazy=True, order_by='MatchingBlock.position')
+
+    def to_dict(self):
+        item = {
+            'document_name': self.document_name,
+            'document_type': self.document_type,
+            'similarity_score': self.similarity_score,
+            'matching_blocks': [block.to_dict() for block in self.blocks],
+        }
+        if self.matched_document_id is not None:
+            item['document_id'] = self.matched_document_id
+        if self.source:
+            item['source'] = self.source
+        if self.near_duplicate:
+            item['near_duplicate'] = True
+        return item
+
+class MatchingBlock(db.Model):
+    __tablename__ = 'matching_blocks'
+    id = db.Column(db.Integer, primary_key=True)
+    match_id = db.Column(db.Integer, db.ForeignKey('similarity_matches.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False, default=0)
+    a_start = db.Column(db.Integer, nullable=False)
+    a_end = db.Column(db.Integer, nullable=False)
+    b_start = db.Column(db.Integer, nullable=False)
+    b_end = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    text = db.Column(db.Text, nullable=False, default='')
+
+    def to_dict(self):
+        return {
+            'a_start': self.a_start,
+            'a_end': self.a_end,
+            'b_start': self.b_start,
+            'b_end': self.b_end,
+            'size': self.size,
+            'text': self.text,
+        }
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+    storage_key = db.Column(db.String(255), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False, index=True)
+    size = db.Column(db.BigInteger, nullable=False, default=0)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class ExtractedText(db.Model):
+    __tablename__ = 'extracted_texts'
+    content_hash = db.Column(db.String(64), primary_key=True)
+    extractor_version = db.Column(db.String(20), nullable=False)
+    text = db.Column(db.Text, nullable=False, default='')
+    char_count = db.Column(db.Integer, nullable=False, default=0)
+    # Packed word shingle hashes for SIMILARITY_ENGINE=shingles, filled on first use
+    shingles = db.Column(db.LargeBinary, nullable=True)
+    # Packed (offset, page, text item) entries of a PDF (see file_extract.pack_page_map)
+    page_map = db.Column(db.LargeBinary, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class RenderedView(db.Model):
+    __tablename__ = 'rendered_views'
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), primary_key=True)
+    # Text and renderer the view was built from; a mismatch means it is rebuilt
+    content_hash = db.Column(db.String(64), nullable=True)
+    render_version = db.Column(db.String(20), nullable=False)
+    # Escaped document text with highlight spans (empty for PDFs, which are highlighted in the viewer)
+    text_html = db.Column(db.Text, nullable=False, default='')
+    match_count = db.Column(db.Integer, nullable=False, default=0)
+    ai_detected_similarities = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+class DocumentFingerprint(db.Model):
+    __tablename__ = 'document_fingerprints'
+    __table_args__ = (
+        db.Index('ix_document_fingerprints_scope_hash', 'scope', 'hash', 'document_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    hash = db.Column(db.BigInteger, nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    # Normalized institution of the document's owner, for corpus-wide search
+    scope = db.Column(db.String(100), nullable=True)
+
+class MinHashBand(db.Model):
+    __tablename__ = 'minhash_bands'
+    __table_args__ = (
+        db.Index('ix_minhash_bands_band_bucket', 'band', 'bucket'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    band = db.Column(db.SmallInteger, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+class CorpusTerm(db.Model):
+    __tablename__ = 'corpus_terms'
+    scope = db.Column(db.String(100), primary_key=True)
+    hash = db.Column(db.BigInteger, primary_key=True)
+    doc_count = db.Column(db.Integer, nullable=False, default=0)
+
+class AnalysisJob(db.Model):
+    __tablename__ = 'analysis_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('documents.id', ondelete='CASCADE'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    stage = db.Column(db.String(50), nullable=True)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    previous_content_hash = db.Column(db.String(64), nullable=True)
+    worker_id = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    reuse_stats = db.Column(db.Text, nullable=True)
+    # Profile the analysis too (set when the upload request was profiled)
+    profile_requested = db.Column(db.Boolean, nullable=False, default=False)
+
+class BulkBatch(db.Model):
+    __tablename__ = 'bulk_batches'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    stage = db.Column(db.String(50), nullable=True)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    total_files = db.Column(db.Integer, nullable=False, default=0)
+    processed_files = db.Column(db.Integer, nullable=False, default=0)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    worker_id = db.Column(db.String(100), nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # JSON: files skipped at upload, then the batch report once it finishes
+    summary = db.Column(db.Text, nullable=True)
+
+class RequestProfile(db.Model):
+    __tablename__ = 'request_profiles'
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp(), index=True)
+    # 'request' or 'analysis_job'
+    kind = db.Column(db.String(20), nullable=False, default='request')
+    endpoint = db.Column(db.String(100), nullable=True)
+    method = db.Column(db.String(10), nullable=True)
+    path = db.Column(db.String(500), nullable=True)
+    user_id = db.Column(db.Integer, nullable=True)
+    username = db.Column(db.String(50), nullable=True)
+    # 'flag' (admin header or query parameter), 'sampled' or 'upload' (job of a profiled upload)
+    trigger = db.Column(db.String(20), nullable=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    duration_ms = db.Column(db.Float, nullable=False)
+    # Top functions by cumulative time, and the marshalled pstats data for download
+    summary = db.Column(db.Text, nullable=False)
+    stats = db.Column(db.LargeBinary, nullable=False)
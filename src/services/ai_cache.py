@@ -0,0 +1,141 @@
+"""
+Persistent cache of AI similarity results.
+Results are stored per text chunk under a hash of the exact chunk (their offsets refer to
+it) in a SQLite file, so every Flask worker process on the host shares them. Entries expire after
+AI_CACHE_TTL_SECONDS and the least recently used ones are evicted once the stored
+payloads exceed AI_CACHE_MAX_BYTES.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+AI_CACHE_ENABLED = os.getenv('AI_CACHE_ENABLED', 'true').lower() == 'true'
+AI_CACHE_PATH = os.getenv('AI_CACHE_PATH', os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..', 'instance', 'ai_cache.sqlite3')))
+AI_CACHE_TTL_SECONDS = int(os.getenv('AI_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+AI_CACHE_MAX_BYTES = int(os.getenv('AI_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+def text_key(text: str) -> str:
+    """Cache key of a text: SHA-256 of the text as sent, since cached offsets refer to it."""
+    # The prefix keeps keys of whitespace-normalized texts, used before, from matching
+    return hashlib.sha256(b'raw\0' + text.encode('utf-8')).hexdigest()
+
+
+class AIResultCache:
+    def __init__(self, path: str = AI_CACHE_PATH, ttl_seconds: int = AI_CACHE_TTL_SECONDS,
+                 max_bytes: int = AI_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_results (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_results_accessed_at ON ai_results (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS ai_cache_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO ai_cache_stats (name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """A connection that commits (or rolls back) and is closed at the end of the block."""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn: sqlite3.Connection, name: str, amount: int = 1) -> None:
+        conn.execute("UPDATE ai_cache_stats SET value = value + ? WHERE name = ?", (amount, name))
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload, created_at FROM ai_results WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM ai_results WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self._count(conn, 'misses')
+                with self._lock:
+                    self.misses += 1
+                return None
+
+            conn.execute("UPDATE ai_results SET accessed_at = ? WHERE key = ?", (now, key))
+            self._count(conn, 'hits')
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, results: List[Dict[str, Any]]) -> None:
+        payload = json.dumps(results)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_results (key, payload, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now)
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DELETE FROM ai_results WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ai_results").fetchone()[0]
+        evicted = 0
+        while total > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM ai_results ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM ai_results WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        if evicted:
+            self._count(conn, 'evictions', evicted)
+
+    def stats(self) -> dict:
+        """Hit/miss counters of this process and of all processes sharing the cache file."""
+        with self._connect() as conn:
+            shared = dict(conn.execute("SELECT name, value FROM ai_cache_stats").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM ai_results").fetchone()
+        with self._lock:
+            local = {'hits': self.hits, 'misses': self.misses}
+        return {'process': local, 'shared': shared, 'entries': entries, 'bytes': size}
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM ai_results")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_ai_cache() -> Optional[AIResultCache]:
+    """Process-wide cache instance, or None when caching is disabled."""
+    global _cache
+    if not AI_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = AIResultCache()
+        return _cache
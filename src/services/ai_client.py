@@ -0,0 +1,247 @@
+"""
+HTTP client for the AI similarity endpoint.
+Uses one pooled requests.Session with connect/read timeouts and bounded retries with
+backoff, splits long texts into chunks that are submitted concurrently, and stops calling
+the endpoint for a while (circuit breaker) after repeated failures so callers fall back
+to the local path instead of blocking an upload worker. Chunk results are kept in the
+shared result cache (ai_cache.py), so only new or changed chunks are sent.
+"""
+import os
+import time
+import zlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from src.services.ai_cache import AIResultCache, get_ai_cache, text_key
+from src.services.metrics import AI_CHUNKS, AI_REQUESTS, stage_timer
+from src.utils.events import log_event
+
+AI_CONNECT_TIMEOUT = float(os.getenv('AI_CONNECT_TIMEOUT', '3'))
+AI_READ_TIMEOUT = float(os.getenv('AI_READ_TIMEOUT', '20'))
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', '2'))
+AI_BACKOFF_FACTOR = float(os.getenv('AI_BACKOFF_FACTOR', '0.5'))
+AI_POOL_SIZE = int(os.getenv('AI_POOL_SIZE', '10'))
+AI_CHUNK_SIZE = int(os.getenv('AI_CHUNK_SIZE', '8000'))
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '4'))
+AI_BREAKER_THRESHOLD = int(os.getenv('AI_BREAKER_THRESHOLD', '5'))
+AI_BREAKER_RESET_SECONDS = float(os.getenv('AI_BREAKER_RESET_SECONDS', '60'))
+
+# About one line in this many can end a chunk once it is half full
+AI_CHUNK_BOUNDARY_DIVISOR = 8
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures. After `reset_seconds` it is half-open and
+    lets a single trial call through; other callers are refused until the trial succeeds
+    (closing it) or fails (opening it again). A trial that never reports back is given up
+    after another `reset_seconds`.
+    """
+
+    def __init__(self, threshold: int = AI_BREAKER_THRESHOLD, reset_seconds: float = AI_BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_started_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                return 'half-open'
+            return 'open'
+
+    def acquire(self) -> Optional[str]:
+        """'closed' for a normal call, 'trial' for the one call of the half-open state, or None to refuse."""
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_seconds:
+                return None
+            if self.trial_started_at is not None and now - self.trial_started_at < self.reset_seconds:
+                return None
+            self.trial_started_at = now
+            return 'trial'
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_started_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold or self.trial_started_at is not None:
+                self.opened_at = time.monotonic()
+            self.trial_started_at = None
+
+
+def _split_long_unit(unit: str, chunk_size: int) -> List[str]:
+    pieces = []
+    while len(unit) > chunk_size:
+        split_at = unit.rfind(' ', chunk_size // 2, chunk_size)
+        end = split_at + 1 if split_at != -1 else chunk_size
+        pieces.append(unit[:end])
+        unit = unit[end:]
+    if unit:
+        pieces.append(unit)
+    return pieces
+
+
+def split_text(text: str, chunk_size: int = AI_CHUNK_SIZE) -> List[Tuple[int, str]]:
+    """
+    Split text into (offset, chunk) pairs of at most chunk_size characters.
+    Chunks end on line breaks chosen from the content of the line itself, so an edit only
+    changes the chunks around it and the others keep their cache keys.
+    """
+    if len(text) <= chunk_size:
+        return [(0, text)]
+
+    units = []
+    for line in text.splitlines(keepends=True):
+        units.extend(_split_long_unit(line, chunk_size))
+
+    chunks = []
+    start = 0
+    current = 0
+    for index, unit in enumerate(units):
+        current += len(unit)
+        next_length = len(units[index + 1]) if index + 1 < len(units) else 0
+        at_boundary = current >= chunk_size // 2 and zlib.crc32(unit.encode('utf-8')) % AI_CHUNK_BOUNDARY_DIVISOR == 0
+        if at_boundary or current + next_length > chunk_size or index == len(units) - 1:
+            chunks.append((start, text[start:start + current]))
+            start += current
+            current = 0
+    return chunks
+
+
+def merge_chunk_results(chunk_results: List[Tuple[int, int, List[Dict[str, Any]]]], total_length: int) -> List[Dict[str, Any]]:
+    """
+    Combine per-chunk results into one result per source. Block offsets are shifted to the
+    full text, and scores are weighted by chunk length over the whole text.
+    """
+    merged = {}
+    for offset, length, results in chunk_results:
+        for result in results:
+            key = (result.get('document_name'), result.get('source'))
+            entry = merged.get(key)
+            if entry is None:
+                entry = merged[key] = dict(result, similarity_score=0.0, matching_blocks=[])
+            entry['similarity_score'] += result.get('similarity_score', 0.0) * length / max(1, total_length)
+            for block in result.get('matching_blocks', []):
+                shifted = dict(block)
+                for field in ('a_start', 'a_end'):
+                    if field in shifted:
+                        shifted[field] += offset
+                entry['matching_blocks'].append(shifted)
+
+    return sorted(merged.values(), key=lambda item: item['similarity_score'], reverse=True)
+
+
+class AISimilarityClient:
+    def __init__(self, endpoint: str, api_key: str, chunk_size: int = AI_CHUNK_SIZE,
+                 max_concurrency: int = AI_MAX_CONCURRENCY, breaker: Optional[CircuitBreaker] = None,
+                 cache: Optional[AIResultCache] = None):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.chunk_size = chunk_size
+        self.timeout = (AI_CONNECT_TIMEOUT, AI_READ_TIMEOUT)
+        self.breaker = breaker or CircuitBreaker()
+        self.cache = cache
+
+        retry = Retry(
+            total=AI_MAX_RETRIES,
+            backoff_factor=AI_BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=AI_POOL_SIZE, pool_maxsize=AI_POOL_SIZE, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='ai-similarity')
+
+    def _post_chunk(self, chunk: str) -> List[Dict[str, Any]]:
+        response = self.session.post(self.endpoint, json={"text": chunk}, timeout=self.timeout)
+        if response.status_code != 200:
+            raise requests.HTTPError(f"API error: {response.status_code} - {response.text[:200]}")
+        return response.json().get("results", [])
+
+    def check(self, text: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return the merged results for text, or None when the endpoint is unavailable.
+        Chunks found in the cache are not sent again.
+        """
+        chunks = split_text(text, self.chunk_size)
+        with stage_timer('check_ai_similarity', 'cache_lookup'):
+            keys = [text_key(chunk) for _, chunk in chunks] if self.cache else [None] * len(chunks)
+            cached = [self.cache.get(key) if key else None for key in keys]
+
+        missing = [index for index, results in enumerate(cached) if results is None]
+        permit = self.breaker.acquire() if missing else 'closed'
+        if permit is None:
+            AI_REQUESTS.inc(outcome='circuit_open')
+            log_event('ai.circuit_open', logging.WARNING, chunks=len(chunks))
+            return None
+
+        try:
+            with stage_timer('check_ai_similarity', 'request'):
+                if permit == 'trial':
+                    # Half-open: one chunk probes the endpoint before the rest are sent
+                    cached[missing[0]] = self._post_chunk(chunks[missing[0]][1])
+                    self.breaker.record_success()
+                    log_event('ai.circuit_closed', chunks=len(chunks))
+                futures = {index: self.executor.submit(self._post_chunk, chunks[index][1])
+                           for index in missing if cached[index] is None}
+                try:
+                    for index, future in futures.items():
+                        cached[index] = future.result()
+                except Exception:
+                    for future in futures.values():
+                        future.cancel()
+                    raise
+        except Exception as e:
+            self.breaker.record_failure()
+            AI_REQUESTS.inc(outcome='error')
+            log_event('ai.request_failed', logging.ERROR, chunks=len(missing), error=str(e))
+            return None
+
+        AI_REQUESTS.inc(outcome='ok')
+        AI_CHUNKS.inc(len(missing), source='sent')
+        AI_CHUNKS.inc(len(chunks) - len(missing), source='cache')
+        if missing:
+            self.breaker.record_success()
+            log_event('ai.chunks_sent', sent=len(missing), chunks=len(chunks), cached=len(chunks) - len(missing))
+        if self.cache:
+            for index in missing:
+                self.cache.set(keys[index], cached[index])
+
+        chunk_results = [(offset, len(chunk), results) for (offset, chunk), results in zip(chunks, cached)]
+        return merge_chunk_results(chunk_results, len(text))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_ai_client(endpoint: str, api_key: str) -> AISimilarityClient:
+    """Process-wide client so connections and the breaker state are shared."""
+    global _client
+    with _client_lock:
+        if _client is None or _client.endpoint != endpoint or _client.api_key != api_key:
+            _client = AISimilarityClient(endpoint, api_key, cache=get_ai_cache())
+        return _client
@@ -0,0 +1,159 @@
+"""
+All-pairs similarity of a set of documents (similarity_matrix.py).
+Each unordered pair is compared once. Pairs are pruned to those sharing at least
+min_shared winnowed fingerprints, using the stored fingerprint index. Fingerprints that
+occur in more than max_term_documents documents are treated as boilerplate and do not pair
+documents up. Documents with identical content score 1.0 without being compared. The rest
+are compared row by row (one document against all its later candidates) on a process pool,
+and rows are yielded as they finish, so the caller can stream them out.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from src.models import db, Document, DocumentFingerprint, User
+from src.services.comparison import PreparedText, compare_texts
+from src.services.corpus_search import CORPUS_MAX_TERM_DOCUMENTS
+from src.services.fingerprint_index import (fingerprint_text, institution_scope, CANDIDATE_MIN_SHARED,
+                                            QUERY_BATCH_SIZE)
+from src.services.parallel_compare import PARALLEL_COMPARE_START_METHOD
+from src.services.storage import resolve_path
+from src.services.text_store import get_document_text
+
+# (other document id, shared fingerprints)
+Candidate = Tuple[int, int]
+
+
+def select_documents(user_ids: Optional[List[int]] = None, usernames: Optional[List[str]] = None,
+                     institution: Optional[str] = None) -> List[Document]:
+    """Documents of the given users, or of all users at an institution, by id."""
+    ids = set(user_ids or [])
+    if usernames:
+        ids.update(user_id for (user_id,) in db.session.query(User.id).filter(User.username.in_(usernames)))
+    if institution:
+        scope = institution_scope(institution)
+        ids.update(user_id for user_id, name in db.session.query(User.id, User.verified_institution)
+                   .filter(User.verified_institution.isnot(None)) if institution_scope(name) == scope)
+    if not ids:
+        return []
+    return Document.query.filter(Document.user_id.in_(ids)).order_by(Document.id).all()
+
+
+def load_texts(documents: List[Document]) -> Dict[int, str]:
+    """Stored text of every document; only documents missing from the text store are extracted."""
+    texts = {}
+    for document in documents:
+        file_path = None if document.content_hash else resolve_path(document)
+        texts[document.id] = get_document_text(document, file_path)
+    return texts
+
+
+def _fingerprint_postings(documents: List[Document], texts: Dict[int, str]) -> Dict[int, Set[int]]:
+    """Distinct fingerprint hash -> ids of the documents containing it."""
+    postings = {}
+    indexed = [document.id for document in documents if document.fingerprint_count is not None]
+    for start in range(0, len(indexed), QUERY_BATCH_SIZE):
+        batch = indexed[start:start + QUERY_BATCH_SIZE]
+        rows = db.session.query(DocumentFingerprint.hash, DocumentFingerprint.document_id) \
+            .filter(DocumentFingerprint.document_id.in_(batch)).distinct()
+        for h, document_id in rows:
+            postings.setdefault(h, set()).add(document_id)
+    # Documents that predate the fingerprint index are fingerprinted here
+    for document in documents:
+        if document.fingerprint_count is None:
+            for h, _ in fingerprint_text(texts.get(document.id, '')):
+                postings.setdefault(h, set()).add(document.id)
+    return postings
+
+
+def candidate_pairs(documents: List[Document], texts: Dict[int, str], min_shared: int = CANDIDATE_MIN_SHARED,
+                    max_term_documents: int = CORPUS_MAX_TERM_DOCUMENTS,
+                    all_pairs: bool = False) -> Dict[int, List[Candidate]]:
+    """
+    Pairs worth comparing as {document id: [(later document id, shared fingerprints)]}.
+    With all_pairs every pair is returned (shared counts are then 0).
+    """
+    ids = [document.id for document in documents]
+    if all_pairs:
+        return {a: [(b, 0) for b in ids[index + 1:]] for index, a in enumerate(ids)}
+
+    shared = {}
+    for document_ids in _fingerprint_postings(documents, texts).values():
+        if len(document_ids) < 2 or len(document_ids) > max_term_documents:
+            continue
+        members = sorted(document_ids)
+        for index, a in enumerate(members):
+            for b in members[index + 1:]:
+                shared[(a, b)] = shared.get((a, b), 0) + 1
+
+    rows = {}
+    for (a, b), count in shared.items():
+        if count >= min_shared:
+            rows.setdefault(a, []).append((b, count))
+    for candidates in rows.values():
+        candidates.sort()
+    return rows
+
+
+def identical_pairs(documents: List[Document]) -> Dict[int, List[int]]:
+    """{document id: [later document ids with the same content]}."""
+    by_hash = {}
+    for document in documents:
+        if document.content_hash:
+            by_hash.setdefault(document.content_hash, []).append(document.id)
+    rows = {}
+    for group in by_hash.values():
+        for index, a in enumerate(group):
+            if group[index + 1:]:
+                rows[a] = group[index + 1:]
+    return rows
+
+
+def compare_row(document_id: int, text: str, others: List[Tuple[int, str, int]]) -> Tuple[int, List[dict]]:
+    """Compare one document with (other id, other text, shared fingerprints) tuples."""
+    results = []
+    prepared = PreparedText(text)
+    for other_id, other_text, shared in others:
+        similarity, blocks = compare_texts(prepared, other_text)
+        results.append({
+            'document_a': document_id,
+            'document_b': other_id,
+            'similarity': similarity,
+            'matched_chars': sum(block['size'] for block in blocks),
+            'blocks': len(blocks),
+            'shared_fingerprints': shared,
+            'method': 'compared',
+        })
+    return document_id, results
+
+
+def compare_rows(rows: Dict[int, List[Candidate]], texts: Dict[int, str], workers: int = 1,
+                 max_pending: Optional[int] = None) -> Iterator[Tuple[int, List[dict]]]:
+    """
+    Yield (document id, result rows) for every row of candidate pairs, in completion order.
+    With several workers, at most max_pending rows are queued on the pool at a time, so
+    the texts sent to it stay bounded.
+    """
+    def task(a):
+        return a, texts.get(a, ''), [(b, texts.get(b, ''), shared) for b, shared in rows[a]]
+
+    if workers <= 1:
+        for a in rows:
+            yield compare_row(*task(a))
+        return
+
+    max_pending = max_pending or workers * 4
+    context = multiprocessing.get_context(PARALLEL_COMPARE_START_METHOD)
+    pending = set()
+    order = iter(rows)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for a in order:
+            pending.add(pool.submit(compare_row, *task(a)))
+            if len(pending) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    yield future.result()
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield future.result()
@@ -0,0 +1,558 @@
+"""
+Background originality analysis for Paperlit.
+Uploads only persist the file and a pending Document; the analysis runs in worker
+threads or a separate worker process (worker.py). The analysis_jobs table is the queue,
+so queued jobs, and running jobs whose worker stopped sending heartbeats, are picked up
+again after a restart. A running job's heartbeat is refreshed on a timer (Heartbeat), and
+every write of a job is conditional on its worker still owning it, so a reclaimed job's
+results are only ever saved by the worker that took it over.
+"""
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Set
+
+from src.models import db, Document, AnalysisJob, BulkBatch, SimilarityMatch, ExtractedText
+from src.services.plagiarism_service import calculate_originality
+from src.services.text_store import store_file_text, get_document_text, release_text
+from src.services.fingerprint_index import fingerprint_text, index_document, find_candidates, document_scope
+from src.services.corpus_search import search_corpus, CORPUS_SEARCH_ENABLED
+from src.services.storage import resolve_path
+from src.services.incremental import incremental_results
+from src.services.minhash import MINHASH_ENABLED, compute_signature, find_near_duplicates, index_signature
+from src.services.shingle_engine import use_shingle_engine, load_shingle_arrays
+from src.services.metrics import ANALYSIS_JOBS, stage_timer, flush_metrics
+from src.services.profiling import profiled, job_trigger
+from src.services.rendered_view import build_rendered_view
+from src.utils.events import log_event
+
+ANALYSIS_WORKER_THREADS = int(os.getenv('ANALYSIS_WORKER_THREADS', '1'))
+ANALYSIS_POLL_INTERVAL = float(os.getenv('ANALYSIS_POLL_INTERVAL', '2'))
+ANALYSIS_JOB_STALE_SECONDS = int(os.getenv('ANALYSIS_JOB_STALE_SECONDS', '300'))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv('ANALYSIS_MAX_ATTEMPTS', '3'))
+ANALYSIS_HEARTBEAT_SECONDS = float(os.getenv('ANALYSIS_HEARTBEAT_SECONDS', '30'))
+
+# Minimum seconds between progress writes while comparing
+PROGRESS_WRITE_INTERVAL = 1.0
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class JobLost(Exception):
+    """The job (or bulk batch) was reclaimed by another worker while this one was running it."""
+
+
+def enqueue_analysis(document: Document, previous_content_hash: Optional[str] = None,
+                     profile_requested: bool = False) -> AnalysisJob:
+    """
+    Queue an analysis of the document. The caller commits.
+    A job of the document that has not started yet is returned instead of a new one, as it
+    analyses the current content too; it keeps its own previous_content_hash.
+    """
+    document.analysis_status = 'pending'
+    queued_id = db.session.query(AnalysisJob.id).filter(AnalysisJob.document_id == document.id,
+                                                       AnalysisJob.status == 'queued') \
+        .order_by(AnalysisJob.id).limit(1).scalar()
+    if queued_id is not None:
+        values = {'stage': 'queued'}
+        if profile_requested:
+            values['profile_requested'] = True
+        # Conditional, so a job claimed in the meantime is not mistaken for a queued one
+        if AnalysisJob.query.filter(AnalysisJob.id == queued_id, AnalysisJob.status == 'queued') \
+                .update(values, synchronize_session=False):
+            log_event('analysis.job_merged', job_id=queued_id, document_id=document.id)
+            return db.session.get(AnalysisJob, queued_id)
+    job = AnalysisJob(document_id=document.id, status='queued', stage='queued',
+                      previous_content_hash=previous_content_hash, profile_requested=profile_requested)
+    db.session.add(job)
+    return job
+
+
+def cancel_jobs(document_id: int) -> list:
+    """Drop the jobs of a document before it is deleted. Returns content hashes they still held."""
+    held = [h for (h,) in db.session.query(AnalysisJob.previous_content_hash).filter(
+        AnalysisJob.document_id == document_id,
+        AnalysisJob.status.in_(['queued', 'running']),
+        AnalysisJob.previous_content_hash.isnot(None))]
+    AnalysisJob.query.filter_by(document_id=document_id).delete(synchronize_session=False)
+    return held
+
+
+def get_document_progress(document: Document) -> dict:
+    """Status summary used by the status endpoint and the home page."""
+    job = AnalysisJob.query.filter_by(document_id=document.id).order_by(AnalysisJob.id.desc()).first()
+    batch = None
+    if job is None and document.batch_id and document.analysis_status in ('pending', 'processing'):
+        # Documents of a bulk upload report the progress of their batch
+        batch = db.session.get(BulkBatch, document.batch_id)
+    if batch is not None:
+        return {
+            'document_id': document.id,
+            'status': document.analysis_status,
+            'stage': batch.stage,
+            'progress': batch.progress,
+            'error': None,
+            'originality_score': document.originality_score,
+            'reuse': None,
+            'batch_id': batch.id,
+        }
+    return {
+        'document_id': document.id,
+        'status': document.analysis_status or 'complete',
+        'stage': job.stage if job else None,
+        'progress': job.progress if job else 1.0,
+        'error': job.error if job and job.status == 'failed' else None,
+        'originality_score': document.originality_score,
+        'reuse': json.loads(job.reuse_stats) if job and job.reuse_stats else None,
+    }
+
+
+def _update_owned(job, owner: str, **values) -> bool:
+    """
+    Update a running job (or bulk batch) only while the worker owner still holds it.
+    The caller commits.
+    """
+    model = type(job)
+    return model.query.filter(model.id == job.id, model.worker_id == owner,
+                              model.status == 'running').update(values) == 1
+
+
+def _set_progress(job: AnalysisJob, worker_id: str, stage: str, progress: float) -> None:
+    if not _update_owned(job, worker_id, stage=stage, progress=progress, heartbeat_at=_now()):
+        db.session.rollback()
+        raise JobLost(f"Job {job.id} was reclaimed from {worker_id}")
+    db.session.commit()
+
+
+class Heartbeat:
+    """
+    Refreshes heartbeat_at of a running job (or bulk batch) from a background thread while
+    its worker is busy, so stages that write no progress for a long time are not taken for
+    a stopped worker. Uses its own connection, as sessions are not shared between threads.
+    """
+
+    def __init__(self, model, row_id: int, worker_id: str, interval: float = ANALYSIS_HEARTBEAT_SECONDS):
+        self.table = model.__table__
+        self.row_id = row_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        engine = db.engine
+        self._thread = threading.Thread(target=self._run, args=(engine,), daemon=True,
+                                        name=f"heartbeat-{self.table.name}-{self.row_id}")
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self, engine) -> None:
+        table = self.table
+        while not self._stop.wait(self.interval):
+            try:
+                with engine.begin() as connection:
+                    updated = connection.execute(
+                        table.update()
+                        .where(table.c.id == self.row_id, table.c.worker_id == self.worker_id,
+                               table.c.status == 'running')
+                        .values(heartbeat_at=_now())).rowcount
+            except Exception as e:
+                # Locked or unreachable for now; the next beat tries again
+                log_event('analysis.heartbeat_failed', logging.WARNING, table=table.name, id=self.row_id,
+                          error=str(e))
+                continue
+            if updated == 0:
+                self.lost = True
+                log_event('analysis.heartbeat_lost', logging.WARNING, table=table.name, id=self.row_id,
+                          worker_id=self.worker_id)
+                return
+
+
+def _reusable_comparisons(document: Document, docs_by_id: dict) -> dict:
+    """
+    (similarity, blocks) by document id from earlier analyses of documents with the same
+    content, for candidates whose content has not changed since.
+    """
+    if not document.content_hash or not docs_by_id:
+        return {}
+
+    twin_ids = db.select(Document.id).where(Document.content_hash == document.content_hash,
+                                            Document.id != document.id,
+                                            Document.analysis_status == 'complete')
+    matches = SimilarityMatch.query.filter(SimilarityMatch.document_id.in_(twin_ids),
+                                           SimilarityMatch.matched_document_id.in_(list(docs_by_id)),
+                                           SimilarityMatch.near_duplicate.is_(False)) \
+        .options(db.selectinload(SimilarityMatch.blocks)).all()
+
+    reusable = {}
+    for match in matches:
+        doc = docs_by_id[match.matched_document_id]
+        if match.matched_content_hash and match.matched_content_hash == doc.content_hash:
+            reusable[doc.id] = (match.similarity_score, [block.to_dict() for block in match.blocks])
+    return reusable
+
+
+class PairResults:
+    """
+    Comparisons between the documents of a bulk upload, so each pair is matched once.
+    The result for (a, b) is reused for (b, a) with the sides of its blocks swapped.
+    """
+
+    def __init__(self, document_ids: Set[int]):
+        self.document_ids = set(document_ids)
+        self.results = {}
+        self.reused = 0
+
+    def get(self, document_id: int, other_id: int) -> Optional[tuple]:
+        result = self.results.pop((other_id, document_id), None)
+        if result is None:
+            return None
+        self.reused += 1
+        similarity, blocks = result
+        return similarity, [dict(block, a_start=block['b_start'], a_end=block['b_end'],
+                                 b_start=block['a_start'], b_end=block['a_end']) for block in blocks]
+
+    def put(self, document_id: int, other_id: int, result: tuple) -> None:
+        # Only pairs whose other side is still to be analysed are worth keeping
+        if other_id in self.document_ids:
+            self.results[(document_id, other_id)] = result
+
+    def done(self, document_id: int) -> None:
+        """Forget a document once it is analysed, with any results it did not use."""
+        self.document_ids.discard(document_id)
+        self.results = {pair: result for pair, result in self.results.items() if pair[1] != document_id}
+
+
+def _incremental_comparisons(document: Document, new_text: str, docs_by_id: dict, texts_by_id: dict) -> tuple:
+    """
+    For an edited document, rebuild the comparisons of its previous analysis from a diff
+    of the old and new text. Returns ((similarity, blocks) by document id, reuse summary),
+    or ({}, None) when there is no previous analysis to start from.
+    Only block-matching results can be updated this way: the shingle engine scores by
+    shingle overlap and stores no blocks for most of its results.
+    """
+    old_hash = document.analyzed_content_hash
+    if use_shingle_engine() or not old_hash or old_hash == document.content_hash or not texts_by_id:
+        return {}, None
+    old_entry = db.session.get(ExtractedText, old_hash)
+    if old_entry is None:
+        return {}, None
+
+    matches = SimilarityMatch.query.filter(SimilarityMatch.document_id == document.id,
+                                           SimilarityMatch.matched_document_id.in_(list(texts_by_id)),
+                                           SimilarityMatch.near_duplicate.is_(False)) \
+        .options(db.selectinload(SimilarityMatch.blocks)).all()
+    candidates = {}
+    for match in matches:
+        doc = docs_by_id[match.matched_document_id]
+        if not match.matched_content_hash or match.matched_content_hash != doc.content_hash:
+            continue
+        # A score without blocks was not produced by block matching; compare it in full
+        if match.similarity_score > 0 and not match.blocks:
+            continue
+        candidates[doc.id] = (texts_by_id[doc.id], [block.to_dict() for block in match.blocks])
+    if not candidates:
+        return {}, None
+
+    results, summary = incremental_results(old_entry.text, new_text, candidates)
+    summary['documents_total'] = len(texts_by_id)
+    summary['reused_fraction'] = 1.0 - summary['chars_rematched'] / max(1, summary['chars_total'])
+    log_event('analysis.incremental', document_id=document.id, updated=summary['documents_incremental'],
+              documents=len(texts_by_id), reused_fraction=round(summary['reused_fraction'], 4))
+    return results, summary
+
+
+def analyze_document(document: Document, file_path: str, upload_folder: str,
+                     job: Optional[AnalysisJob] = None, pair_results: Optional[PairResults] = None,
+                     update_index: bool = True, worker_id: Optional[str] = None) -> float:
+    """
+    Extract, compare and store the originality analysis of a document. Returns the score.
+    With a job (claimed by worker_id), the job is marked done in the same commit as the
+    results, and JobLost is raised instead if another worker has reclaimed it.
+    A bulk upload passes its pair_results, and indexes its documents up front (update_index=False).
+    """
+    def progress(stage, value):
+        if job is not None:
+            _set_progress(job, worker_id, stage, value)
+
+    progress('extracting', 0.05)
+    with stage_timer('analyze_document', 'extract'):
+        content_hash, new_text = store_file_text(file_path, document.content_hash)
+        document.content_hash = content_hash
+    with stage_timer('analyze_document', 'fingerprint'):
+        new_fingerprints = fingerprint_text(new_text)
+        signature = compute_signature(new_text) if MINHASH_ENABLED else None
+
+    # Index previous documents of this user that predate the fingerprint index
+    progress('indexing', 0.15)
+    with stage_timer('analyze_document', 'index_backfill'):
+        unindexed = Document.query.filter(Document.user_id==document.user_id,
+                                          Document.fingerprint_count.is_(None),
+                                          Document.id != document.id).all()
+        for doc in unindexed:
+            legacy_path = None if doc.content_hash else resolve_path(doc, upload_folder)
+            index_document(doc, get_document_text(doc, legacy_path))
+
+    # Only documents sharing fingerprints with the new text go through detailed matching
+    progress('selecting candidates', 0.25)
+    with stage_timer('analyze_document', 'candidates'):
+        candidates = find_candidates(new_fingerprints, user_id=document.user_id, exclude_document_id=document.id)
+        candidate_ids = [document_id for document_id, _ in candidates]
+        # Documents of other users at the same institution, through the corpus index
+        scope = document_scope(document) if CORPUS_SEARCH_ENABLED else None
+        corpus_candidates = []
+        if scope is not None:
+            corpus_candidates = search_corpus(new_fingerprints, scope, exclude_document_id=document.id)
+            own_ids = set(candidate_ids)
+            candidate_ids += [document_id for document_id, _ in corpus_candidates if document_id not in own_ids]
+        # Whole-document resubmissions found through the LSH buckets are always compared
+        near = find_near_duplicates(document, signature)
+        if near:
+            candidate_ids += [document_id for document_id in near if document_id not in candidate_ids]
+        docs_by_id = {doc.id: doc for doc in Document.query.filter(Document.id.in_(candidate_ids)).all()} if candidate_ids else {}
+        previous_docs = [docs_by_id[document_id] for document_id in candidate_ids if document_id in docs_by_id]
+    log_event('analysis.candidates', document_id=document.id, selected=len(previous_docs),
+              fingerprint=len(candidates), corpus=len(corpus_candidates), near_duplicates=len(near))
+
+    previous_texts = []
+    doc_names = []
+    doc_ids = []
+    doc_hashes = []
+    with stage_timer('analyze_document', 'load_texts'):
+        for doc in previous_docs:
+            legacy_path = None if doc.content_hash else resolve_path(doc, upload_folder)
+            text = get_document_text(doc, legacy_path)
+            if text:
+                previous_texts.append(text)
+                doc_names.append(doc.document_name)
+                doc_ids.append(doc.id)
+                doc_hashes.append(doc.content_hash)
+
+        # Identical content analysed before already has results for unchanged candidates, and an
+        # edited document only needs its changed regions matched again
+        reusable = _reusable_comparisons(document, docs_by_id)
+        incremental, reuse_summary = _incremental_comparisons(
+            document, new_text, docs_by_id, {doc_id: text for doc_id, text in zip(doc_ids, previous_texts)
+                                             if doc_id not in reusable})
+        reusable.update(incremental)
+        known_results = {i: reusable[doc_id] for i, doc_id in enumerate(doc_ids) if doc_id in reusable}
+        near_duplicates = {i: near[doc_id] for i, doc_id in enumerate(doc_ids) if doc_id in near}
+        if pair_results is not None:
+            for i, doc_id in enumerate(doc_ids):
+                if i not in known_results and i not in near_duplicates:
+                    mirrored = pair_results.get(document.id, doc_id)
+                    if mirrored is not None:
+                        known_results[i] = mirrored
+        shingle_arrays = None
+        if use_shingle_engine():
+            arrays_by_hash = load_shingle_arrays(doc_hashes)
+            shingle_arrays = [arrays_by_hash.get(content_hash) for content_hash in doc_hashes]
+    log_event('analysis.texts_loaded', document_id=document.id, documents=len(previous_texts))
+    if job is not None and reuse_summary is not None:
+        job.reuse_stats = json.dumps(reuse_summary)
+
+    last_write = [0.0]
+
+    def on_compared(done, total):
+        if job is None or time.monotonic() - last_write[0] < PROGRESS_WRITE_INTERVAL:
+            return
+        last_write[0] = time.monotonic()
+        _set_progress(job, worker_id, 'comparing', 0.3 + 0.6 * done / max(1, total))
+
+    progress('comparing', 0.3)
+    with stage_timer('analyze_document', 'originality'):
+        originality_score, similarity_details = calculate_originality(
+            new_text, previous_texts, doc_names, progress_callback=on_compared, doc_ids=doc_ids,
+            known_results=known_results, near_duplicates=near_duplicates, shingle_arrays=shingle_arrays)
+
+    # Ensure originality score is between 0 and 1
+    originality_score = max(0.0, min(1.0, originality_score))
+
+    if pair_results is not None:
+        reported = {match['document_id']: (match['similarity_score'], match['matching_blocks'])
+                    for match in similarity_details.get('similar_documents', [])
+                    if match.get('document_id') and not match.get('near_duplicate')}
+        for i, doc_id in enumerate(doc_ids):
+            if i not in near_duplicates:
+                pair_results.put(document.id, doc_id, reported.get(doc_id, (0.0, [])))
+
+    progress('saving', 0.95)
+    with stage_timer('analyze_document', 'save'):
+        document.originality_score = originality_score
+        document.set_similarity_details(similarity_details)
+        document.analyzed_content_hash = content_hash
+        index_signature(document, signature)
+        document.analysis_status = 'complete'
+        with stage_timer('analyze_document', 'render_view'):
+            build_rendered_view(document, new_text, similarity_details)
+        if job is not None and not _update_owned(job, worker_id, status='done', stage='done', progress=1.0,
+                                                 finished_at=_now()):
+            db.session.rollback()
+            raise JobLost(f"Job {job.id} was reclaimed from {worker_id}")
+        db.session.commit()
+    if update_index:
+        with stage_timer('analyze_document', 'fingerprint_index'):
+            index_document(document, new_text, new_fingerprints)
+    return originality_score
+
+
+def _reclaim_stale_jobs() -> None:
+    """Requeue running jobs whose worker stopped sending heartbeats."""
+    cutoff = _now() - timedelta(seconds=ANALYSIS_JOB_STALE_SECONDS)
+    stale = db.session.query(AnalysisJob.id, AnalysisJob.document_id, AnalysisJob.worker_id, AnalysisJob.attempts) \
+        .filter(AnalysisJob.status == 'running', AnalysisJob.heartbeat_at < cutoff).all()
+    for job_id, document_id, worker_id, attempts in stale:
+        if attempts >= ANALYSIS_MAX_ATTEMPTS:
+            values = {'status': 'failed', 'stage': 'failed', 'error': 'Worker stopped responding',
+                      'finished_at': _now()}
+        else:
+            values = {'status': 'queued', 'stage': 'queued'}
+        values['worker_id'] = None
+        # Conditional, so a job that sent a heartbeat or finished since is left alone
+        reclaimed = AnalysisJob.query.filter(AnalysisJob.id == job_id, AnalysisJob.worker_id == worker_id,
+                                             AnalysisJob.status == 'running', AnalysisJob.heartbeat_at < cutoff) \
+            .update(values, synchronize_session=False)
+        if not reclaimed:
+            continue
+        log_event('analysis.job_reclaimed', logging.WARNING, job_id=job_id, worker_id=worker_id)
+        if values['status'] == 'failed':
+            Document.query.filter_by(id=document_id).update({'analysis_status': 'failed'}, synchronize_session=False)
+    if stale:
+        db.session.commit()
+
+
+def claim_next_job(worker_id: str) -> Optional[AnalysisJob]:
+    """Atomically move the oldest queued job to running for this worker."""
+    _reclaim_stale_jobs()
+
+    while True:
+        job_id = db.session.query(AnalysisJob.id).filter(AnalysisJob.status == 'queued') \
+            .order_by(AnalysisJob.id).limit(1).scalar()
+        if job_id is None:
+            return None
+
+        now = _now()
+        claimed = AnalysisJob.query.filter(AnalysisJob.id == job_id, AnalysisJob.status == 'queued').update({
+            'status': 'running',
+            'stage': 'starting',
+            'worker_id': worker_id,
+            'started_at': now,
+            'heartbeat_at': now,
+            'attempts': AnalysisJob.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+
+        # Another worker took it first; try the next one
+        if claimed == 1:
+            return db.session.get(AnalysisJob, job_id)
+
+
+def process_job(job: AnalysisJob, upload_folder: str) -> None:
+    """Run one claimed job and record its outcome."""
+    # Read before any commit expires the job
+    worker_id = job.worker_id
+    previous_content_hash = job.previous_content_hash
+    document = db.session.get(Document, job.document_id)
+    try:
+        if document is None:
+            raise LookupError(f"Document {job.document_id} no longer exists")
+
+        file_path = resolve_path(document, upload_folder)
+        if not file_path:
+            raise FileNotFoundError(f"File not found for document {document.id}: {document.file_path}")
+
+        document.analysis_status = 'processing'
+        db.session.commit()
+        with Heartbeat(AnalysisJob, job.id, worker_id), \
+                profiled(job_trigger(job), kind='analysis_job', endpoint='analysis_job',
+                         path=f"job {job.id} / document {document.id}", user_id=document.user_id):
+            score = analyze_document(document, file_path, upload_folder, job, worker_id=worker_id)
+
+        # Only the worker that marked the job done gets here, so the text is released once
+        if previous_content_hash and previous_content_hash != document.content_hash:
+            release_text(previous_content_hash)
+
+        ANALYSIS_JOBS.inc(outcome='done')
+        log_event('analysis.job_finished', job_id=job.id, document_id=document.id, originality=round(score, 4))
+    except JobLost as e:
+        db.session.rollback()
+        ANALYSIS_JOBS.inc(outcome='lost')
+        log_event('analysis.job_lost', logging.WARNING, job_id=job.id, worker_id=worker_id, error=str(e))
+    except Exception as e:
+        db.session.rollback()
+        log_event('analysis.job_failed', logging.ERROR, job_id=job.id, attempt=job.attempts, error=str(e),
+                  traceback=traceback.format_exc())
+        failed = job.attempts >= ANALYSIS_MAX_ATTEMPTS or document is None
+        if failed:
+            values = {'status': 'failed', 'stage': 'failed', 'finished_at': _now()}
+        else:
+            values = {'status': 'queued', 'stage': 'queued'}
+        if _update_owned(job, worker_id, error=str(e), worker_id=None, **values):
+            if failed and document is not None:
+                document.analysis_status = 'failed'
+            ANALYSIS_JOBS.inc(outcome='failed' if failed else 'retry')
+        db.session.commit()
+
+
+def run_worker(app, worker_id: Optional[str] = None, stop_event: Optional[threading.Event] = None,
+               poll_interval: float = ANALYSIS_POLL_INTERVAL, once: bool = False) -> None:
+    """Claim and process jobs until stop_event is set (or the queue is empty when once=True)."""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    log_event('analysis.worker_started', worker_id=worker_id)
+
+    while stop_event is None or not stop_event.is_set():
+        with app.app_context():
+            try:
+                job = claim_next_job(worker_id)
+                if job is not None:
+                    process_job(job, app.config['UPLOAD_FOLDER'])
+                else:
+                    # Imported here: bulk uploads build on analyze_document in this module
+                    from src.services.bulk_upload import claim_next_batch, process_batch
+                    job = claim_next_batch(worker_id)
+                    if job is not None:
+                        process_batch(job, app.config['UPLOAD_FOLDER'])
+            except Exception as e:
+                db.session.rollback()
+                job = None
+                log_event('analysis.worker_error', logging.ERROR, worker_id=worker_id, error=str(e))
+            finally:
+                db.session.remove()
+
+        if job is None:
+            # Idle: publish this process's metrics for the /metrics endpoint
+            flush_metrics()
+            if once:
+                return
+            if stop_event is not None:
+                stop_event.wait(poll_interval)
+            else:
+                time.sleep(poll_interval)
+
+
+_worker_threads = []
+_worker_lock = threading.Lock()
+
+
+def start_worker_threads(app, count: int = ANALYSIS_WORKER_THREADS) -> None:
+    """Start in-process worker threads once per process."""
+    with _worker_lock:
+        if _worker_threads or count <= 0:
+            return
+        for index in range(count):
+            thread = threading.Thread(target=run_worker, args=(app,), name=f"analysis-worker-{index}", daemon=True)
+            thread.start()
+            _worker_threads.append(thread)
@@ -0,0 +1,362 @@
+"""
+Bulk uploads for Paperlit.
+Many files, or .zip archives of them, are streamed into the blob store and all their
+Document rows are created with one bulk_batches row in a single transaction. A worker then
+analyses the batch in one pass. Texts missing from the text store are extracted on a
+process pool. Every document is indexed before any is compared, so the documents of the
+batch are candidates of each other as well as of the existing corpus. Each pair within
+the batch is matched only once (PairResults). The batch keeps its own progress and
+reports a summary when it finishes.
+"""
+import os
+import json
+import time
+import zipfile
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from src.models import db, Document, BulkBatch, SimilarityMatch
+from src.services.storage import save_upload, save_stream, resolve_path, ALLOWED_EXTENSIONS
+from src.services.text_store import get_document_text, has_current_text, store_text
+from src.services.fingerprint_index import fingerprint_text, index_document
+from src.services.minhash import MINHASH_ENABLED, compute_signature, index_signature
+from src.services.analysis_jobs import (analyze_document, Heartbeat, JobLost, PairResults, _now, _update_owned,
+                                        ANALYSIS_JOB_STALE_SECONDS, ANALYSIS_MAX_ATTEMPTS)
+from src.services.parallel_compare import PARALLEL_COMPARE_START_METHOD
+from src.services.metrics import ANALYSIS_JOBS, stage_timer
+from src.utils.file_extract import extract_text_with_page_map
+from src.utils.events import log_event
+
+BULK_ALLOWED_EXTENSIONS = ALLOWED_EXTENSIONS
+BULK_MAX_FILES = int(os.getenv('BULK_MAX_FILES', '500'))
+# Total uncompressed size of the archive members accepted in one batch
+BULK_MAX_ARCHIVE_BYTES = int(os.getenv('BULK_MAX_ARCHIVE_BYTES', str(500 * 1024 * 1024)))
+BULK_EXTRACT_WORKERS = int(os.getenv('BULK_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+BULK_REPORT_MIN_SIMILARITY = float(os.getenv('BULK_REPORT_MIN_SIMILARITY', '0.2'))
+BULK_REPORT_LIMIT = 20
+
+
+def _skip(skipped: List[dict], filename: str, reason: str) -> None:
+    skipped.append({'filename': filename, 'reason': reason})
+
+
+def _iter_archive(file_storage, skipped: List[dict]):
+    """Yield (filename, stream) for the supported members of an uploaded zip archive."""
+    try:
+        archive = zipfile.ZipFile(file_storage.stream)
+    except zipfile.BadZipFile:
+        _skip(skipped, file_storage.filename, 'not a valid zip archive')
+        return
+    total_size = 0
+    with archive:
+        for info in archive.infolist():
+            filename = os.path.basename(info.filename)
+            if info.is_dir() or not filename or filename.startswith('.') or info.filename.startswith('__MACOSX/'):
+                continue
+            if os.path.splitext(filename)[1].lower() not in BULK_ALLOWED_EXTENSIONS:
+                _skip(skipped, info.filename, 'unsupported file type')
+                continue
+            total_size += info.file_size
+            if total_size > BULK_MAX_ARCHIVE_BYTES:
+                _skip(skipped, info.filename, 'archive size limit reached')
+                continue
+            # Reads stop at the member's declared size
+            with archive.open(info) as member:
+                yield filename, member
+
+
+def create_batch(user_id: int, uploads: list) -> Tuple[Optional[BulkBatch], List[dict]]:
+    """
+    Store the uploaded files (zip archives are unpacked) and create their documents and the
+    batch in one transaction. Returns (batch, skipped files); batch is None if nothing was usable.
+    """
+    skipped = []
+    batch = BulkBatch(user_id=user_id, status='queued', stage='queued')
+    db.session.add(batch)
+    db.session.flush()
+
+    documents = []
+
+    def add_document(filename, stored):
+        document = Document(
+            user_id=user_id,
+            document_name=(os.path.splitext(filename)[0] or filename)[:255],
+            file_path=stored.storage_key,
+            original_filename=filename[:255],
+            content_hash=stored.content_hash,
+            analysis_status='pending',
+            batch_id=batch.id,
+        )
+        db.session.add(document)
+        documents.append(document)
+
+    try:
+        with stage_timer('bulk_upload', 'store_files'):
+            for upload in uploads:
+                filename = os.path.basename(upload.filename or '')
+                ext = os.path.splitext(filename)[1].lower()
+                if ext == '.zip':
+                    for member_name, stream in _iter_archive(upload, skipped):
+                        if len(documents) >= BULK_MAX_FILES:
+                            _skip(skipped, member_name, 'file limit reached')
+                            continue
+                        add_document(member_name, save_stream(stream, member_name))
+                elif ext in BULK_ALLOWED_EXTENSIONS:
+                    if len(documents) >= BULK_MAX_FILES:
+                        _skip(skipped, filename, 'file limit reached')
+                        continue
+                    add_document(filename, save_upload(upload))
+                elif filename:
+                    _skip(skipped, filename, 'unsupported file type')
+    except Exception:
+        db.session.rollback()
+        raise
+
+    if not documents:
+        db.session.rollback()
+        return None, skipped
+
+    batch.total_files = len(documents)
+    batch.summary = json.dumps({'skipped_files': skipped})
+    with stage_timer('bulk_upload', 'save_documents'):
+        db.session.commit()
+    log_event('bulk.created', batch_id=batch.id, user_id=user_id, files=len(documents), skipped=len(skipped))
+    return batch, skipped
+
+
+def _failed_values(error: str) -> dict:
+    return {'status': 'failed', 'stage': 'failed', 'error': error, 'finished_at': _now()}
+
+
+def _fail_documents(batch_id: int) -> None:
+    """Mark the documents of a failed batch that were not analysed as failed. The caller commits."""
+    Document.query.filter(Document.batch_id == batch_id, Document.analysis_status.in_(['pending', 'processing'])) \
+        .update({'analysis_status': 'failed'}, synchronize_session=False)
+
+
+def _reclaim_stale_batches() -> None:
+    """Requeue running batches whose worker stopped sending heartbeats."""
+    cutoff = _now() - timedelta(seconds=ANALYSIS_JOB_STALE_SECONDS)
+    stale = db.session.query(BulkBatch.id, BulkBatch.worker_id, BulkBatch.attempts) \
+        .filter(BulkBatch.status == 'running', BulkBatch.heartbeat_at < cutoff).all()
+    for batch_id, worker_id, attempts in stale:
+        failed = attempts >= ANALYSIS_MAX_ATTEMPTS
+        values = _failed_values('Worker stopped responding') if failed else {'status': 'queued', 'stage': 'queued'}
+        values['worker_id'] = None
+        # Conditional, so a batch that sent a heartbeat or finished since is left alone
+        reclaimed = BulkBatch.query.filter(BulkBatch.id == batch_id, BulkBatch.worker_id == worker_id,
+                                           BulkBatch.status == 'running', BulkBatch.heartbeat_at < cutoff) \
+            .update(values, synchronize_session=False)
+        if not reclaimed:
+            continue
+        log_event('bulk.batch_reclaimed', logging.WARNING, batch_id=batch_id, worker_id=worker_id)
+        if failed:
+            _fail_documents(batch_id)
+    if stale:
+        db.session.commit()
+
+
+def claim_next_batch(worker_id: str) -> Optional[BulkBatch]:
+    """Atomically move the oldest queued batch to running for this worker."""
+    _reclaim_stale_batches()
+
+    while True:
+        batch_id = db.session.query(BulkBatch.id).filter(BulkBatch.status == 'queued') \
+            .order_by(BulkBatch.id).limit(1).scalar()
+        if batch_id is None:
+            return None
+
+        now = _now()
+        claimed = BulkBatch.query.filter(BulkBatch.id == batch_id, BulkBatch.status == 'queued').update({
+            'status': 'running',
+            'stage': 'starting',
+            'worker_id': worker_id,
+            'started_at': now,
+            'heartbeat_at': now,
+            'attempts': BulkBatch.attempts + 1,
+        }, synchronize_session=False)
+        db.session.commit()
+
+        if claimed == 1:
+            return db.session.get(BulkBatch, batch_id)
+
+
+def _extract_missing(documents: List[Document], paths: dict, progress) -> int:
+    """Extract and store the texts the text store does not have yet. Returns how many were extracted."""
+    to_extract = {}
+    for document in documents:
+        path = paths.get(document.id)
+        if path and document.content_hash and document.content_hash not in to_extract \
+                and not has_current_text(document.content_hash):
+            to_extract[document.content_hash] = path
+    if not to_extract:
+        return 0
+
+    done = 0
+    if BULK_EXTRACT_WORKERS > 1 and len(to_extract) > 1:
+        context = multiprocessing.get_context(PARALLEL_COMPARE_START_METHOD)
+        with ProcessPoolExecutor(max_workers=min(BULK_EXTRACT_WORKERS, len(to_extract)), mp_context=context) as pool:
+            futures = {pool.submit(extract_text_with_page_map, path): content_hash
+                       for content_hash, path in to_extract.items()}
+            for future in as_completed(futures):
+                content_hash = futures[future]
+                text, page_map = future.result()
+                store_text(content_hash, text, to_extract[content_hash], page_map)
+                done += 1
+                progress('extracting', 0.05 + 0.25 * done / len(to_extract))
+    else:
+        for content_hash, path in to_extract.items():
+            text, page_map = extract_text_with_page_map(path)
+            store_text(content_hash, text, path, page_map)
+            done += 1
+            progress('extracting', 0.05 + 0.25 * done / len(to_extract))
+    return done
+
+
+def _batch_report(batch: BulkBatch, documents: List[Document], failures: List[dict],
+                  pair_results: PairResults, seconds: float) -> dict:
+    summary = json.loads(batch.summary) if batch.summary else {}
+    ids = [document.id for document in documents]
+    names = {document.id: document.document_name for document in documents}
+
+    by_hash = {}
+    for document in documents:
+        by_hash.setdefault(document.content_hash, []).append(document.document_name)
+
+    pairs = {}
+    rows = db.session.query(SimilarityMatch.document_id, SimilarityMatch.matched_document_id,
+                            SimilarityMatch.similarity_score, SimilarityMatch.near_duplicate) \
+        .filter(SimilarityMatch.document_id.in_(ids), SimilarityMatch.matched_document_id.in_(ids),
+                SimilarityMatch.similarity_score >= BULK_REPORT_MIN_SIMILARITY).all() if ids else []
+    for document_id, matched_id, score, near_duplicate in rows:
+        key = tuple(sorted((document_id, matched_id)))
+        if key not in pairs or pairs[key]['similarity_score'] < score:
+            pairs[key] = {'documents': [names[key[0]], names[key[1]]], 'document_ids': list(key),
+                          'similarity_score': score, 'near_duplicate': bool(near_duplicate)}
+
+    scores = [(document.originality_score, document.document_name, document.id) for document in documents
+              if document.originality_score is not None]
+    summary.update({
+        'documents': len(documents),
+        'analysed': len(scores),
+        'failed': failures,
+        'duplicate_files': [group for group in by_hash.values() if len(group) > 1],
+        'similar_pairs': sorted(pairs.values(), key=lambda pair: pair['similarity_score'],
+                                reverse=True)[:BULK_REPORT_LIMIT],
+        'mean_originality': sum(score for score, _, _ in scores) / len(scores) if scores else None,
+        'lowest_originality': [{'document_id': document_id, 'document_name': name, 'originality_score': score}
+                               for score, name, document_id in sorted(scores)[:BULK_REPORT_LIMIT]],
+        'pairs_reused': pair_results.reused,
+        'seconds': round(seconds, 1),
+    })
+    return summary
+
+
+def process_batch(batch: BulkBatch, upload_folder: str) -> None:
+    """
+    Analyse all documents of a claimed batch against each other and the corpus. Every write
+    of the batch is conditional on this worker still holding it; once another worker has
+    reclaimed it, the batch is left to that worker.
+    """
+    started = time.perf_counter()
+    # Read before any commit expires the batch
+    batch_id = batch.id
+    worker_id = batch.worker_id
+    attempts = batch.attempts
+    heartbeat = Heartbeat(BulkBatch, batch_id, worker_id)
+
+    def progress(stage, value, **values):
+        """Commit the session together with the batch's progress, unless the batch was reclaimed."""
+        if heartbeat.lost or not _update_owned(batch, worker_id, stage=stage, progress=value,
+                                               heartbeat_at=_now(), **values):
+            db.session.rollback()
+            raise JobLost(f"Batch {batch_id} was reclaimed from {worker_id}")
+        db.session.commit()
+
+    try:
+        with heartbeat:
+            documents = Document.query.filter_by(batch_id=batch_id).order_by(Document.id).all()
+            # A reclaimed batch continues where the previous attempt stopped
+            pending = [document for document in documents if document.analysis_status != 'complete']
+            paths = {document.id: resolve_path(document, upload_folder) for document in pending}
+            failures = []
+
+            progress('extracting', 0.05)
+            with stage_timer('bulk_upload', 'extract'):
+                extracted = _extract_missing(pending, paths, progress)
+
+            # Index the whole batch first so its documents find each other as candidates
+            progress('indexing', 0.3)
+            with stage_timer('bulk_upload', 'index'):
+                for document in pending:
+                    if not paths[document.id]:
+                        continue
+                    text = get_document_text(document, paths[document.id])
+                    index_signature(document, compute_signature(text) if MINHASH_ENABLED else None)
+                    index_document(document, text, fingerprint_text(text))
+
+            pair_results = PairResults({document.id for document in pending})
+            with stage_timer('bulk_upload', 'compare'):
+                for done, document in enumerate(pending, 1):
+                    document = db.session.get(Document, document.id)
+                    if document is None:
+                        # Deleted while the batch was running
+                        continue
+                    path = paths[document.id]
+                    try:
+                        if not path:
+                            raise FileNotFoundError(f"File not found for document {document.id}: {document.file_path}")
+                        document.analysis_status = 'processing'
+                        progress('comparing', 0.3 + 0.65 * (done - 1) / max(1, len(pending)))
+                        analyze_document(document, path, upload_folder, pair_results=pair_results, update_index=False)
+                    except JobLost:
+                        raise
+                    except Exception as e:
+                        db.session.rollback()
+                        log_event('bulk.document_failed', logging.ERROR, batch_id=batch_id,
+                                  document_id=document.id, error=str(e))
+                        document.analysis_status = 'failed'
+                        failures.append({'document_id': document.id, 'document_name': document.document_name,
+                                         'error': str(e)})
+                    pair_results.done(document.id)
+                    progress('comparing', 0.3 + 0.65 * done / max(1, len(pending)),
+                             processed_files=len(documents) - len(pending) + done)
+
+            documents = Document.query.filter_by(batch_id=batch_id).order_by(Document.id).all()
+            summary = _batch_report(batch, documents, failures, pair_results, time.perf_counter() - started)
+            progress('done', 1.0, status='done', summary=json.dumps(summary), finished_at=_now())
+        ANALYSIS_JOBS.inc(outcome='batch_done')
+        log_event('bulk.batch_finished', batch_id=batch_id, documents=len(documents), extracted=extracted,
+                  failed=len(failures), pairs_reused=pair_results.reused,
+                  seconds=round(time.perf_counter() - started, 1))
+    except JobLost as e:
+        db.session.rollback()
+        ANALYSIS_JOBS.inc(outcome='batch_lost')
+        log_event('bulk.batch_lost', logging.WARNING, batch_id=batch_id, worker_id=worker_id, error=str(e))
+    except Exception as e:
+        db.session.rollback()
+        log_event('bulk.batch_failed', logging.ERROR, batch_id=batch_id, attempt=attempts, error=str(e))
+        failed = attempts >= ANALYSIS_MAX_ATTEMPTS
+        values = _failed_values(str(e)) if failed else {'status': 'queued', 'stage': 'queued', 'error': str(e)}
+        if _update_owned(batch, worker_id, worker_id=None, **values):
+            if failed:
+                _fail_documents(batch_id)
+            ANALYSIS_JOBS.inc(outcome='batch_failed' if failed else 'batch_retry')
+        db.session.commit()
+
+
+def get_batch_progress(batch: BulkBatch) -> dict:
+    """Progress of a batch, and its summary once it has finished."""
+    return {
+        'batch_id': batch.id,
+        'status': batch.status,
+        'stage': batch.stage,
+        'progress': batch.progress,
+        'total_files': batch.total_files,
+        'processed_files': batch.processed_files,
+        'error': batch.error if batch.status == 'failed' else None,
+        'summary': json.loads(batch.summary) if batch.summary else None,
+    }
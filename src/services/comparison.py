@@ -0,0 +1,150 @@
+"""
+Single-pass text comparison for Paperlit.
+compare_texts() returns the similarity score and the matching blocks from one suffix
+automaton pass. Before that pass, two cheap upper bounds on the score reject pairs that
+cannot reach the reporting threshold:
+
+* real quick: 2 * min(len1, len2) / (len1 + len2), from the lengths alone
+* quick: every block of at least min_size characters fully contains one of the aligned
+  min_size // 2 character chunks of text1, so chunks missing from text2 bound the match
+
+The number of pairs each tier rejected is kept in process-wide counters. The chunks and
+automaton of text1 are kept in a PreparedText, so comparing one new text with a whole
+candidate list builds them once.
+"""
+import os
+import threading
+from typing import List, Tuple, Union
+
+from src.services.suffix_matcher import SuffixAutomaton, block_similarity, swap_sides, MATCH_MIN_SIZE
+
+REAL_QUICK_RATIO_THRESHOLD = float(os.getenv('REAL_QUICK_RATIO_THRESHOLD', '0.01'))
+QUICK_RATIO_THRESHOLD = float(os.getenv('QUICK_RATIO_THRESHOLD', '0.01'))
+
+_stats_lock = threading.Lock()
+_stats = {
+    'pairs': 0,
+    'rejected_real_quick': 0,
+    'rejected_quick': 0,
+    'matched': 0,
+}
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def get_comparison_stats() -> dict:
+    """Return a copy of the cascade counters."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def merge_comparison_stats(delta: dict) -> None:
+    """Add counters collected elsewhere (e.g. in a worker process)."""
+    with _stats_lock:
+        for key, value in delta.items():
+            _stats[key] = _stats.get(key, 0) + value
+
+
+def reset_comparison_stats() -> None:
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def real_quick_ratio(len1: int, len2: int) -> float:
+    """Upper bound on the score from the text lengths alone."""
+    if not len1 or not len2:
+        return 0.0
+    return 2.0 * min(len1, len2) / (len1 + len2)
+
+
+class PreparedText:
+    """
+    The text compared against many others, with what every comparison needs from it: its
+    aligned chunks for quick_ratio and, built on first use, its suffix automaton. An
+    analysis prepares the new text once and streams each candidate through these, so a
+    comparison costs time in the candidate's length instead of building its structures.
+    """
+
+    __slots__ = ('text', 'min_size', 'chunk_size', 'chunk_counts', '_automaton')
+
+    def __init__(self, text: str, min_size: int = MATCH_MIN_SIZE):
+        self.text = text
+        self.min_size = min_size
+        self.chunk_size = max(1, min_size // 2)
+        counts = {}
+        for start in range(0, len(text) - self.chunk_size + 1, self.chunk_size):
+            chunk = text[start:start + self.chunk_size]
+            counts[chunk] = counts.get(chunk, 0) + 1
+        self.chunk_counts = counts
+        self._automaton = None
+
+    def __len__(self) -> int:
+        return len(self.text)
+
+    def __str__(self) -> str:
+        return self.text
+
+    @property
+    def automaton(self) -> SuffixAutomaton:
+        if self._automaton is None:
+            self._automaton = SuffixAutomaton(self.text)
+        return self._automaton
+
+    def quick_ratio(self, other: str) -> float:
+        """quick_ratio(text, other), scanning other once for the prepared chunks."""
+        if not self.text or not other:
+            return 0.0
+        chunk_size = self.chunk_size
+        counts = self.chunk_counts
+        found = {chunk for chunk in (other[i:i + chunk_size] for i in range(len(other) - chunk_size + 1))
+                 if chunk in counts}
+        present = sum(counts[chunk] for chunk in found)
+
+        matched_bound = min(len(self.text), len(other), 3 * chunk_size * present)
+        return 2.0 * matched_bound / (len(self.text) + len(other))
+
+    def matching_blocks(self, other: str) -> List[dict]:
+        """find_common_blocks(text, other), streaming other through the prepared automaton."""
+        if not self.text or not other:
+            return []
+        return swap_sides(self.automaton.matching_blocks(other, self.min_size), self.text, self.min_size)
+
+
+def quick_ratio(text1: str, text2: str, min_size: int = MATCH_MIN_SIZE) -> float:
+    """
+    Upper bound on the score from aligned chunks of text1 found in text2.
+    A block of length L >= min_size contains at least one aligned chunk of size
+    q = min_size // 2 and spans at most (contained chunks + 2) * q characters,
+    so matched characters are at most 3 * q * (chunks present in text2).
+    """
+    return PreparedText(text1, min_size).quick_ratio(text2)
+
+
+def compare_texts(text1: Union[str, PreparedText], text2: str, min_size: int = MATCH_MIN_SIZE,
+                  real_quick_threshold: float = REAL_QUICK_RATIO_THRESHOLD,
+                  quick_threshold: float = QUICK_RATIO_THRESHOLD) -> Tuple[float, List[dict]]:
+    """
+    Return (similarity, matching_blocks) for text1 against text2, rejecting hopeless pairs early.
+    Pass text1 as a PreparedText to reuse its structures across comparisons.
+    """
+    _count('pairs')
+    if not text1 or not text2:
+        return 0.0, []
+    if not isinstance(text1, PreparedText) or text1.min_size != min_size:
+        text1 = PreparedText(str(text1), min_size)
+
+    if real_quick_ratio(len(text1), len(text2)) < real_quick_threshold:
+        _count('rejected_real_quick')
+        return 0.0, []
+
+    if text1.quick_ratio(text2) < quick_threshold:
+        _count('rejected_quick')
+        return 0.0, []
+
+    _count('matched')
+    blocks = text1.matching_blocks(text2)
+    return block_similarity(blocks, len(text1), len(text2)), blocks
@@ -0,0 +1,106 @@
+"""
+Institution-wide corpus search for Paperlit.
+Uploads are compared against the documents of every user of the same institution, not
+only the uploader's own. The institution is the one an admin assigned
+(User.verified_institution), not the free-text one users edit in their profile. The
+winnowing fingerprints in document_fingerprints act as an inverted index keyed by
+(scope, hash). A search only looks up the rarest fingerprints of
+the new text that occur in at most CORPUS_MAX_TERM_DOCUMENTS documents, using the counts
+in corpus_terms. The postings read per search are therefore bounded however large the
+corpus grows, and shared boilerplate such as assignment prompts is ignored.
+"""
+import os
+import heapq
+from typing import List, Tuple, Optional
+
+from sqlalchemy import func
+
+from src.models import db, User, Document, DocumentFingerprint, CorpusTerm
+from src.services.fingerprint_index import (
+    QUERY_BATCH_SIZE, CANDIDATE_MIN_SHARED, institution_scope, adjust_term_counts, indexed_terms
+)
+
+CORPUS_SEARCH_ENABLED = os.getenv('CORPUS_SEARCH_ENABLED', 'true').lower() == 'true'
+CORPUS_TOP_K = int(os.getenv('CORPUS_TOP_K', '20'))
+# Fingerprints of the new text looked up per search, rarest first
+CORPUS_QUERY_FINGERPRINTS = int(os.getenv('CORPUS_QUERY_FINGERPRINTS', '300'))
+# Fingerprints held by more documents than this are treated as boilerplate
+CORPUS_MAX_TERM_DOCUMENTS = int(os.getenv('CORPUS_MAX_TERM_DOCUMENTS', '200'))
+
+
+def search_corpus(fingerprints: List[Tuple[int, int]], scope: Optional[str],
+                  exclude_document_id: Optional[int] = None, top_k: int = CORPUS_TOP_K,
+                  min_shared: int = CANDIDATE_MIN_SHARED) -> List[Tuple[int, int]]:
+    """
+    Return up to top_k (document_id, shared fingerprint count) for documents of the scope
+    sharing at least min_shared of the queried fingerprints, most shared first.
+    """
+    if scope is None or not fingerprints:
+        return []
+
+    unique_hashes = list({h for h, _ in fingerprints})
+    frequencies = []
+    for start in range(0, len(unique_hashes), QUERY_BATCH_SIZE):
+        batch = unique_hashes[start:start + QUERY_BATCH_SIZE]
+        frequencies.extend(db.session.query(CorpusTerm.doc_count, CorpusTerm.hash).filter(
+            CorpusTerm.scope == scope, CorpusTerm.hash.in_(batch),
+            CorpusTerm.doc_count <= CORPUS_MAX_TERM_DOCUMENTS))
+    query_hashes = [h for _, h in sorted(frequencies)[:CORPUS_QUERY_FINGERPRINTS]]
+
+    shared = {}
+    for start in range(0, len(query_hashes), QUERY_BATCH_SIZE):
+        batch = query_hashes[start:start + QUERY_BATCH_SIZE]
+        query = db.session.query(
+            DocumentFingerprint.document_id,
+            func.count(func.distinct(DocumentFingerprint.hash))
+        ).filter(DocumentFingerprint.scope == scope, DocumentFingerprint.hash.in_(batch))
+        if exclude_document_id is not None:
+            query = query.filter(DocumentFingerprint.document_id != exclude_document_id)
+
+        for document_id, count in query.group_by(DocumentFingerprint.document_id):
+            shared[document_id] = shared.get(document_id, 0) + count
+
+    ranked = heapq.nsmallest(top_k, ((-count, document_id) for document_id, count in shared.items()
+                                     if count >= min_shared))
+    return [(document_id, -count) for count, document_id in ranked]
+
+
+def move_user_documents(user_id: int, institution: Optional[str]) -> int:
+    """Move a user's indexed documents to the scope of their new verified institution. Returns the number moved."""
+    scope = institution_scope(institution)
+    moved = 0
+    for (document_id,) in db.session.query(Document.id).filter(Document.user_id == user_id).all():
+        old_scope, hashes = indexed_terms(document_id)
+        if not hashes or old_scope == scope:
+            continue
+        adjust_term_counts(old_scope, hashes, -1)
+        DocumentFingerprint.query.filter_by(document_id=document_id) \
+            .update({'scope': scope}, synchronize_session=False)
+        adjust_term_counts(scope, hashes, 1)
+        moved += 1
+    db.session.commit()
+    return moved
+
+
+def rebuild_corpus_index() -> dict:
+    """Recompute fingerprint scopes from the users' verified institutions, then the corpus_terms counts."""
+    stats = {'users': 0, 'scopes': 0, 'terms': 0}
+    for user_id, institution in db.session.query(User.id, User.verified_institution).all():
+        document_ids = db.select(Document.id).where(Document.user_id == user_id)
+        DocumentFingerprint.query.filter(DocumentFingerprint.document_id.in_(document_ids)) \
+            .update({'scope': institution_scope(institution)}, synchronize_session=False)
+        stats['users'] += 1
+
+    CorpusTerm.query.delete(synchronize_session=False)
+    counts = db.select(
+        DocumentFingerprint.scope,
+        DocumentFingerprint.hash,
+        func.count(func.distinct(DocumentFingerprint.document_id))
+    ).where(DocumentFingerprint.scope.isnot(None)) \
+        .group_by(DocumentFingerprint.scope, DocumentFingerprint.hash)
+    db.session.execute(db.insert(CorpusTerm).from_select(['scope', 'hash', 'doc_count'], counts))
+    db.session.commit()
+
+    stats['scopes'] = db.session.query(func.count(func.distinct(CorpusTerm.scope))).scalar()
+    stats['terms'] = db.session.query(func.count()).select_from(CorpusTerm).scalar()
+    return stats
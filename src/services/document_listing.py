@@ -0,0 +1,74 @@
+"""
+Keyset-paginated document listing for the home page.
+Pages are addressed by the (uploaded_at, id) of the first or last row shown, which the
+ix_documents_user_uploaded index serves directly, and only the summary columns are loaded.
+"""
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from src.models import db, Document
+
+HOME_PAGE_SIZE = int(os.getenv('HOME_PAGE_SIZE', '25'))
+
+# Columns shown in the listing; similarity_details and other large columns stay unloaded
+LISTING_COLUMNS = (
+    Document.id,
+    Document.user_id,
+    Document.document_name,
+    Document.uploaded_at,
+    Document.originality_score,
+    Document.analysis_status,
+    Document.top_match_name,
+    Document.match_count,
+)
+
+
+def encode_cursor(document: Document) -> str:
+    return f"{document.uploaded_at.isoformat()}_{document.id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Parse a cursor from the query string; invalid cursors are treated as absent."""
+    if not cursor:
+        return None
+    try:
+        uploaded_at, document_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(uploaded_at), int(document_id)
+    except ValueError:
+        return None
+
+
+def list_documents(user_id: int, before: Optional[str] = None, after: Optional[str] = None,
+                   page_size: int = HOME_PAGE_SIZE) -> Tuple[List[Document], Optional[str], Optional[str]]:
+    """
+    Return one page of the user's documents, newest first, with the cursors of the newer
+    and older pages (None when there is no such page). `before` pages towards older
+    documents and `after` towards newer ones.
+    """
+    key = db.tuple_(Document.uploaded_at, Document.id)
+    query = Document.query.options(db.load_only(*LISTING_COLUMNS)).filter(Document.user_id == user_id)
+
+    before_key = decode_cursor(before)
+    after_key = decode_cursor(after) if before_key is None else None
+
+    if after_key is not None:
+        rows = query.filter(key > db.tuple_(*after_key)) \
+            .order_by(Document.uploaded_at.asc(), Document.id.asc()).limit(page_size + 1).all()
+        has_newer = len(rows) > page_size
+        documents = list(reversed(rows[:page_size]))
+        has_older = True
+    else:
+        if before_key is not None:
+            query = query.filter(key < db.tuple_(*before_key))
+        rows = query.order_by(Document.uploaded_at.desc(), Document.id.desc()).limit(page_size + 1).all()
+        has_older = len(rows) > page_size
+        documents = rows[:page_size]
+        has_newer = before_key is not None
+
+    if not documents:
+        return documents, None, None
+
+    newer_cursor = encode_cursor(documents[0]) if has_newer else None
+    older_cursor = encode_cursor(documents[-1]) if has_older else None
+    return documents, newer_cursor, older_cursor
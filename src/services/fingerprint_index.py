@@ -0,0 +1,190 @@
+"""
+Winnowing fingerprint index for Paperlit.
+Each document is reduced to a small set of hashed word k-grams (winnowing, Schleimer et al.)
+stored in document_fingerprints, so candidate documents for detailed matching are found
+with an index lookup instead of comparing against every previous document.
+Fingerprints also carry the scope (institution) of the document's owner, and corpus_terms
+counts the documents of each scope holding a fingerprint, for corpus_search.
+"""
+import os
+import re
+import hashlib
+from typing import List, Tuple, Optional, Iterable
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from src.models import db, User, Document, DocumentFingerprint, CorpusTerm
+
+FINGERPRINT_K = int(os.getenv('FINGERPRINT_K', '5'))
+FINGERPRINT_WINDOW = int(os.getenv('FINGERPRINT_WINDOW', '4'))
+CANDIDATE_MIN_SHARED = int(os.getenv('CANDIDATE_MIN_SHARED', '2'))
+
+# Keeps IN (...) lists below the bound-parameter limits of SQLite and PostgreSQL
+QUERY_BATCH_SIZE = 500
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[Tuple[str, int]]:
+    """Return lowercased word tokens with their character offsets."""
+    return [(match.group().lower(), match.start()) for match in _TOKEN_RE.finditer(text or '')]
+
+
+def hash_kgram(words: Iterable[str]) -> int:
+    """Stable signed 64-bit hash of a word k-gram (fits a BigInteger column)."""
+    digest = hashlib.blake2b(' '.join(words).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def kgram_hashes(tokens: List[Tuple[str, int]], k: int = FINGERPRINT_K) -> List[int]:
+    """Hash every run of k consecutive tokens."""
+    words = [word for word, _ in tokens]
+    return [hash_kgram(words[i:i + k]) for i in range(len(words) - k + 1)]
+
+
+def winnow(hashes: List[int], window: int = FINGERPRINT_WINDOW) -> List[Tuple[int, int]]:
+    """
+    Select fingerprints from a hash sequence as (hash, k-gram index) pairs.
+    The minimum of every window is kept (rightmost on ties), so any shared run of
+    window + k - 1 tokens is guaranteed to produce a shared fingerprint.
+    """
+    if not hashes:
+        return []
+    if len(hashes) <= window:
+        position = min(range(len(hashes)), key=lambda i: (hashes[i], -i))
+        return [(hashes[position], position)]
+
+    selected = []
+    last_position = -1
+    for start in range(len(hashes) - window + 1):
+        position = start
+        for i in range(start + 1, start + window):
+            if hashes[i] <= hashes[position]:
+                position = i
+        if position != last_position:
+            selected.append((hashes[position], position))
+            last_position = position
+    return selected
+
+
+def fingerprint_text(text: str) -> List[Tuple[int, int]]:
+    """Return the winnowed fingerprints of a text as (hash, character offset) pairs."""
+    tokens = tokenize(text)
+    return [(h, tokens[index][1]) for h, index in winnow(kgram_hashes(tokens))]
+
+
+def institution_scope(institution: Optional[str]) -> Optional[str]:
+    """Corpus scope of an institution name; users without one are not part of any corpus."""
+    scope = ' '.join((institution or '').split()).casefold()
+    return scope[:100] or None
+
+
+def document_scope(document: Document) -> Optional[str]:
+    return institution_scope(db.session.query(User.verified_institution).filter(User.id == document.user_id).scalar())
+
+
+def adjust_term_counts(scope: Optional[str], hashes: Iterable[int], delta: int) -> None:
+    """Add delta to the document counts of fingerprints in a scope. The caller commits."""
+    if scope is None:
+        return
+    hashes = list(hashes)
+    for start in range(0, len(hashes), QUERY_BATCH_SIZE):
+        pending = hashes[start:start + QUERY_BATCH_SIZE]
+        while pending:
+            existing = {h for (h,) in db.session.query(CorpusTerm.hash).filter(
+                CorpusTerm.scope == scope, CorpusTerm.hash.in_(pending))}
+            if existing:
+                CorpusTerm.query.filter(CorpusTerm.scope == scope, CorpusTerm.hash.in_(list(existing))) \
+                    .update({'doc_count': CorpusTerm.doc_count + delta}, synchronize_session=False)
+            if delta < 0:
+                CorpusTerm.query.filter(CorpusTerm.scope == scope, CorpusTerm.hash.in_(list(existing)),
+                                        CorpusTerm.doc_count <= 0).delete(synchronize_session=False)
+                break
+            missing = [h for h in pending if h not in existing]
+            try:
+                with db.session.begin_nested():
+                    db.session.bulk_insert_mappings(CorpusTerm, [
+                        {'scope': scope, 'hash': h, 'doc_count': delta} for h in missing
+                    ])
+                pending = []
+            except IntegrityError:
+                # Another worker added some of these terms first; count them as existing
+                pending = missing
+
+
+def indexed_terms(document_id: int) -> Tuple[Optional[str], List[int]]:
+    """Scope and distinct fingerprint hashes currently indexed for a document."""
+    rows = db.session.query(DocumentFingerprint.scope, DocumentFingerprint.hash) \
+        .filter(DocumentFingerprint.document_id == document_id).distinct().all()
+    return (rows[0][0] if rows else None), [h for _, h in rows]
+
+
+def index_document(document: Document, text: str, fingerprints: Optional[List[Tuple[int, int]]] = None) -> int:
+    """Replace the stored fingerprints of a document. Returns the number of fingerprints stored."""
+    if fingerprints is None:
+        fingerprints = fingerprint_text(text)
+    scope = document_scope(document)
+
+    old_scope, old_hashes = indexed_terms(document.id)
+    adjust_term_counts(old_scope, old_hashes, -1)
+    DocumentFingerprint.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+    db.session.bulk_insert_mappings(DocumentFingerprint, [
+        {'document_id': document.id, 'hash': h, 'position': position, 'scope': scope}
+        for h, position in fingerprints
+    ])
+    adjust_term_counts(scope, {h for h, _ in fingerprints}, 1)
+    document.fingerprint_count = len(fingerprints)
+    db.session.commit()
+    return len(fingerprints)
+
+
+def remove_document(document_id: int) -> None:
+    """Drop the fingerprints of a document before it is deleted."""
+    old_scope, old_hashes = indexed_terms(document_id)
+    adjust_term_counts(old_scope, old_hashes, -1)
+    DocumentFingerprint.query.filter_by(document_id=document_id).delete(synchronize_session=False)
+
+
+def find_candidates(fingerprints: List[Tuple[int, int]], user_id: Optional[int] = None,
+                    exclude_document_id: Optional[int] = None,
+                    min_shared: int = CANDIDATE_MIN_SHARED) -> List[Tuple[int, int]]:
+    """
+    Return (document_id, shared fingerprint count) for indexed documents sharing at least
+    min_shared distinct fingerprints with the given ones, most shared first.
+    """
+    unique_hashes = list({h for h, _ in fingerprints})
+    shared = {}
+
+    for start in range(0, len(unique_hashes), QUERY_BATCH_SIZE):
+        batch = unique_hashes[start:start + QUERY_BATCH_SIZE]
+        query = db.session.query(
+            DocumentFingerprint.document_id,
+            func.count(func.distinct(DocumentFingerprint.hash))
+        ).filter(DocumentFingerprint.hash.in_(batch))
+
+        if user_id is not None or exclude_document_id is not None:
+            query = query.join(Document, Document.id == DocumentFingerprint.document_id)
+            if user_id is not None:
+                query = query.filter(Document.user_id == user_id)
+            if exclude_document_id is not None:
+                query = query.filter(Document.id != exclude_document_id)
+
+        for document_id, count in query.group_by(DocumentFingerprint.document_id):
+            shared[document_id] = shared.get(document_id, 0) + count
+
+    candidates = [(document_id, count) for document_id, count in shared.items() if count >= min_shared]
+    candidates.sort(key=lambda item: (-item[1], item[0]))
+    return candidates
+
+
+def rebuild_fingerprint_index(load_text) -> dict:
+    """Re-fingerprint every document using load_text(document) -> str."""
+    stats = {'indexed': 0, 'fingerprints': 0, 'empty': 0}
+    for document in Document.query.order_by(Document.id).all():
+        text = load_text(document)
+        if not text:
+            stats['empty'] += 1
+        stats['fingerprints'] += index_document(document, text)
+        stats['indexed'] += 1
+    return stats
@@ -0,0 +1,211 @@
+"""
+Incremental re-analysis of edited documents.
+The previous and new extracted texts are diffed by line (long lines by runs of words). Matching blocks of the
+previous analysis that lie in unchanged text are shifted to their new offsets, and only
+the edited regions (plus a margin, and any block that touched them) are matched against
+each candidate again. For that, a suffix automaton is built over the small edited window
+and the candidate is streamed through it, instead of building one over the whole candidate.
+Block boundaries right at an edit can differ by a character from a full comparison.
+Scores are block similarities, so this applies to results of the block matching engine only.
+"""
+import re
+import zlib
+import difflib
+from bisect import bisect_right
+from typing import Dict, List, Tuple
+
+from src.services.suffix_matcher import SuffixAutomaton, block_similarity, MATCH_MIN_SIZE
+
+
+# Lines longer than this are split into runs of words for diffing
+LONG_LINE = 200
+# About one word in this many ends a run, chosen by the word itself so runs resynchronize after an edit
+WORD_RUN_DIVISOR = 16
+
+_WORD_RE = re.compile(r'\S+\s*|\s+')
+
+
+def split_units(text: str) -> List[str]:
+    """Split text into lines, and long lines into content-defined runs of words."""
+    units = []
+    for line in text.splitlines(keepends=True):
+        if len(line) <= LONG_LINE:
+            units.append(line)
+            continue
+        run = []
+        for word in _WORD_RE.findall(line):
+            run.append(word)
+            if zlib.crc32(word.strip().encode('utf-8')) % WORD_RUN_DIVISOR == 0:
+                units.append(''.join(run))
+                run = []
+        if run:
+            units.append(''.join(run))
+    return units
+
+
+class TextDiff:
+    """Character-level view of a diff between an old and a new text."""
+
+    def __init__(self, old_text: str, new_text: str):
+        old_lines = split_units(old_text)
+        new_lines = split_units(new_text)
+        old_offsets = _line_offsets(old_lines)
+        new_offsets = _line_offsets(new_lines)
+
+        # (old_start, old_end, new_start) of unchanged runs, and (new_start, new_end) of edits
+        self.equal = []
+        self.changed = []
+        matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                self.equal.append((old_offsets[i1], old_offsets[i2], new_offsets[j1]))
+            else:
+                self.changed.append((new_offsets[j1], new_offsets[j2]))
+        self._equal_starts = [start for start, _, _ in self.equal]
+
+        self.old_length = len(old_text)
+        self.new_length = len(new_text)
+        self.unchanged_chars = sum(end - start for start, end, _ in self.equal)
+
+    def map_range(self, start: int, end: int) -> List[Tuple[int, int, int]]:
+        """Split old range [start, end) into its unchanged pieces as (old_start, new_start, length)."""
+        pieces = []
+        index = max(0, bisect_right(self._equal_starts, start) - 1)
+        while index < len(self.equal) and self.equal[index][0] < end:
+            old_start, old_end, new_start = self.equal[index]
+            piece_start = max(start, old_start)
+            piece_end = min(end, old_end)
+            if piece_start < piece_end:
+                pieces.append((piece_start, new_start + piece_start - old_start, piece_end - piece_start))
+            index += 1
+        return pieces
+
+
+def _line_offsets(lines: List[str]) -> List[int]:
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+    return offsets
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _join_diagonal(blocks: List[dict]) -> List[dict]:
+    """Join blocks that overlap or touch on the same alignment of the two texts."""
+    joined = []
+    for block in sorted(blocks, key=lambda b: (b['a_start'] - b['b_start'], b['a_start'])):
+        previous = joined[-1] if joined else None
+        if (previous and previous['a_start'] - previous['b_start'] == block['a_start'] - block['b_start']
+                and block['a_start'] <= previous['a_end']):
+            if block['a_end'] > previous['a_end']:
+                previous['b_end'] += block['a_end'] - previous['a_end']
+                previous['a_end'] = block['a_end']
+                previous['size'] = previous['a_end'] - previous['a_start']
+        else:
+            joined.append(dict(block))
+    return joined
+
+
+def _trim_overlaps(blocks: List[dict], text: str, min_size: int) -> List[dict]:
+    """Sort blocks by new-text position and cut overlaps, as the matcher does."""
+    result = []
+    covered = 0
+    for block in sorted(blocks, key=lambda b: (b['a_start'], -b['size'])):
+        if block['a_end'] <= covered:
+            continue
+        if block['a_start'] < covered:
+            shift = covered - block['a_start']
+            if block['size'] - shift < min_size:
+                continue
+            block = dict(block, a_start=covered, b_start=block['b_start'] + shift,
+                         size=block['size'] - shift)
+        block['text'] = text[block['a_start']:block['a_end']]
+        result.append(block)
+        covered = block['a_end']
+    return result
+
+
+def window_blocks(new_text: str, start: int, end: int, other_text: str,
+                  min_size: int = MATCH_MIN_SIZE) -> List[dict]:
+    """Common blocks of new_text[start:end] and other_text, in new_text coordinates."""
+    window = new_text[start:end]
+    if len(window) < min_size or not other_text:
+        return []
+    blocks = []
+    for block in SuffixAutomaton(window).matching_blocks(other_text, min_size):
+        blocks.append({
+            'a_start': block['b_start'] + start,
+            'a_end': block['b_end'] + start,
+            'b_start': block['a_start'],
+            'b_end': block['a_end'],
+            'size': block['size'],
+            'text': block['text'],
+        })
+    return blocks
+
+
+def incremental_compare(diff: TextDiff, new_text: str, other_text: str, old_blocks: List[dict],
+                        min_size: int = MATCH_MIN_SIZE) -> Tuple[float, List[dict], dict]:
+    """
+    Recompute (similarity, blocks) of new_text against other_text from the blocks of the
+    previous text. Returns the result and counters of reused and recomputed work.
+    """
+    margin = min_size
+    zones = _merge_ranges([(max(0, start - margin), min(diff.new_length, end + margin))
+                           for start, end in diff.changed])
+
+    kept = []
+    for block in old_blocks:
+        for old_start, new_start, length in diff.map_range(block['a_start'], block['a_end']):
+            b_start = block['b_start'] + old_start - block['a_start']
+            kept.append({'a_start': new_start, 'a_end': new_start + length, 'b_start': b_start,
+                         'b_end': b_start + length, 'size': length})
+
+    # The margin lets a block that now runs into an edit be found again and joined to its kept part
+    recomputed = []
+    for start, end in zones:
+        recomputed.extend(window_blocks(new_text, start, end, other_text, min_size))
+
+    blocks = _join_diagonal(kept + recomputed)
+    blocks = _trim_overlaps([block for block in blocks if block['size'] >= min_size], new_text, min_size)
+    stats = {
+        'blocks_reused': len(kept),
+        'blocks_recomputed': len(recomputed),
+        'chars_rematched': sum(end - start for start, end in zones),
+    }
+    return block_similarity(blocks, len(new_text), len(other_text)), blocks, stats
+
+
+def incremental_results(old_text: str, new_text: str, candidates: Dict[int, Tuple[str, List[dict]]],
+                        min_size: int = MATCH_MIN_SIZE) -> Tuple[Dict[int, tuple], dict]:
+    """
+    (similarity, blocks) by document id for candidates with results against old_text,
+    given as {document_id: (candidate text, previous blocks)}, plus a reuse summary.
+    """
+    diff = TextDiff(old_text, new_text)
+    results = {}
+    summary = {
+        'unchanged_fraction': diff.unchanged_chars / max(1, diff.new_length),
+        'changed_regions': len(diff.changed),
+        'documents_incremental': 0,
+        'blocks_reused': 0,
+        'blocks_recomputed': 0,
+        'chars_rematched': 0,
+        'chars_total': 0,
+    }
+    for document_id, (other_text, old_blocks) in candidates.items():
+        score, blocks, stats = incremental_compare(diff, new_text, other_text, old_blocks, min_size)
+        results[document_id] = (score, blocks)
+        summary['documents_incremental'] += 1
+        for key, value in stats.items():
+            summary[key] += value
+        summary['chars_total'] += len(new_text)
+    return results, summary
@@ -0,0 +1,117 @@
+"""
+Paginated match results for the document viewer's JSON endpoints.
+Sources are addressed by their rank in the report and their matching blocks by position,
+so the viewer loads a source's blocks only when it is expanded, a page at a time.
+Blocks of a PDF carry the pages and text items they cover (from the page map stored at
+extraction), so the PDF viewer highlights them without searching the document.
+"""
+import os
+from typing import Optional
+
+from src.models import db, Document, SimilarityMatch, MatchingBlock
+from src.services.rendered_view import is_pdf
+from src.services.text_store import get_page_map
+from src.utils.file_extract import page_spans
+
+MATCH_SUMMARY_PAGE_SIZE = int(os.getenv('MATCH_SUMMARY_PAGE_SIZE', '20'))
+MATCH_BLOCK_PAGE_SIZE = int(os.getenv('MATCH_BLOCK_PAGE_SIZE', '50'))
+MATCH_PAGE_SIZE_MAX = int(os.getenv('MATCH_PAGE_SIZE_MAX', '500'))
+
+
+def page_bounds(page: Optional[int], per_page: Optional[int], default_size: int):
+    """Clamp query-string paging to (page, per_page, offset)."""
+    page = max(1, page or 1)
+    per_page = max(1, min(per_page or default_size, MATCH_PAGE_SIZE_MAX))
+    return page, per_page, (page - 1) * per_page
+
+
+def _page(items: list, total: int, page: int, per_page: int, key: str) -> dict:
+    return {
+        key: items,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'next_page': page + 1 if page * per_page < total else None,
+    }
+
+
+def _summary(rank: int, item: dict, block_count: int) -> dict:
+    summary = {
+        'rank': rank,
+        'document_name': item['document_name'],
+        'document_type': item.get('document_type'),
+        'similarity_score': item['similarity_score'],
+        'block_count': block_count,
+    }
+    if item.get('source'):
+        summary['source'] = item['source']
+    if item.get('near_duplicate'):
+        summary['near_duplicate'] = True
+    return summary
+
+
+def _legacy_sources(document: Document) -> Optional[list]:
+    # Results still stored as JSON (see migrate_db.py) are paged in memory
+    if not document.similarity_details:
+        return None
+    return document.get_similarity_details().get('similar_documents', [])
+
+
+def match_summaries(document: Document, page: Optional[int] = None, per_page: Optional[int] = None) -> dict:
+    """One page of the document's sources, most similar first, with their block counts."""
+    page, per_page, offset = page_bounds(page, per_page, MATCH_SUMMARY_PAGE_SIZE)
+    legacy = _legacy_sources(document)
+    if legacy is not None:
+        items = [_summary(rank, item, len(item.get('matching_blocks', [])))
+                 for rank, item in enumerate(legacy[offset:offset + per_page], offset)]
+        return _page(items, len(legacy), page, per_page, 'sources')
+
+    total = SimilarityMatch.query.filter_by(document_id=document.id).count()
+    block_counts = db.select(MatchingBlock.match_id, db.func.count(MatchingBlock.id).label('block_count')) \
+        .group_by(MatchingBlock.match_id).subquery()
+    rows = db.session.query(SimilarityMatch, db.func.coalesce(block_counts.c.block_count, 0)) \
+        .outerjoin(block_counts, block_counts.c.match_id == SimilarityMatch.id) \
+        .filter(SimilarityMatch.document_id == document.id) \
+        .order_by(SimilarityMatch.rank).offset(offset).limit(per_page).all()
+    items = [_summary(match.rank, {
+        'document_name': match.document_name,
+        'document_type': match.document_type,
+        'similarity_score': match.similarity_score,
+        'source': match.source,
+        'near_duplicate': match.near_duplicate,
+    }, block_count) for match, block_count in rows]
+    return _page(items, total, page, per_page, 'sources')
+
+
+def _add_page_spans(document: Document, blocks: list) -> list:
+    page_map = get_page_map(document.content_hash) if is_pdf(document) else None
+    if not page_map:
+        return blocks
+    offsets = [entry[0] for entry in page_map]
+    return [dict(block, spans=page_spans(page_map, block.get('a_start', 0), block.get('a_end', 0), offsets))
+            for block in blocks]
+
+
+def match_blocks(document: Document, rank: int, page: Optional[int] = None,
+                 per_page: Optional[int] = None) -> Optional[dict]:
+    """One page of the matching blocks of the source at rank, or None if there is no such source."""
+    page, per_page, offset = page_bounds(page, per_page, MATCH_BLOCK_PAGE_SIZE)
+    legacy = _legacy_sources(document)
+    if legacy is not None:
+        if not 0 <= rank < len(legacy):
+            return None
+        blocks = legacy[rank].get('matching_blocks', [])
+        result = _page(_add_page_spans(document, blocks[offset:offset + per_page]), len(blocks), page, per_page,
+                       'blocks')
+        result['rank'] = rank
+        return result
+
+    match_id = db.session.query(SimilarityMatch.id).filter_by(document_id=document.id, rank=rank).scalar()
+    if match_id is None:
+        return None
+    query = MatchingBlock.query.filter_by(match_id=match_id)
+    blocks = query.order_by(MatchingBlock.position).offset(offset).limit(per_page).all()
+    result = _page(_add_page_spans(document, [block.to_dict() for block in blocks]), query.count(), page, per_page,
+                   'blocks')
+    result['rank'] = rank
+    return result
@@ -0,0 +1,259 @@
+"""
+Metrics registry for Paperlit.
+Counters and histograms are kept in memory per process and written as a JSON snapshot to
+METRICS_DIR at most every METRICS_FLUSH_SECONDS (and at exit). The /metrics endpoint adds
+up the snapshots of every web and worker process and renders them in the Prometheus
+text format, so one scrape covers the whole deployment. Snapshots of stopped processes
+(a dead pid on this host, or not written for METRICS_SNAPSHOT_MAX_AGE) are deleted when
+they are read, after which their totals drop out as a counter reset.
+"""
+import os
+import json
+import time
+import atexit
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Tuple
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(PROJECT_ROOT, 'instance', 'metrics'))
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+# When set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"; otherwise it only answers localhost
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Seconds after which the snapshot of a process on another host counts as stopped
+METRICS_SNAPSHOT_MAX_AGE = float(os.getenv('METRICS_SNAPSHOT_MAX_AGE', str(24 * 3600)))
+
+# Seconds; stages range from sub-millisecond lookups to minute-long comparisons
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Metric:
+    """A counter or histogram with named labels; values are keyed by label values."""
+
+    def __init__(self, registry: 'Registry', name: str, documentation: str, kind: str,
+                 label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) if kind == 'histogram' else ()
+        # counter: {labels: value}; histogram: {labels: [bucket counts..., sum, count]}
+        self.values = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+            self.registry.dirty = True
+        self.registry.maybe_flush()
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self.registry.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+            self.registry.dirty = True
+        self.registry.maybe_flush()
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+
+class Registry:
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.process_id = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}"
+        self._last_flush = 0.0
+        # Set by updates since the last flush
+        self.dirty = False
+
+    def _register(self, name: str, documentation: str, kind: str, label_names: Iterable[str],
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Metric:
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = Metric(self, name, documentation, kind, tuple(label_names), buckets)
+            return self.metrics[name]
+
+    def counter(self, name: str, documentation: str, label_names: Iterable[str] = ()) -> Metric:
+        return self._register(name, documentation, 'counter', label_names)
+
+    def histogram(self, name: str, documentation: str, label_names: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Metric:
+        return self._register(name, documentation, 'histogram', label_names, buckets)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                name: {
+                    'documentation': metric.documentation,
+                    'kind': metric.kind,
+                    'label_names': list(metric.label_names),
+                    'buckets': list(metric.buckets),
+                    'values': [[list(key), value if metric.kind == 'counter' else list(value)]
+                               for key, value in metric.values.items()],
+                }
+                for name, metric in self.metrics.items()
+            }
+
+    def _path(self) -> str:
+        return os.path.join(self.directory, f"{self.process_id}.json")
+
+    def flush(self) -> None:
+        """
+        Write this process's snapshot atomically if anything changed since the last write,
+        or to keep it from looking stopped.
+        """
+        if not METRICS_ENABLED:
+            return
+        if not self.dirty and time.monotonic() - self._last_flush < METRICS_SNAPSHOT_MAX_AGE / 2:
+            return
+        self._last_flush = time.monotonic()
+        self.dirty = False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, self._path())
+        except OSError:
+            # Metrics must never break a request or an analysis
+            pass
+
+    def maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= METRICS_FLUSH_SECONDS:
+            self.flush()
+
+    def _is_stopped(self, filename: str, path: str) -> bool:
+        """Whether a snapshot file belongs to a process that no longer runs."""
+        try:
+            host, pid, _ = filename[:-len('.json')].rsplit('-', 2)
+            pid = int(pid)
+        except ValueError:
+            return False
+        if host == socket.gethostname():
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+            return False
+        try:
+            return time.time() - os.path.getmtime(path) > METRICS_SNAPSHOT_MAX_AGE
+        except OSError:
+            return False
+
+    def collect(self) -> Dict[str, dict]:
+        """Snapshots of all running processes added together, this process's taken live."""
+        snapshots = [self.snapshot()]
+        own_file = os.path.basename(self._path())
+        if os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.json') or filename == own_file:
+                    continue
+                path = os.path.join(self.directory, filename)
+                try:
+                    if self._is_stopped(filename, path):
+                        os.remove(path)
+                        continue
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        merged = {}
+        for snapshot in snapshots:
+            for name, data in snapshot.items():
+                target = merged.setdefault(name, {**data, 'values': {}})
+                for key, value in data['values']:
+                    key = tuple(key)
+                    if data['kind'] == 'counter':
+                        target['values'][key] = target['values'].get(key, 0.0) + value
+                    else:
+                        current = target['values'].get(key)
+                        target['values'][key] = value if current is None else [a + b for a, b in zip(current, value)]
+        return merged
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, data in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {data['documentation']}")
+            lines.append(f"# TYPE {name} {data['kind']}")
+            for key, value in sorted(data['values'].items()):
+                labels = list(zip(data['label_names'], key))
+                if data['kind'] == 'counter':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                for bound, count in zip(data['buckets'], value):
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + [('le', '+Inf')])} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+STAGE_SECONDS = registry.histogram(
+    'paperlit_stage_seconds', "Time spent in each stage of a pipeline", ('pipeline', 'stage'))
+DOCUMENTS_COMPARED = registry.counter(
+    'paperlit_documents_compared_total', "Candidate documents compared with a new upload", ('method',))
+EXTRACTED_BYTES = registry.counter(
+    'paperlit_extracted_bytes_total', "Bytes of uploaded files read for text extraction", ('file_type',))
+EXTRACTED_CHARS = registry.counter(
+    'paperlit_extracted_chars_total', "Characters of text extracted from uploaded files", ('file_type',))
+UPLOADS = registry.counter('paperlit_uploads_total', "Documents uploaded or replaced", ('kind',))
+ANALYSIS_JOBS = registry.counter('paperlit_analysis_jobs_total', "Finished analysis job attempts", ('outcome',))
+AI_REQUESTS = registry.counter('paperlit_ai_requests_total', "AI similarity checks by outcome", ('outcome',))
+AI_CHUNKS = registry.counter('paperlit_ai_chunks_total', "AI similarity text chunks by source", ('source',))
+
+
+def stage_timer(pipeline: str, stage: str):
+    """Context manager recording the duration of one pipeline stage."""
+    return STAGE_SECONDS.time(pipeline=pipeline, stage=stage)
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+def flush_metrics() -> None:
+    registry.flush()
@@ -0,0 +1,185 @@
+"""
+MinHash near-duplicate detection for Paperlit.
+Each document gets a MinHash signature of its word k-gram set (the same k-grams the
+fingerprint index hashes), stored packed on the document. The signature is cut into
+MINHASH_BANDS bands, and each band's bucket is stored in minhash_bands (LSH banding).
+Documents that share any bucket are candidates. Their Jaccard similarity is estimated
+from the signatures in constant time, and estimates of at least
+MINHASH_NEAR_DUPLICATE_THRESHOLD mark whole-document resubmissions that skip detailed
+block matching. See benchmarks/minhash_lsh.py for the precision/recall trade-off of
+the signature length and band count.
+Signatures are computed with NumPy over all permutations and shingles at once, with exact
+arithmetic modulo the Mersenne prime, so they equal the pure-Python fallback's.
+"""
+import os
+import random
+import struct
+import hashlib
+from typing import Dict, List, Optional
+
+from src.models import db, User, Document, MinHashBand
+from src.services.fingerprint_index import tokenize, kgram_hashes, institution_scope, QUERY_BATCH_SIZE
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+MINHASH_ENABLED = os.getenv('MINHASH_ENABLED', 'true').lower() == 'true'
+MINHASH_PERMUTATIONS = int(os.getenv('MINHASH_PERMUTATIONS', '128'))
+# Must divide MINHASH_PERMUTATIONS (checked below); more bands find less similar pairs (threshold ~ (1/b)^(b/n))
+MINHASH_BANDS = int(os.getenv('MINHASH_BANDS', '16'))
+if MINHASH_BANDS < 1 or MINHASH_PERMUTATIONS % MINHASH_BANDS:
+    # Otherwise band_buckets would silently ignore the permutations left over
+    raise ValueError(f"MINHASH_BANDS ({MINHASH_BANDS}) must be a positive divisor of "
+                     f"MINHASH_PERMUTATIONS ({MINHASH_PERMUTATIONS})")
+MINHASH_NEAR_DUPLICATE_THRESHOLD = float(os.getenv('MINHASH_NEAR_DUPLICATE_THRESHOLD', '0.85'))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Shingles hashed per NumPy pass, bounding the (permutations x shingles) arrays
+SIGNATURE_BATCH_SIZE = 4096
+
+
+def _permutations(count: int) -> List[tuple]:
+    # Fixed seed: stored signatures stay comparable across processes and restarts
+    rnd = random.Random(1729)
+    return [(rnd.randrange(1, _MERSENNE_PRIME), rnd.randrange(0, _MERSENNE_PRIME)) for _ in range(count)]
+
+
+_PERMUTATIONS = _permutations(MINHASH_PERMUTATIONS)
+
+
+def _mod_mersenne(values: 'np.ndarray') -> 'np.ndarray':
+    """values mod 2^61 - 1 for uint64 values, using 2^61 = 1 (mod 2^61 - 1)."""
+    values = (values & _MERSENNE_PRIME) + (values >> np.uint64(61))
+    return np.where(values >= _MERSENNE_PRIME, values - np.uint64(_MERSENNE_PRIME), values)
+
+
+def _mulmod_mersenne(a: 'np.ndarray', x: 'np.ndarray') -> 'np.ndarray':
+    """
+    (a * x) mod 2^61 - 1 for uint64 operands below 2^61, without overflowing 64 bits:
+    the product is split into 32-bit halves, and 2^64 = 8 and 2^61 = 1 fold the high parts back.
+    """
+    low_mask = np.uint64(0xFFFFFFFF)
+    a_high, a_low = a >> np.uint64(32), a & low_mask
+    x_high, x_low = x >> np.uint64(32), x & low_mask
+    high = (a_high * x_high) << np.uint64(3)
+    middle = a_high * x_low + a_low * x_high
+    middle = (middle >> np.uint64(29)) + ((middle & np.uint64((1 << 29) - 1)) << np.uint64(32))
+    low = _mod_mersenne(a_low * x_low)
+    return _mod_mersenne(_mod_mersenne(high + middle) + low)
+
+
+def _signature_numpy(shingles: List[int], permutations: List[tuple]) -> List[int]:
+    a = np.array([a for a, _ in permutations], dtype=np.uint64)[:, None]
+    b = np.array([b for _, b in permutations], dtype=np.uint64)[:, None]
+    values = np.array(shingles, dtype=np.uint64)
+    minimum = np.full(len(permutations), _MERSENNE_PRIME, dtype=np.uint64)
+    for start in range(0, len(values), SIGNATURE_BATCH_SIZE):
+        x = values[None, start:start + SIGNATURE_BATCH_SIZE]
+        hashed = _mod_mersenne(_mulmod_mersenne(a, x) + b)
+        np.minimum(minimum, hashed.min(axis=1), out=minimum)
+    return (minimum & np.uint64(_MAX_HASH)).tolist()
+
+
+def compute_signature(text: str, permutations: Optional[List[tuple]] = None) -> Optional[List[int]]:
+    """MinHash signature (32-bit values) of the word k-gram set of a text, or None if it has none."""
+    permutations = permutations or _PERMUTATIONS
+    shingles = [h % _MERSENNE_PRIME for h in set(kgram_hashes(tokenize(text)))]
+    if not shingles:
+        return None
+    if NUMPY_AVAILABLE:
+        return _signature_numpy(shingles, permutations)
+    return [min((a * x + b) % _MERSENNE_PRIME for x in shingles) & _MAX_HASH for a, b in permutations]
+
+
+def pack_signature(signature: List[int]) -> bytes:
+    return struct.pack(f'<{len(signature)}I', *signature)
+
+
+def unpack_signature(data: Optional[bytes]) -> Optional[List[int]]:
+    if not data:
+        return None
+    return list(struct.unpack(f'<{len(data) // 4}I', data))
+
+
+def estimate_jaccard(signature1: List[int], signature2: List[int]) -> float:
+    """Fraction of equal signature slots, an unbiased estimate of the Jaccard similarity."""
+    if not signature1 or len(signature1) != len(signature2):
+        return 0.0
+    return sum(1 for x, y in zip(signature1, signature2) if x == y) / len(signature1)
+
+
+def band_buckets(signature: List[int], bands: int = MINHASH_BANDS) -> List[int]:
+    """Signed 64-bit bucket of each band of a signature."""
+    rows = len(signature) // bands
+    buckets = []
+    for band in range(bands):
+        data = pack_signature(signature[band * rows:(band + 1) * rows])
+        buckets.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'big', signed=True))
+    return buckets
+
+
+def index_signature(document: Document, signature: Optional[List[int]]) -> None:
+    """Store a document's signature and its band buckets. The caller commits."""
+    MinHashBand.query.filter_by(document_id=document.id).delete(synchronize_session=False)
+    document.minhash_signature = pack_signature(signature) if signature else None
+    if signature:
+        db.session.bulk_insert_mappings(MinHashBand, [
+            {'document_id': document.id, 'band': band, 'bucket': bucket}
+            for band, bucket in enumerate(band_buckets(signature))
+        ])
+
+
+def remove_signature(document_id: int) -> None:
+    """Drop the band buckets of a document before it is deleted."""
+    MinHashBand.query.filter_by(document_id=document_id).delete(synchronize_session=False)
+
+
+def find_near_duplicates(document: Document, signature: Optional[List[int]],
+                         threshold: float = MINHASH_NEAR_DUPLICATE_THRESHOLD) -> Dict[int, float]:
+    """
+    Estimated Jaccard similarity by document id for documents sharing an LSH bucket with
+    the signature, owned by the same user or institution, with estimates of at least threshold.
+    """
+    if not signature:
+        return {}
+    buckets = band_buckets(signature)
+    candidate_ids = {document_id for (document_id,) in db.session.query(MinHashBand.document_id).filter(
+        db.or_(*[db.and_(MinHashBand.band == band, MinHashBand.bucket == bucket)
+                 for band, bucket in enumerate(buckets)]),
+        MinHashBand.document_id != document.id)}
+    if not candidate_ids:
+        return {}
+
+    owner_scope = institution_scope(db.session.query(User.verified_institution)
+                                    .filter(User.id == document.user_id).scalar())
+    near = {}
+    candidate_ids = list(candidate_ids)
+    for start in range(0, len(candidate_ids), QUERY_BATCH_SIZE):
+        rows = db.session.query(Document.id, Document.user_id, Document.minhash_signature,
+                                User.verified_institution) \
+            .join(User, User.id == Document.user_id) \
+            .filter(Document.id.in_(candidate_ids[start:start + QUERY_BATCH_SIZE]))
+        for document_id, user_id, packed, institution in rows:
+            if user_id != document.user_id and (owner_scope is None or institution_scope(institution) != owner_scope):
+                continue
+            estimate = estimate_jaccard(signature, unpack_signature(packed))
+            if estimate >= threshold:
+                near[document_id] = estimate
+    return near
+
+
+def rebuild_minhash_index(load_text) -> dict:
+    """Recompute the signature and band buckets of every document using load_text(document) -> str."""
+    stats = {'indexed': 0, 'empty': 0}
+    for document in Document.query.order_by(Document.id).all():
+        signature = compute_signature(load_text(document) or '')
+        if signature is None:
+            stats['empty'] += 1
+        index_signature(document, signature)
+        db.session.commit()
+        stats['indexed'] += 1
+    return stats
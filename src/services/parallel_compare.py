@@ -0,0 +1,120 @@
+"""
+Opt-in parallel comparison for Paperlit.
+Pairwise comparisons are fanned out to a persistent process pool. All texts are written
+once into a shared memory block and workers decode their slices from it, so large
+strings are not pickled per task. Results come back in the order of the input texts.
+"""
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+from src.services.comparison import PreparedText, compare_texts, get_comparison_stats, merge_comparison_stats
+
+PARALLEL_COMPARE_ENABLED = os.getenv('PARALLEL_COMPARE_ENABLED', 'false').lower() == 'true'
+PARALLEL_COMPARE_WORKERS = int(os.getenv('PARALLEL_COMPARE_WORKERS', str(os.cpu_count() or 1)))
+PARALLEL_COMPARE_MIN_DOCS = int(os.getenv('PARALLEL_COMPARE_MIN_DOCS', '8'))
+# spawn avoids forking a multi-threaded web worker
+PARALLEL_COMPARE_START_METHOD = os.getenv('PARALLEL_COMPARE_START_METHOD', 'spawn')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context(PARALLEL_COMPARE_START_METHOD)
+            _pool = ProcessPoolExecutor(max_workers=PARALLEL_COMPARE_WORKERS, mp_context=context)
+            atexit.register(shutdown_pool)
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def should_compare_in_parallel(document_count: int) -> bool:
+    return (PARALLEL_COMPARE_ENABLED
+            and PARALLEL_COMPARE_WORKERS > 1
+            and document_count >= PARALLEL_COMPARE_MIN_DOCS)
+
+
+def _compare_slices(shm_name: str, new_span: Tuple[int, int], spans: List[Tuple[int, int, int]]) -> tuple:
+    """Worker task: compare the new text with the texts at the given byte spans."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        buffer = shm.buf
+        new_text = PreparedText(bytes(buffer[new_span[0]:new_span[1]]).decode('utf-8'))
+        before = get_comparison_stats()
+        results = []
+        for index, start, end in spans:
+            text = bytes(buffer[start:end]).decode('utf-8')
+            similarity, blocks = compare_texts(new_text, text)
+            results.append((index, similarity, blocks))
+        after = get_comparison_stats()
+        del buffer
+    finally:
+        shm.close()
+    return results, {key: after[key] - before.get(key, 0) for key in after}
+
+
+def _pack_texts(texts: List[str]) -> Tuple[List[bytes], List[Tuple[int, int]]]:
+    encoded = [text.encode('utf-8') for text in texts]
+    spans = []
+    offset = 0
+    for data in encoded:
+        spans.append((offset, offset + len(data)))
+        offset += len(data)
+    return encoded, spans
+
+
+def _balance(spans: List[Tuple[int, int]], task_count: int) -> List[List[Tuple[int, int, int]]]:
+    """Distribute texts over tasks, longest first onto the lightest task."""
+    tasks = [[] for _ in range(task_count)]
+    loads = [0] * task_count
+    order = sorted(range(len(spans)), key=lambda i: spans[i][1] - spans[i][0], reverse=True)
+    for index in order:
+        target = loads.index(min(loads))
+        start, end = spans[index]
+        tasks[target].append((index, start, end))
+        loads[target] += end - start
+    return [task for task in tasks if task]
+
+
+def compare_in_parallel(new_text: str, texts: List[str]) -> List[Tuple[float, List[dict]]]:
+    """Return compare_texts(new_text, text) for every text, computed on the process pool."""
+    if not texts:
+        return []
+
+    encoded, spans = _pack_texts([new_text] + list(texts))
+    total_size = max(1, spans[-1][1])
+    shm = shared_memory.SharedMemory(create=True, size=total_size)
+    try:
+        for data, (start, end) in zip(encoded, spans):
+            shm.buf[start:end] = data
+        del encoded
+
+        pool = _get_pool()
+        text_spans = [(start, end) for start, end in spans[1:]]
+        tasks = _balance(text_spans, PARALLEL_COMPARE_WORKERS * 2)
+        futures = [pool.submit(_compare_slices, shm.name, spans[0], task) for task in tasks]
+
+        results = [(0.0, [])] * len(texts)
+        for future in futures:
+            task_results, stats = future.result()
+            merge_comparison_stats(stats)
+            for index, similarity, blocks in task_results:
+                results[index] = (similarity, blocks)
+        return results
+    finally:
+        shm.close()
+        shm.unlink()
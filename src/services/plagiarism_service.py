@@ -1,11 +1,18 @@
 
-import difflib
 import os
 import hashlib
-from typing import List, Dict, Any
+import logging
+from typing import List, Dict, Any, Callable, Union
+
+from src.services.suffix_matcher import find_common_blocks
+from src.services.comparison import PreparedText, compare_texts, get_comparison_stats
+from src.services.parallel_compare import should_compare_in_parallel, compare_in_parallel
+from src.services.shingle_engine import use_shingle_engine, score_texts
+from src.services.metrics import AI_REQUESTS, DOCUMENTS_COMPARED, stage_timer
+from src.utils.events import log_event
 
 try:
-    import requests
+    from src.services.ai_client import get_ai_client
     REQUESTS_AVAILABLE = True
 except ImportError:
     REQUESTS_AVAILABLE = False
@@ -18,71 +25,36 @@ def find_matching_blocks(text1: str, text2: str, min_size: int = 5) -> List[dict
     if not text1 or not text2:
         return []
 
-    max_length = 10000
-    if len(text1) > max_length:
-        text1 = text1[:max_length]
-    if len(text2) > max_length:
-        text2 = text2[:max_length]
-
-    seq = difflib.SequenceMatcher(None, text1, text2)
-    matching_blocks = []
-
-    for block in seq.get_matching_blocks():
-        a, b, size = block
-        if size >= min_size:
-            matching_blocks.append({
-                'a_start': a,
-                'a_end': a + size,
-                'b_start': b,
-                'b_end': b + size,
-                'size': size,
-                'text': text1[a:a+size]
-            })
-
-    return matching_blocks
+    # Full-length texts: the suffix automaton match is linear, so nothing is truncated
+    return find_common_blocks(text1, text2, min_size)
 
-def calculate_similarity(text1: str, text2: str) -> tuple:
+def calculate_similarity(text1: Union[str, PreparedText], text2: str) -> tuple:
     if not text1 or not text2:
-        print("Warning: One or both texts are empty")
+        log_event('similarity.empty_text', logging.DEBUG)
         return 0.0, []
 
-    max_length = 10000
-    if len(text1) > max_length:
-        text1 = text1[:max_length]
-    if len(text2) > max_length:
-        text2 = text2[:max_length]
-
-    seq = difflib.SequenceMatcher(None, text1, text2)
-    similarity = seq.ratio()
+    # Score and blocks come from the same match pass; clearly unrelated pairs are rejected first
+    similarity, matching_blocks = compare_texts(text1, text2)
 
-    matching_blocks = find_matching_blocks(text1, text2)
-
-    print(f"Similarity between texts: {similarity:.2%}")
+    log_event('similarity.pair', logging.DEBUG, similarity=round(similarity, 4), blocks=len(matching_blocks))
     return similarity, matching_blocks
 
 def check_ai_similarity(text: str) -> List[Dict[str, Any]]:
     if not AI_SIMILARITY_ENABLED or not text:
         return []
 
+    with stage_timer('check_ai_similarity', 'total'):
+        return _check_ai_similarity(text)
+
+def _check_ai_similarity(text: str) -> List[Dict[str, Any]]:
     use_real_api = REQUESTS_AVAILABLE and AI_SIMILARITY_API_KEY != 'demo_key'
 
     if use_real_api:
-        try:
-            response = requests.post(
-                AI_SIMILARITY_ENDPOINT,
-                json={"text": text},
-                headers={"Authorization": f"Bearer {AI_SIMILARITY_API_KEY}"}
-            )
-
-            if response.status_code == 200:
-                return response.json().get("results", [])
-            else:
-                print(f"API error: {response.status_code} - {response.text}")
-                use_real_api = False
-        except Exception as e:
-            print(f"Error calling similarity API: {e}")
-            use_real_api = False
+        results = get_ai_client(AI_SIMILARITY_ENDPOINT, AI_SIMILARITY_API_KEY).check(text)
+        if results is not None:
+            return results
 
+    AI_REQUESTS.inc(outcome='simulated')
     try:
         text_hash = hashlib.md5(text.encode()).hexdigest()
 
@@ -119,29 +91,33 @@ def check_ai_similarity(text: str) -> List[Dict[str, Any]]:
                 'source': source_types[source_idx]
             })
 
-            print(f"AI detected similarity: {similarity_score:.2%} with {source_types[source_idx]}")
+            log_event('ai.simulated_match', similarity=similarity_score, source=source_types[source_idx])
 
         return ai_results
 
     except Exception as e:
-        print(f"Error in AI similarity detection: {e}")
+        log_event('ai.simulation_failed', logging.ERROR, error=str(e))
         return []
 
-def calculate_originality(new_text: str, previous_texts: List[str], doc_names: List[str] = None) -> tuple:
+def calculate_originality(new_text: str, previous_texts: List[str], doc_names: List[str] = None,
+                          progress_callback: Callable[[int, int], None] = None,
+                          doc_ids: List[int] = None, known_results: Dict[int, tuple] = None,
+                          near_duplicates: Dict[int, float] = None, shingle_arrays: List = None) -> tuple:
     if not new_text:
-        print("Warning: New text is empty")
+        log_event('originality.empty_text', logging.WARNING)
         return 1.0, {}
 
-    ai_similarities = check_ai_similarity(new_text)
+    with stage_timer('calculate_originality', 'ai_check'):
+        ai_similarities = check_ai_similarity(new_text)
 
     all_texts = list(previous_texts)
     all_names = list(doc_names) if doc_names else [f"Document {i+1}" for i in range(len(previous_texts))]
 
     if not all_texts and not ai_similarities:
-        print("No texts to compare with")
+        log_event('originality.nothing_to_compare')
         return 1.0, {}
 
-    print(f"Comparing new text ({len(new_text)} chars) with {len(all_texts)} user documents and using AI for published material detection")
+    log_event('originality.start', chars=len(new_text), documents=len(all_texts), ai_matches=len(ai_similarities))
 
     similarity_details = {
         'overall_originality': 1.0,
@@ -149,21 +125,64 @@ def calculate_originality(new_text: str, previous_texts: List[str], doc_names: L
         'similar_documents': []
     }
 
-    for i, (prev_text, doc_name) in enumerate(zip(all_texts, all_names)):
-        sim, matching_blocks = calculate_similarity(new_text, prev_text)
-
+    # (similarity, blocks) by text index that were already computed, e.g. for identical content
+    known_results = known_results or {}
+    # Estimated Jaccard similarity by text index of near-duplicates, which skip block matching
+    near_duplicates = {i: estimate for i, estimate in (near_duplicates or {}).items() if i not in known_results}
+    pending = [i for i in range(len(all_texts)) if i not in known_results and i not in near_duplicates]
+    DOCUMENTS_COMPARED.inc(len(known_results), method='reused')
+    DOCUMENTS_COMPARED.inc(len(near_duplicates), method='near_duplicate')
+    if known_results or near_duplicates:
+        log_event('originality.skipped', reused=len(known_results), near_duplicates=len(near_duplicates))
+
+    results = dict(known_results)
+    results.update((i, (estimate, [])) for i, estimate in near_duplicates.items())
+    if use_shingle_engine() and pending:
+        method = 'shingles'
+    elif should_compare_in_parallel(len(pending)):
+        method = 'parallel'
+    else:
+        method = 'blocks'
+    DOCUMENTS_COMPARED.inc(len(pending), method=method)
+    if pending:
+        log_event('originality.compare', method=method, documents=len(pending))
+
+    with stage_timer('calculate_originality', 'compare'):
+        if method == 'shingles':
+            arrays = [shingle_arrays[i] for i in pending] if shingle_arrays else None
+            results.update(zip(pending, score_texts(new_text, [all_texts[i] for i in pending], arrays)))
+            if progress_callback:
+                progress_callback(len(pending), len(pending))
+        elif method == 'parallel':
+            results.update(zip(pending, compare_in_parallel(new_text, [all_texts[i] for i in pending])))
+            if progress_callback:
+                progress_callback(len(pending), len(pending))
+        else:
+            prepared = PreparedText(new_text)
+            for done, i in enumerate(pending, 1):
+                results[i] = calculate_similarity(prepared, all_texts[i])
+                if progress_callback:
+                    progress_callback(done, len(pending))
+    comparisons = [results[i] for i in range(len(all_texts))]
+
+    for i, ((sim, matching_blocks), doc_name) in enumerate(zip(comparisons, all_names)):
         if sim > 0.01:
             is_published = i >= len(previous_texts)
             doc_type = "Published Material" if is_published else "User Document"
 
-            similarity_details['similar_documents'].append({
+            match = {
                 'document_name': doc_name,
                 'document_type': doc_type,
                 'similarity_score': sim,
                 'matching_blocks': matching_blocks
-            })
+            }
+            if doc_ids:
+                match['document_id'] = doc_ids[i]
+            if i in near_duplicates:
+                match['near_duplicate'] = True
+            similarity_details['similar_documents'].append(match)
 
-        print(f"Similarity with {doc_name}: {sim:.2%}")
+        log_event('originality.document', logging.DEBUG, document=doc_name, similarity=round(sim, 4))
 
     for ai_result in ai_similarities:
         similarity_details['similar_documents'].append(ai_result)
@@ -179,9 +198,11 @@ def calculate_originality(new_text: str, previous_texts: List[str], doc_names: L
             similarity_details['ai_detected_similarities'] = ai_count
             similarity_details['ai_similarity_sources'] = [item['source'] for item in ai_similarities]
 
-    print(f"Maximum similarity: {similarity_details['max_similarity']:.2%}")
-    print(f"Originality score: {similarity_details['overall_originality']:.2%}")
-    if ai_similarities:
-        print(f"AI detected {len(ai_similarities)} similarities with published materials")
+    log_event('originality.result',
+              originality=round(similarity_details['overall_originality'], 4),
+              max_similarity=round(similarity_details['max_similarity'], 4),
+              matches=len(similarity_details['similar_documents']),
+              ai_matches=len(ai_similarities),
+              cascade=get_comparison_stats())
 
     return similarity_details['overall_originality'], similarity_details
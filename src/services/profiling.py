@@ -0,0 +1,160 @@
+"""
+On-demand profiling of requests and analysis jobs for Paperlit.
+A request is run under cProfile when an admin (users.is_admin, granted with
+`maintenance.py grant-admin`) sends the X-Paperlit-Profile header or the ?profile=1 query
+parameter, or when it is sampled (PROFILE_SAMPLE_RATE of the requests to
+PROFILE_SAMPLE_ENDPOINTS). The analysis job queued by a profiled upload is profiled as well,
+since that is where an upload spends most of its time. Profiles are stored in the
+request_profiles table with the request metadata and listed on /admin/profiles.
+With PROFILING_ENABLED=false the request hooks are not installed at all.
+"""
+import io
+import os
+import time
+import random
+import marshal
+import pstats
+import cProfile
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import g, request, session
+
+from src.models import db, RequestProfile, User
+from src.utils.events import log_event
+
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_SAMPLE_ENDPOINTS = {name.strip() for name in
+                            os.getenv('PROFILE_SAMPLE_ENDPOINTS', 'plagiarism.upload_document').split(',')
+                            if name.strip()}
+PROFILE_HEADER = 'X-Paperlit-Profile'
+PROFILE_QUERY_PARAMETER = 'profile'
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+PROFILE_SUMMARY_LINES = int(os.getenv('PROFILE_SUMMARY_LINES', '60'))
+
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'true').lower() == 'true'
+
+
+def is_profile_admin(user_id: Optional[int]) -> bool:
+    """Admin rights come from the user's row, never from the (user-chosen) username."""
+    if not user_id:
+        return False
+    return bool(db.session.query(User.is_admin).filter(User.id == user_id).scalar())
+
+
+def _sampled(endpoint: Optional[str]) -> bool:
+    return PROFILE_SAMPLE_RATE > 0 and endpoint in PROFILE_SAMPLE_ENDPOINTS and random.random() < PROFILE_SAMPLE_RATE
+
+
+def request_trigger() -> Optional[str]:
+    """Why the current request should be profiled ('flag' or 'sampled'), or None."""
+    flagged = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_PARAMETER)
+    if flagged and flagged != '0' and is_profile_admin(session.get('user_id')):
+        return 'flag'
+    if _sampled(request.endpoint):
+        return 'sampled'
+    return None
+
+
+def job_trigger(job) -> Optional[str]:
+    """Why an analysis job should be profiled ('upload' or 'sampled'), or None."""
+    if job.profile_requested:
+        return 'upload'
+    if _sampled('analysis_job'):
+        return 'sampled'
+    return None
+
+
+def is_request_profiled() -> bool:
+    return g.get('profile_trigger') is not None
+
+
+def _start() -> Optional[cProfile.Profile]:
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active (one at a time per process on newer Pythons)
+        return None
+    return profiler
+
+
+def save_profile(profiler: cProfile.Profile, duration: float, **metadata) -> None:
+    """Store a finished profile and drop the oldest ones beyond PROFILE_KEEP."""
+    stats = pstats.Stats(profiler)
+    summary = io.StringIO()
+    stats.stream = summary
+    stats.sort_stats('cumulative').print_stats(PROFILE_SUMMARY_LINES)
+
+    values = dict(metadata, duration_ms=duration * 1000, summary=summary.getvalue(),
+                  stats=marshal.dumps(stats.stats))
+    if values.get('path'):
+        values['path'] = values['path'][:500]
+    table = RequestProfile.__table__
+    # A connection of its own, so the request's session state is left alone
+    with db.engine.begin() as conn:
+        conn.execute(table.insert().values(**values))
+        cutoff = conn.execute(db.select(table.c.id).order_by(table.c.id.desc())
+                              .offset(PROFILE_KEEP).limit(1)).scalar()
+        if cutoff is not None:
+            conn.execute(table.delete().where(table.c.id <= cutoff))
+    log_event('profile.saved', kind=values.get('kind'), endpoint=values.get('endpoint'),
+              trigger=values.get('trigger'), duration_ms=round(values['duration_ms'], 1))
+
+
+@contextmanager
+def profiled(trigger: Optional[str], **metadata):
+    """
+    Profile the enclosed block when trigger is set. Yields a dict the caller can add
+    metadata to (e.g. the outcome) before the profile is stored.
+    """
+    profiler = _start() if trigger else None
+    if profiler is None:
+        yield metadata
+        return
+    started = time.perf_counter()
+    try:
+        yield metadata
+    finally:
+        profiler.disable()
+        try:
+            save_profile(profiler, time.perf_counter() - started, trigger=trigger, **metadata)
+        except Exception as e:
+            log_event('profile.save_failed', error=str(e))
+
+
+def _finish_request(status_code: int) -> None:
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return
+    profiler.disable()
+    try:
+        save_profile(profiler, time.perf_counter() - g.pop('profile_started'), kind='request',
+                     endpoint=request.endpoint, method=request.method, path=request.full_path.rstrip('?'),
+                     user_id=session.get('user_id'), username=session.get('user'),
+                     trigger=g.get('profile_trigger'), status_code=status_code)
+    except Exception as e:
+        log_event('profile.save_failed', error=str(e))
+
+
+def install_request_profiling(app) -> None:
+    """Register the request hooks, if profiling is configured at all."""
+    if not PROFILING_ENABLED:
+        return
+
+    @app.before_request
+    def start_request_profile():
+        g.profile_trigger = request_trigger()
+        if g.profile_trigger:
+            g.profiler = _start()
+            g.profile_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_profile(response):
+        _finish_request(response.status_code)
+        return response
+
+    @app.teardown_request
+    def finish_failed_request_profile(error):
+        # after_request is skipped when the view raised
+        _finish_request(500)
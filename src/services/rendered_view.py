@@ -0,0 +1,120 @@
+"""
+Cached document views for Paperlit.
+The highlighted text is rendered once, when an analysis is saved, and stored in
+rendered_views. view_document serves it without loading the matching blocks, and the page
+fetches the list of similar documents a page at a time (see match_pages.py). Saving new
+results (set_similarity_details) drops the cached view, and a view built from other text
+or by an older renderer is rebuilt on first use.
+"""
+import heapq
+import os
+from typing import List, Optional, Tuple
+
+from markupsafe import escape
+from sqlalchemy.exc import IntegrityError
+
+from src.models import db, Document, RenderedView
+from src.services.text_store import get_document_text
+from src.utils.file_extract import EXTRACTOR_VERSION
+from src.utils.events import log_event
+
+RENDER_VERSION = "2"
+
+
+def _render_version() -> str:
+    # Block positions refer to the extracted text, so a new extractor means a new rendering
+    return f"{RENDER_VERSION}/{EXTRACTOR_VERSION}"
+
+
+def highlight_class(item: dict) -> str:
+    strength = '-strong' if item.get('similarity_score', 0) > 0.5 else ''
+    if item.get('document_type') == 'Published Material':
+        return f"highlight-published{strength}"
+    return f"highlight-user{strength}"
+
+
+def highlight_spans(text_length: int, similar_documents: List[dict]) -> List[Tuple[int, int, int]]:
+    """
+    Non-overlapping (start, end, source index) spans covering every matching block.
+    Where blocks of several sources overlap, the most similar source wins.
+    """
+    intervals = []
+    for index, item in enumerate(similar_documents):
+        for block in item.get('matching_blocks') or []:
+            start = max(0, min(block.get('a_start', 0), text_length))
+            end = max(start, min(block.get('a_end', 0), text_length))
+            if end > start:
+                intervals.append((start, end, index))
+    if not intervals:
+        return []
+    intervals.sort()
+    boundaries = sorted({position for start, end, _ in intervals for position in (start, end)})
+    scores = [item.get('similarity_score', 0) for item in similar_documents]
+
+    spans = []
+    active = []
+    next_interval = 0
+    for position, following in zip(boundaries, boundaries[1:]):
+        while next_interval < len(intervals) and intervals[next_interval][0] <= position:
+            start, end, index = intervals[next_interval]
+            heapq.heappush(active, (-scores[index], index, end))
+            next_interval += 1
+        while active and active[0][2] <= position:
+            heapq.heappop(active)
+        if not active:
+            continue
+        index = active[0][1]
+        if spans and spans[-1][2] == index and spans[-1][1] == position:
+            spans[-1] = (spans[-1][0], following, index)
+        else:
+            spans.append((position, following, index))
+    return spans
+
+
+def highlight_html(text: str, similar_documents: List[dict]) -> str:
+    """Escaped text with a span per highlighted region (data-source is the index in similar_documents)."""
+    classes = [highlight_class(item) for item in similar_documents]
+    parts = []
+    position = 0
+    for start, end, index in highlight_spans(len(text), similar_documents):
+        parts.append(str(escape(text[position:start])))
+        parts.append(f'<span class="{classes[index]}" data-source="{index}">{escape(text[start:end])}</span>')
+        position = end
+    parts.append(str(escape(text[position:])))
+    return ''.join(parts)
+
+
+def is_pdf(document: Document) -> bool:
+    return os.path.splitext(document.file_path or '')[1].lower() == '.pdf'
+
+
+def build_rendered_view(document: Document, text: str, details: Optional[dict]) -> RenderedView:
+    """Render and store (without committing) the view of a document's current results."""
+    similar_documents = (details or {}).get('similar_documents', [])
+    view = db.session.merge(RenderedView(
+        document_id=document.id,
+        content_hash=document.content_hash,
+        render_version=_render_version(),
+        text_html='' if is_pdf(document) else highlight_html(text or '', similar_documents),
+        match_count=len(similar_documents),
+        ai_detected_similarities=(details or {}).get('ai_detected_similarities', 0),
+    ))
+    log_event('rendered_view.built', document_id=document.id, matches=len(similar_documents),
+              html_chars=len(view.text_html))
+    return view
+
+
+def get_rendered_view(document: Document, file_path: Optional[str] = None) -> RenderedView:
+    """The cached view of a document, built (and stored) first if it is missing or out of date."""
+    view = db.session.get(RenderedView, document.id)
+    if view is not None and view.render_version == _render_version() and view.content_hash == document.content_hash:
+        return view
+
+    text = '' if is_pdf(document) else get_document_text(document, file_path)
+    view = build_rendered_view(document, text, document.get_similarity_details())
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Built concurrently by the analysis worker; this copy is still good to serve
+        db.session.rollback()
+    return view
@@ -0,0 +1,282 @@
+"""
+Content-addressed upload storage for Paperlit.
+Uploads are hashed while they stream to disk and stored once per content as
+UPLOAD_FOLDER/blobs/<aa>/<bb>/<sha256><ext>. Document.file_path holds that storage key,
+which is the single location every reader resolves, and the blobs table counts the
+documents that reference each file so it is only deleted once nothing points to it.
+A blob's row is locked (by updating it) before its file is written or deleted, so an
+upload of the same content never loses its file to a concurrent release.
+Older rows may still hold bare filenames, absolute paths or per-user keys;
+`python maintenance.py reconcile-storage` moves those files into the blob store.
+"""
+import os
+import hashlib
+import logging
+import tempfile
+from typing import NamedTuple, Optional
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+from src.models import db, Document, Blob
+from src.utils.events import log_event
+
+# Until reconcile-storage has run, also look for legacy files in the old upload directories
+STORAGE_LEGACY_FALLBACK = os.getenv('STORAGE_LEGACY_FALLBACK', 'true').lower() == 'true'
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+LEGACY_UPLOAD_DIRS = [
+    os.path.join(PROJECT_ROOT, 'uploads'),
+    os.path.join(PROJECT_ROOT, 'src', 'uploads'),
+]
+
+BLOB_PREFIX = 'blobs'
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Extensions kept on blob keys (the ones text can be extracted from); others are dropped
+ALLOWED_EXTENSIONS = {'.txt', '.pdf'}
+
+
+class StoredFile(NamedTuple):
+    storage_key: str
+    path: str
+    content_hash: str
+    size: int
+
+
+def get_upload_folder() -> str:
+    return current_app.config['UPLOAD_FOLDER']
+
+
+def blob_key(content_hash: str, ext: str) -> str:
+    return f"{BLOB_PREFIX}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{ext.lower()}"
+
+
+def blob_extension(filename: Optional[str]) -> str:
+    """Extension of a client-supplied filename for its blob key, or '' if it is not allowed."""
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return ext if ext in ALLOWED_EXTENSIONS else ''
+
+
+def is_blob_key(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith(BLOB_PREFIX + '/')
+
+
+def is_storage_key(value: Optional[str]) -> bool:
+    return bool(value) and not os.path.isabs(value) and '/' in value and '..' not in value.split('/')
+
+
+def key_to_path(key: str, upload_folder: Optional[str] = None) -> str:
+    return os.path.join(upload_folder or get_upload_folder(), *key.split('/'))
+
+
+def display_filename(document: Document) -> str:
+    """Filename to offer on download."""
+    if document.original_filename:
+        return document.original_filename
+    filename = os.path.basename(document.file_path or '')
+    if is_storage_key(document.file_path) and not is_blob_key(document.file_path) and '_' in filename:
+        # Per-user key "<user_id>/<token>_<filename>"
+        filename = filename.split('_', 1)[1]
+    return filename
+
+
+def _store_stream(stream, ext: str, upload_folder: str) -> StoredFile:
+    """
+    Copy a binary stream into the blob store, hashing it on the way, and count the
+    reference. The blob's row is updated before the file is put in place, so a release
+    of the same blob either finishes first or sees the new reference. The caller commits.
+    """
+    tmp_dir = os.path.join(upload_folder, BLOB_PREFIX, 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: stream.read(STREAM_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+
+        content_hash = digest.hexdigest()
+        key = blob_key(content_hash, ext)
+        stored = StoredFile(key, key_to_path(key, upload_folder), content_hash, size)
+        acquire_blob(stored)
+        os.makedirs(os.path.dirname(stored.path), exist_ok=True)
+        # Replacing an existing blob is harmless (same bytes) and guarantees it exists
+        os.replace(tmp_path, stored.path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return stored
+
+
+def acquire_blob(stored: StoredFile) -> None:
+    """Count one more reference to a blob, locking its row. Runs in the caller's transaction."""
+    updated = Blob.query.filter_by(storage_key=stored.storage_key) \
+        .update({'ref_count': Blob.ref_count + 1}, synchronize_session=False)
+    if updated:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(Blob(storage_key=stored.storage_key, content_hash=stored.content_hash,
+                                size=stored.size, ref_count=1))
+    except IntegrityError:
+        # Another upload of the same content created the row first
+        Blob.query.filter_by(storage_key=stored.storage_key) \
+            .update({'ref_count': Blob.ref_count + 1}, synchronize_session=False)
+
+
+def save_upload(file_storage) -> StoredFile:
+    """Stream an uploaded file into the blob store and count the reference. The caller commits."""
+    return save_stream(file_storage.stream, file_storage.filename)
+
+
+def save_stream(stream, filename: Optional[str]) -> StoredFile:
+    """Like save_upload, for any binary stream (e.g. a member of an uploaded archive)."""
+    return _store_stream(stream, blob_extension(filename), get_upload_folder())
+
+
+def _legacy_candidates(stored_path: str, upload_folder: str) -> list:
+    stored_path = stored_path.replace('src/src', 'src')
+    filename = os.path.basename(stored_path)
+    candidates = [stored_path] if os.path.isabs(stored_path) else [os.path.join(upload_folder, stored_path)]
+    candidates += [os.path.join(directory, filename) for directory in [upload_folder] + LEGACY_UPLOAD_DIRS]
+    return candidates
+
+
+def resolve_key(file_path: Optional[str], upload_folder: Optional[str] = None) -> Optional[str]:
+    """Absolute path of a stored file, or None if it is missing."""
+    if not file_path:
+        return None
+    upload_folder = upload_folder or get_upload_folder()
+
+    if is_storage_key(file_path):
+        path = key_to_path(file_path, upload_folder)
+        if os.path.exists(path):
+            return path
+
+    if STORAGE_LEGACY_FALLBACK and not is_blob_key(file_path):
+        return next((p for p in _legacy_candidates(file_path, upload_folder) if os.path.isfile(p)), None)
+    return None
+
+
+def resolve_path(document: Document, upload_folder: Optional[str] = None) -> Optional[str]:
+    """Absolute path of a document's file, or None if it is missing."""
+    path = resolve_key(document.file_path, upload_folder)
+    if path is None and document.file_path:
+        log_event('storage.file_not_found', logging.WARNING, document_id=document.id, file_path=document.file_path)
+    return path
+
+
+def _remove(path: Optional[str]) -> bool:
+    if not path:
+        return False
+    try:
+        os.remove(path)
+        log_event('storage.file_deleted', path=path)
+        return True
+    except OSError as e:
+        log_event('storage.delete_failed', logging.ERROR, path=path, error=str(e))
+        return False
+
+
+def release_file(file_path: Optional[str]) -> bool:
+    """
+    Drop one reference to a stored file once the document that used it has been changed
+    or deleted and committed. A blob is removed when no document references it any more;
+    a legacy file is removed directly. Returns True if a file was deleted.
+    """
+    if not file_path:
+        return False
+    if not is_blob_key(file_path):
+        return _remove(resolve_key(file_path))
+
+    # The decrement locks the row until the commit, so a concurrent upload of the same
+    # content waits for the file to be gone and then writes it again
+    Blob.query.filter_by(storage_key=file_path) \
+        .update({'ref_count': Blob.ref_count - 1}, synchronize_session=False)
+    deleted = Blob.query.filter(Blob.storage_key == file_path, Blob.ref_count <= 0) \
+        .delete(synchronize_session=False)
+    removed = _remove(resolve_key(file_path)) if deleted else False
+    db.session.commit()
+    return removed
+
+
+def reconcile_storage(dry_run: bool = False) -> dict:
+    """
+    Move the files of documents outside the blob store into it, then recount blob
+    references and drop unreferenced blobs. Files that cannot be found directly are
+    searched for once by name across the upload directories.
+    """
+    upload_folder = os.path.abspath(get_upload_folder())
+    upload_dirs = [upload_folder] + LEGACY_UPLOAD_DIRS
+    stats = {'canonical': 0, 'stored': 0, 'missing': 0, 'ref_counts_fixed': 0, 'orphans_removed': 0}
+
+    name_index = None
+    ingested = set()
+    for document in Document.query.order_by(Document.id).all():
+        if is_blob_key(document.file_path) and os.path.exists(key_to_path(document.file_path, upload_folder)):
+            stats['canonical'] += 1
+            continue
+
+        source = None
+        if document.file_path and not is_blob_key(document.file_path):
+            source = next((p for p in _legacy_candidates(document.file_path, upload_folder) if os.path.isfile(p)), None)
+            if source is None:
+                if name_index is None:
+                    name_index = {}
+                    for root_dir in upload_dirs:
+                        for root, _, files in os.walk(root_dir):
+                            for filename in files:
+                                name_index.setdefault(filename, os.path.join(root, filename))
+                source = name_index.get(os.path.basename(document.file_path))
+
+        if source is None:
+            print(f"Missing file for document {document.id}: {document.file_path}")
+            stats['missing'] += 1
+            continue
+
+        stats['stored'] += 1
+        if dry_run:
+            print(f"Document {document.id}: {document.file_path} -> blob store")
+            continue
+
+        with open(source, 'rb') as f:
+            stored = _store_stream(f, blob_extension(source), upload_folder)
+        print(f"Document {document.id}: {document.file_path} -> {stored.storage_key}")
+        document.original_filename = display_filename(document)
+        document.file_path = stored.storage_key
+        document.content_hash = document.content_hash or stored.content_hash
+        db.session.commit()
+        ingested.add(os.path.abspath(source))
+
+    if dry_run:
+        return stats
+
+    # The sources now live in the blob store; only files inside upload directories are removed
+    for source in ingested:
+        if any(source.startswith(os.path.join(d, '')) for d in upload_dirs) and os.path.exists(source):
+            _remove(source)
+
+    counts = dict(db.session.query(Document.file_path, db.func.count(Document.id))
+                  .filter(Document.file_path.like(BLOB_PREFIX + '/%')).group_by(Document.file_path))
+    orphans = []
+    for blob in Blob.query.all():
+        count = counts.get(blob.storage_key, 0)
+        if count == 0:
+            orphans.append(blob.storage_key)
+            db.session.delete(blob)
+        elif blob.ref_count != count:
+            blob.ref_count = count
+            stats['ref_counts_fixed'] += 1
+    # As in release_file, files go while their deleted rows are still locked
+    db.session.flush()
+    for key in orphans:
+        _remove(key_to_path(key, upload_folder))
+        stats['orphans_removed'] += 1
+    db.session.commit()
+
+    return stats
@@ -0,0 +1,175 @@
+"""
+Linear-time text matching for Paperlit based on a suffix automaton.
+The automaton of one text is built in O(n); streaming the other text through it yields,
+for every position, the longest substring ending there that also occurs in the first
+text, which gives all maximal common substrings without truncating either document.
+"""
+import os
+from typing import List
+
+MATCH_MIN_SIZE = int(os.getenv('MATCH_MIN_SIZE', '30'))
+
+
+class SuffixAutomaton:
+    """Suffix automaton of a text, recording the first end position of every state."""
+
+    __slots__ = ('text', 'link', 'length', 'first_end', 'transitions')
+
+    def __init__(self, text: str):
+        self.text = text
+        link = [-1]
+        length = [0]
+        first_end = [-1]
+        transitions = [{}]
+        last = 0
+
+        for i, char in enumerate(text):
+            current = len(length)
+            length.append(length[last] + 1)
+            link.append(0)
+            first_end.append(i)
+            transitions.append({})
+
+            state = last
+            while state != -1 and char not in transitions[state]:
+                transitions[state][char] = current
+                state = link[state]
+
+            if state != -1:
+                target = transitions[state][char]
+                if length[state] + 1 == length[target]:
+                    link[current] = target
+                else:
+                    clone = len(length)
+                    length.append(length[state] + 1)
+                    link.append(link[target])
+                    first_end.append(first_end[target])
+                    transitions.append(dict(transitions[target]))
+                    while state != -1 and transitions[state].get(char) == target:
+                        transitions[state][char] = clone
+                        state = link[state]
+                    link[target] = clone
+                    link[current] = clone
+            last = current
+
+        self.link = link
+        self.length = length
+        self.first_end = first_end
+        self.transitions = transitions
+
+    def matching_blocks(self, other: str, min_size: int = MATCH_MIN_SIZE) -> List[dict]:
+        """
+        Return the maximal common substrings of at least min_size characters, in the
+        block format of find_matching_blocks. 'a' positions refer to other and 'b'
+        positions to the automaton's text; blocks never overlap in other.
+        """
+        transitions = self.transitions
+        link = self.link
+        length = self.length
+        first_end = self.first_end
+        blocks = []
+        covered = 0
+
+        def emit(a_end, state, size):
+            nonlocal covered
+            if size < min_size:
+                return
+            a_start = a_end - size
+            b_start = first_end[state] + 1 - size
+            if a_start < covered:
+                shift = covered - a_start
+                a_start += shift
+                b_start += shift
+                size -= shift
+                if size < min_size:
+                    return
+            blocks.append({
+                'a_start': a_start,
+                'a_end': a_end,
+                'b_start': b_start,
+                'b_end': b_start + size,
+                'size': size,
+                'text': other[a_start:a_end]
+            })
+            covered = a_end
+
+        state = 0
+        size = 0
+        for i, char in enumerate(other):
+            next_state = transitions[state].get(char)
+            if next_state is not None:
+                state = next_state
+                size += 1
+                continue
+
+            emit(i, state, size)
+            while state and char not in transitions[state]:
+                state = link[state]
+            next_state = transitions[state].get(char)
+            if next_state is not None:
+                size = length[state] + 1
+                state = next_state
+            else:
+                size = 0
+
+        emit(len(other), state, size)
+        return blocks
+
+
+def swap_sides(blocks: List[dict], text: str, min_size: int = MATCH_MIN_SIZE) -> List[dict]:
+    """
+    Blocks of SuffixAutomaton(text).matching_blocks() with 'a' and 'b' swapped, so 'a'
+    positions refer to text. They are ordered by position in text and cut where they
+    overlap there, as matching_blocks does for its own 'a' side.
+    """
+    result = []
+    covered = 0
+    for block in sorted(blocks, key=lambda b: (b['b_start'], -b['size'])):
+        a_start, a_end, b_start, size = block['b_start'], block['b_end'], block['a_start'], block['size']
+        if a_end <= covered:
+            continue
+        if a_start < covered:
+            shift = covered - a_start
+            if size - shift < min_size:
+                continue
+            a_start += shift
+            b_start += shift
+            size -= shift
+        result.append({
+            'a_start': a_start,
+            'a_end': a_end,
+            'b_start': b_start,
+            'b_end': b_start + size,
+            'size': size,
+            'text': text[a_start:a_end]
+        })
+        covered = a_end
+    return result
+
+
+def find_common_blocks(text1: str, text2: str, min_size: int = MATCH_MIN_SIZE) -> List[dict]:
+    """Maximal common substrings of text1 and text2 ('a' = text1, 'b' = text2)."""
+    if not text1 or not text2:
+        return []
+    return SuffixAutomaton(text2).matching_blocks(text1, min_size)
+
+
+def block_similarity(blocks: List[dict], len1: int, len2: int) -> float:
+    """
+    Similarity in the style of SequenceMatcher.ratio(): 2 * matched / total length.
+    Matched characters are capped by the distinct coverage of text2, so a passage copied
+    several times cannot push the score above 1.
+    """
+    if not len1 or not len2:
+        return 0.0
+
+    matched_a = sum(block['size'] for block in blocks)
+    covered_b = 0
+    current_end = -1
+    for start, end in sorted((block['b_start'], block['b_end']) for block in blocks):
+        if end <= current_end:
+            continue
+        covered_b += end - max(start, current_end)
+        current_end = end
+
+    return 2.0 * min(matched_a, covered_b) / (len1 + len2)
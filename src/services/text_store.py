@@ -0,0 +1,144 @@
+"""
+Extracted-text store for Paperlit.
+Text is extracted once per distinct file content (SHA-256) and read back from the
+database afterwards, so comparisons and page views never re-parse the upload.
+"""
+import os
+from typing import Callable, List, Optional, Tuple
+
+from src.models import db, Document, ExtractedText
+from src.utils.file_extract import extract_text_with_page_map, compute_file_hash, unpack_page_map, EXTRACTOR_VERSION
+from src.utils.events import log_event
+from src.services.metrics import EXTRACTED_BYTES, EXTRACTED_CHARS
+
+
+def store_file_text(file_path: str, content_hash: Optional[str] = None) -> Tuple[str, str]:
+    """Return (content_hash, text) for a file, extracting and storing it only when needed."""
+    if content_hash is None:
+        content_hash = compute_file_hash(file_path)
+
+    entry = db.session.get(ExtractedText, content_hash)
+    if entry and entry.extractor_version == EXTRACTOR_VERSION:
+        return content_hash, entry.text
+
+    text, page_map = extract_text_with_page_map(file_path)
+    return content_hash, store_text(content_hash, text, file_path, page_map)
+
+
+def has_current_text(content_hash: str) -> bool:
+    """Whether the text of this content is stored and was produced by the current extractor."""
+    entry = db.session.get(ExtractedText, content_hash)
+    return entry is not None and entry.extractor_version == EXTRACTOR_VERSION
+
+
+def store_text(content_hash: str, text: str, file_path: str, page_map: Optional[bytes] = None) -> str:
+    """Store text (and PDF page map) extracted from file_path, e.g. by a worker process, under its content hash."""
+    file_type = os.path.splitext(file_path)[1].lower().lstrip('.') or 'unknown'
+    EXTRACTED_BYTES.inc(os.path.getsize(file_path) if os.path.exists(file_path) else 0, file_type=file_type)
+    EXTRACTED_CHARS.inc(len(text), file_type=file_type)
+    entry = db.session.get(ExtractedText, content_hash)
+    if entry is None:
+        entry = ExtractedText(content_hash=content_hash)
+        db.session.add(entry)
+    entry.extractor_version = EXTRACTOR_VERSION
+    entry.text = text
+    entry.char_count = len(text)
+    entry.shingles = None
+    entry.page_map = page_map
+    db.session.commit()
+    log_event('text_store.stored', content_hash=content_hash[:12], chars=len(text))
+    return text
+
+
+def get_document_text(document: Document, file_path: Optional[str] = None) -> str:
+    """
+    Return the stored text for a document.
+    Legacy documents without a content hash, and texts produced by an older extractor,
+    are (re-)extracted from file_path when it is given.
+    """
+    entry = db.session.get(ExtractedText, document.content_hash) if document.content_hash else None
+    if entry and (entry.extractor_version == EXTRACTOR_VERSION or not file_path):
+        return entry.text
+
+    if not file_path or not os.path.exists(file_path):
+        return entry.text if entry else ""
+
+    content_hash, text = store_file_text(file_path)
+    if document.content_hash != content_hash:
+        old_hash = document.content_hash
+        document.content_hash = content_hash
+        db.session.commit()
+        release_text(old_hash)
+    return text
+
+
+def get_page_map(content_hash: Optional[str]) -> Optional[List[Tuple[int, int, int]]]:
+    """
+    The (offset, page, text item) map of a stored PDF text, or None (not a PDF, or extracted by an
+    older extractor, whose item numbers may be off; rebuild-text-store brings those up to date).
+    """
+    if not content_hash:
+        return None
+    packed = db.session.query(ExtractedText.page_map) \
+        .filter_by(content_hash=content_hash, extractor_version=EXTRACTOR_VERSION).scalar()
+    return unpack_page_map(packed) if packed else None
+
+
+def release_text(content_hash: Optional[str], exclude_document_id: Optional[int] = None) -> bool:
+    """Delete a stored text once no document references its content hash. Returns True if deleted."""
+    if not content_hash:
+        return False
+
+    query = Document.query.filter(Document.content_hash == content_hash)
+    if exclude_document_id is not None:
+        query = query.filter(Document.id != exclude_document_id)
+    if query.first() is not None:
+        return False
+
+    entry = db.session.get(ExtractedText, content_hash)
+    if entry is None:
+        return False
+    db.session.delete(entry)
+    db.session.commit()
+    log_event('text_store.released', content_hash=content_hash[:12])
+    return True
+
+
+def rebuild_text_store(resolve_path: Callable[[Document], Optional[str]], force: bool = False) -> dict:
+    """
+    Re-extract the text of every document and drop texts nothing references.
+    Without force only missing or outdated entries are extracted again.
+    """
+    stats = {'extracted': 0, 'reused': 0, 'missing_files': 0, 'orphans_removed': 0}
+
+    for document in Document.query.order_by(Document.id).all():
+        file_path = resolve_path(document)
+        if not file_path:
+            stats['missing_files'] += 1
+            continue
+
+        content_hash = compute_file_hash(file_path)
+        entry = db.session.get(ExtractedText, content_hash)
+        if force and entry is not None:
+            db.session.delete(entry)
+            db.session.commit()
+            entry = None
+
+        if entry is not None and entry.extractor_version == EXTRACTOR_VERSION:
+            stats['reused'] += 1
+        else:
+            store_file_text(file_path, content_hash)
+            stats['extracted'] += 1
+
+        if document.content_hash != content_hash:
+            document.content_hash = content_hash
+            db.session.commit()
+
+    referenced = {h for (h,) in db.session.query(Document.content_hash).filter(Document.content_hash.isnot(None))}
+    for entry in ExtractedText.query.all():
+        if entry.content_hash not in referenced:
+            db.session.delete(entry)
+            stats['orphans_removed'] += 1
+    db.session.commit()
+
+    return stats
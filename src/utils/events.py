@@ -0,0 +1,39 @@
+"""
+Structured log events for Paperlit.
+Hot paths log one JSON object per line on the 'paperlit.events' logger instead of free
+text, e.g. {"ts": ..., "level": "info", "event": "analysis.candidates", "selected": 12}.
+"""
+import os
+import sys
+import json
+import time
+import logging
+
+LOG_EVENTS_LEVEL = os.getenv('LOG_EVENTS_LEVEL', 'INFO').upper()
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """Writes to the current sys.stdout, so redirecting it (as the benchmarks do) also captures events."""
+
+    def emit(self, record):
+        self.stream = sys.stdout
+        super().emit(record)
+
+
+logger = logging.getLogger('paperlit.events')
+if not logger.handlers:
+    _handler = _StdoutHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(getattr(logging, LOG_EVENTS_LEVEL, logging.INFO))
+    # Already one JSON line per event; the root handler would prefix it again
+    logger.propagate = False
+
+
+def log_event(event: str, level: int = logging.INFO, **fields) -> None:
+    """Log an event with its fields as one JSON line."""
+    if not logger.isEnabledFor(level):
+        return
+    record = {'ts': round(time.time(), 3), 'level': logging.getLevelName(level).lower(), 'event': event}
+    record.update(fields)
+    logger.log(level, json.dumps(record, default=str))
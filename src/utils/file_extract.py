@@ -3,54 +3,193 @@ File extraction utilities for Paperlit.
 Supports .txt and .pdf (if PyPDF2 is installed).
 """
 import os
-from typing import Optional
+import time
+import array
+import bisect
+import hashlib
+import logging
+from typing import Iterator, List, NamedTuple, Optional, Tuple
 
 try:
     import PyPDF2
 except ImportError:
     PyPDF2 = None
 
-def extract_text_from_file(file_path: str) -> str:
-    """Extract text from a .txt or .pdf file. Returns empty string if unsupported or error."""
+from src.utils.events import log_event
+
+# Bump whenever extraction output changes so stored texts get re-extracted.
+EXTRACTOR_VERSION = "2"
+
+# Optional caps on the work spent on one PDF (0 = unlimited). The time cap is checked
+# between pages, so it cannot interrupt a single page that takes very long to extract.
+EXTRACT_MAX_PAGES = int(os.getenv('EXTRACT_MAX_PAGES', '0'))
+EXTRACT_MAX_CHARS = int(os.getenv('EXTRACT_MAX_CHARS', '0'))
+EXTRACT_MAX_SECONDS = float(os.getenv('EXTRACT_MAX_SECONDS', '0'))
+SLOW_PAGE_SECONDS = float(os.getenv('SLOW_PAGE_SECONDS', '2'))
+
+class PageText(NamedTuple):
+    page_number: int
+    text: str
+    offset: int  # character offset of the page in the full extracted text
+    seconds: float
+    # Offset within text of each text run the PDF's content stream showed (None for .txt)
+    items: Optional[List[int]] = None
+
+def compute_file_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_pdf_pages(file_path: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                   max_seconds: Optional[float] = None) -> Iterator[PageText]:
+    """
+    Yield the text of a PDF one page at a time.
+    Stops after max_pages pages, max_chars characters (the last page is cut) or once
+    max_seconds have been spent; a page that fails to extract yields empty text.
+    max_seconds is checked after each page: extraction stops at the first page boundary
+    past the limit, and a page that is already being extracted runs to the end.
+    """
+    max_pages = EXTRACT_MAX_PAGES if max_pages is None else max_pages
+    max_chars = EXTRACT_MAX_CHARS if max_chars is None else max_chars
+    max_seconds = EXTRACT_MAX_SECONDS if max_seconds is None else max_seconds
+
+    started = time.perf_counter()
+    offset = 0
+    with open(file_path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        page_count = len(reader.pages)
+
+        for index in range(page_count):
+            if max_pages and index >= max_pages:
+                log_event('extract.page_limit', logging.WARNING, path=file_path, pages=max_pages, page_count=page_count)
+                return
+
+            page_started = time.perf_counter()
+            runs = []
+            try:
+                page_text = reader.pages[index].extract_text(
+                    visitor_text=lambda text, *args: runs.append(text)) or ""
+            except Exception as e:
+                log_event('extract.page_failed', logging.ERROR, path=file_path, page=index + 1, error=str(e))
+                page_text = ""
+                runs = []
+            seconds = time.perf_counter() - page_started
+            items = _run_offsets(page_text, runs)
 
-    if not os.path.isabs(file_path) and not os.path.exists(file_path):
+            if seconds > SLOW_PAGE_SECONDS:
+                log_event('extract.slow_page', logging.WARNING, path=file_path, page=index + 1, seconds=round(seconds, 3))
 
-        project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-        possible_paths = [
-            os.path.join(project_root, 'uploads', file_path),
-            os.path.join(project_root, 'src', 'uploads', file_path)
-        ]
+            if max_chars and offset + len(page_text) > max_chars:
+                page_text = page_text[:max_chars - offset]
+                items = [item for item in items if item < len(page_text)]
+                yield PageText(index + 1, page_text, offset, seconds, items)
+                log_event('extract.char_limit', logging.WARNING, path=file_path, chars=max_chars)
+                return
 
-        for path in possible_paths:
-            if os.path.exists(path):
-                file_path = path
-                break
+            yield PageText(index + 1, page_text, offset, seconds, items)
+            offset += len(page_text)
 
+            if max_seconds and time.perf_counter() - started > max_seconds:
+                log_event('extract.time_limit', logging.WARNING, path=file_path, pages=index + 1, page_count=page_count)
+                return
 
+def iter_file_pages(file_path: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                    max_seconds: Optional[float] = None) -> Iterator[PageText]:
+    """Yield the text of a .txt or .pdf file page by page (a text file is a single page)."""
     if not os.path.exists(file_path):
-        print(f"Warning: File not found at {file_path}")
-        return ""
+        log_event('extract.file_not_found', logging.WARNING, path=file_path)
+        return
 
     ext = os.path.splitext(file_path)[1].lower()
+    if ext == '.txt':
+        max_chars = EXTRACT_MAX_CHARS if max_chars is None else max_chars
+        started = time.perf_counter()
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            text = f.read(max_chars) if max_chars else f.read()
+        yield PageText(1, text, 0, time.perf_counter() - started)
+    elif ext == '.pdf' and PyPDF2:
+        yield from iter_pdf_pages(file_path, max_pages, max_chars, max_seconds)
+    else:
+        log_event('extract.unsupported', logging.WARNING, path=file_path, extension=ext)
+
+def extract_text_with_page_map(file_path: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                               max_seconds: Optional[float] = None) -> Tuple[str, Optional[bytes]]:
+    """
+    Extract text from a .txt or .pdf file, with the packed page map of a PDF (see pack_page_map).
+    Returns ("", None) if unsupported or error.
+    """
+    pages = []
+    page_map = []
     try:
-        if ext == '.txt':
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                text = f.read()
-                print(f"Extracted {len(text)} characters from text file: {file_path}")
-                return text
-        elif ext == '.pdf' and PyPDF2:
-            text = ""
-            with open(file_path, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                for page in reader.pages:
-                    page_text = page.extract_text() or ""
-                    text += page_text
-                print(f"Extracted {len(text)} characters from PDF file: {file_path}")
-                return text
-        else:
-            print(f"Unsupported file extension: {ext}")
+        for page in iter_file_pages(file_path, max_pages, max_chars, max_seconds):
+            pages.append(page.text)
+            if page.items is not None:
+                page_map.extend((page.offset + item_offset, page.page_number, item)
+                                for item, item_offset in enumerate(page.items) if item_offset >= 0)
     except Exception as e:
+        log_event('extract.failed', logging.ERROR, path=file_path, error=str(e))
+        return "", None
+
+    text = "".join(pages)
+    log_event('extract.done', path=file_path, chars=len(text), pages=len(pages))
+    return text, pack_page_map(page_map) if page_map else None
+
+def extract_text_from_file(file_path: str, max_pages: Optional[int] = None, max_chars: Optional[int] = None,
+                           max_seconds: Optional[float] = None) -> str:
+    """Extract text from a .txt or .pdf file. Returns empty string if unsupported or error."""
+    return extract_text_with_page_map(file_path, max_pages, max_chars, max_seconds)[0]
+
+def _run_offsets(page_text: str, runs: List[str]) -> List[int]:
+    """
+    Offset of each text run within the page text, or -1 for a run that cannot be found there.
+    Runs are numbered in content-stream order, like the items of the PDF.js text layer, which
+    also counts empty and whitespace-only items; those take up a number but get -1.
+    """
+    offsets = []
+    cursor = 0
+    for run in runs:
+        if not run.strip():
+            offsets.append(-1)
+            continue
+        position = page_text.find(run, cursor)
+        if position < 0:
+            # Extraction normalised this run; match on its first line instead
+            first_line = run.strip().split('\n', 1)[0]
+            position = page_text.find(first_line, cursor) if first_line else -1
+        offsets.append(position)
+        if position >= 0:
+            cursor = position + 1
+    return offsets
 
-        print(f"Error extracting text from {file_path}: {e}")
+def pack_page_map(entries: List[Tuple[int, int, int]]) -> bytes:
+    """Pack (text offset, page number, text item index) entries, sorted by offset, as int32s."""
+    values = array.array('i')
+    for entry in sorted(entries):
+        values.extend(entry)
+    return values.tobytes()
 
-    return ""
+def unpack_page_map(packed: bytes) -> List[Tuple[int, int, int]]:
+    values = array.array('i')
+    values.frombytes(packed)
+    return list(zip(values[0::3], values[1::3], values[2::3]))
+
+def page_spans(page_map: List[Tuple[int, int, int]], start: int, end: int,
+               offsets: Optional[List[int]] = None) -> List[dict]:
+    """
+    PDF text items covering text[start:end], as one {'page', 'start_item', 'end_item'} span per page.
+    page_map is an unpacked map; pass its offsets when looking up many blocks.
+    """
+    if offsets is None:
+        offsets = [entry[0] for entry in page_map]
+    first = bisect.bisect_right(offsets, start) - 1
+    last = bisect.bisect_left(offsets, end) - 1
+    spans = []
+    for _, page, item in page_map[max(first, 0):last + 1]:
+        if spans and spans[-1]['page'] == page:
+            spans[-1]['end_item'] = item
+        else:
+            spans.append({'page': page, 'start_item': item, 'end_item': item})
+    return spans
@@ -0,0 +1,36 @@
+"""
+JSON responses for Paperlit's API endpoints with ETags and gzip.
+The ETag is a hash of the uncompressed body, so an unchanged page is answered with
+304 Not Modified, and bodies above JSON_GZIP_MIN_BYTES are gzipped for clients that accept it.
+"""
+import os
+import gzip
+import json
+import hashlib
+
+from flask import current_app, request
+
+JSON_GZIP_MIN_BYTES = int(os.getenv('JSON_GZIP_MIN_BYTES', '1024'))
+JSON_GZIP_LEVEL = int(os.getenv('JSON_GZIP_LEVEL', '6'))
+
+
+def json_response(payload, status: int = 200):
+    """A conditional, optionally gzipped JSON response for the current request."""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    etag = hashlib.sha256(body).hexdigest()[:32]
+
+    encoded = len(body) >= JSON_GZIP_MIN_BYTES and 'gzip' in request.accept_encodings
+    if encoded:
+        body = gzip.compress(body, JSON_GZIP_LEVEL)
+        # Strong ETags must differ between encodings of the same content
+        etag += '-gz'
+
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    if encoded:
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    # Private to the user, and revalidated on every use
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.set_etag(etag)
+    return response.make_conditional(request)
@@ -0,0 +1,70 @@
+import atexit
+import io
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The app reads its configuration when it is imported, so point it at scratch storage first
+_TMP_DIR = tempfile.mkdtemp(prefix='paperlit-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ['UPLOAD_FOLDER'] = os.path.join(_TMP_DIR, 'uploads')
+os.environ['METRICS_DIR'] = os.path.join(_TMP_DIR, 'metrics')
+os.environ['ANALYSIS_WORKER_THREADS'] = '0'
+os.environ['LOG_EVENTS_LEVEL'] = 'WARNING'
+# Registered first so it runs last, after the metrics flush at exit
+atexit.register(shutil.rmtree, _TMP_DIR, True)
+
+from src.app import app as flask_app  # noqa: E402
+from src.models import db, User, Document  # noqa: E402
+from src.services.storage import save_stream  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def session(app):
+    """An app context over empty tables and an empty upload folder."""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        shutil.rmtree(app.config['UPLOAD_FOLDER'], ignore_errors=True)
+        yield db.session
+        db.session.remove()
+
+
+@pytest.fixture
+def user(session):
+    user = User(username='alice', email='alice@example.com', password='x')
+    session.add(user)
+    session.commit()
+    return user
+
+
+@pytest.fixture
+def client(app, user):
+    """A test client logged in as the user."""
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user'] = user.username
+        flask_session['user_id'] = user.id
+    return client
+
+
+@pytest.fixture
+def make_document(session, user):
+    """Store text as an uploaded .txt file and create its pending Document."""
+    def make(text: str, name: str = 'document', **values) -> Document:
+        stored = save_stream(io.BytesIO(text.encode('utf-8')), f'{name}.txt')
+        document = Document(user_id=user.id, document_name=name, file_path=stored.storage_key,
+                            original_filename=f'{name}.txt', content_hash=stored.content_hash,
+                            analysis_status='pending', **values)
+        session.add(document)
+        session.commit()
+        return document
+    return make
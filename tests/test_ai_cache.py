@@ -0,0 +1,65 @@
+import os
+import time
+
+from src.services.ai_cache import AIResultCache, text_key
+from src.services.ai_client import AISimilarityClient, CircuitBreaker
+
+RESULTS = [{'document_name': 'source', 'similarity_score': 0.5, 'matching_blocks': [{'a_start': 0, 'a_end': 4}]}]
+
+
+def _cache(tmp_path, **options):
+    return AIResultCache(os.path.join(tmp_path, 'ai_cache.sqlite3'), **options)
+
+
+def test_key_is_exact_text():
+    assert text_key('some text') == text_key('some text')
+    # Offsets refer to the text as sent, so whitespace differences are different entries
+    assert text_key('some text') != text_key('some  text')
+    assert text_key('some text') != text_key('some text\n')
+
+
+def test_round_trip_and_counters(tmp_path):
+    cache = _cache(tmp_path)
+    key = text_key('chunk')
+    assert cache.get(key) is None
+    cache.set(key, RESULTS)
+    assert cache.get(key) == RESULTS
+    stats = cache.stats()
+    assert stats['process'] == {'hits': 1, 'misses': 1}
+    assert stats['entries'] == 1
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = _cache(tmp_path, ttl_seconds=0.05)
+    key = text_key('chunk')
+    cache.set(key, RESULTS)
+    time.sleep(0.1)
+    assert cache.get(key) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_least_recently_used_evicted_over_size_limit(tmp_path):
+    cache = _cache(tmp_path)
+    for name in ('a', 'b'):
+        cache.set(text_key(name), RESULTS)
+    cache.max_bytes = cache.stats()['bytes']
+    cache.get(text_key('a'))
+    cache.set(text_key('c'), RESULTS)
+    assert cache.get(text_key('b')) is None
+    assert cache.get(text_key('a')) == RESULTS
+    assert cache.stats()['shared']['evictions'] == 1
+
+
+def test_client_sends_only_uncached_chunks(tmp_path):
+    cache = _cache(tmp_path)
+    sent = []
+
+    def post(chunk):
+        sent.append(chunk)
+        return []
+
+    client = AISimilarityClient('http://ai.invalid/check', 'key', breaker=CircuitBreaker(), cache=cache)
+    client._post_chunk = post
+    assert client.check('first text') == []
+    assert client.check('first text') == []
+    assert sent == ['first text']
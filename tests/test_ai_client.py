@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from benchmarks.corpus import CorpusGenerator
+from src.services.ai_client import AISimilarityClient, CircuitBreaker, merge_chunk_results, split_text
+
+
+def _open_breaker(reset_seconds=0.05):
+    breaker = CircuitBreaker(threshold=2, reset_seconds=reset_seconds)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def _client(post, breaker=None, chunk_size=8000):
+    client = AISimilarityClient('http://ai.invalid/check', 'key', chunk_size=chunk_size, breaker=breaker)
+    client._post_chunk = post
+    return client
+
+
+def test_breaker_opens_after_threshold_then_half_opens():
+    breaker = CircuitBreaker(threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.acquire() == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.acquire() is None
+    time.sleep(0.06)
+    assert breaker.state == 'half-open'
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.acquire() == 'trial'
+    assert breaker.acquire() is None
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.acquire() == 'closed'
+
+
+def test_failed_trial_reopens_at_once():
+    breaker = _open_breaker()
+    time.sleep(0.06)
+    assert breaker.acquire() == 'trial'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.acquire() is None
+
+
+def test_concurrent_checks_send_a_single_trial():
+    breaker = _open_breaker(reset_seconds=0.05)
+    time.sleep(0.06)
+    release = threading.Event()
+    calls = []
+
+    def post(chunk):
+        calls.append(chunk)
+        release.wait(5)
+        return []
+
+    client = _client(post, breaker)
+    results = {}
+
+    def check(index):
+        results[index] = client.check(f'text {index}')
+
+    threads = [threading.Thread(target=check, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    # Everyone but the trial caller falls back while the trial is in flight
+    deadline = time.monotonic() + 5
+    while len(results) < 7 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert list(results.values()) == [None] * 7
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert list(results.values()).count([]) == 1
+    assert breaker.state == 'closed'
+
+
+def test_request_error_falls_back_and_counts_failure():
+    def post(chunk):
+        raise requests.ConnectionError('down')
+
+    breaker = CircuitBreaker(threshold=1, reset_seconds=60)
+    client = _client(post, breaker)
+    assert client.check('some text') is None
+    assert breaker.state == 'open'
+    assert client.check('some text') is None
+
+
+def test_split_text_covers_text_within_chunk_size():
+    text = CorpusGenerator(5).essay(2000)
+    chunks = split_text(text, 1000)
+    assert ''.join(chunk for _, chunk in chunks) == text
+    assert all(len(chunk) <= 1000 for _, chunk in chunks)
+    assert [offset for offset, _ in chunks] == [sum(len(c) for _, c in chunks[:i]) for i in range(len(chunks))]
+
+
+def test_merge_chunk_results_shifts_blocks_and_weights_scores():
+    block = {'a_start': 0, 'a_end': 10}
+    merged = merge_chunk_results([
+        (0, 50, [{'document_name': 'a', 'similarity_score': 1.0, 'matching_blocks': [block]}]),
+        (50, 50, [{'document_name': 'a', 'similarity_score': 0.5, 'matching_blocks': [block]}]),
+    ], 100)
+    [entry] = merged
+    assert entry['similarity_score'] == pytest.approx(0.75)
+    assert [(b['a_start'], b['a_end']) for b in entry['matching_blocks']] == [(0, 10), (50, 60)]
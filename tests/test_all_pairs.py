@@ -0,0 +1,83 @@
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.models import db, User
+from src.services.all_pairs import candidate_pairs, compare_rows, identical_pairs, load_texts, select_documents
+from src.services.comparison import compare_texts
+from src.services.fingerprint_index import index_document
+from src.services.storage import key_to_path
+from src.services.text_store import store_text
+
+
+@pytest.fixture
+def cohort(make_document):
+    """source, a copy of it, an unrelated essay, a resubmission of the source, and an unindexed copy."""
+    generator = CorpusGenerator(31)
+    source = generator.essay(500)
+    texts = {
+        'source': source,
+        'copy': generator.plagiarise(generator.essay(500), [source], 0.5).text,
+        'unrelated': generator.essay(500),
+        'resubmitted': source,
+        'late-copy': generator.plagiarise(generator.essay(500), [source], 0.5).text,
+    }
+    documents = {}
+    for name, text in texts.items():
+        document = make_document(text, name)
+        store_text(document.content_hash, text, key_to_path(document.file_path))
+        if name != 'late-copy':
+            index_document(document, text)
+        documents[name] = document
+    db.session.commit()
+    return documents
+
+
+def _pairs(rows, documents):
+    names = {document.id: name for name, document in documents.items()}
+    return {(names[a], names[b]) for a, others in rows.items() for b, _ in others}
+
+
+def test_candidates_are_pruned_to_shared_fingerprints(cohort):
+    documents = list(cohort.values())
+    texts = load_texts(documents)
+    pairs = _pairs(candidate_pairs(documents, texts), cohort)
+    assert {('source', 'copy'), ('source', 'resubmitted'), ('source', 'late-copy'),
+            ('copy', 'resubmitted'), ('resubmitted', 'late-copy')} <= pairs
+    assert not {pair for pair in pairs if 'unrelated' in pair}
+
+    every_pair = candidate_pairs(documents, texts, all_pairs=True)
+    assert sum(len(others) for others in every_pair.values()) == 10
+    # Fingerprints shared by more documents than allowed are boilerplate
+    assert candidate_pairs(documents, texts, max_term_documents=1) == {}
+
+
+def test_identical_content_is_paired_without_comparing(cohort):
+    assert identical_pairs(list(cohort.values())) == {cohort['source'].id: [cohort['resubmitted'].id]}
+
+
+def test_rows_match_direct_comparison_in_and_out_of_process(cohort):
+    documents = list(cohort.values())
+    texts = load_texts(documents)
+    rows = candidate_pairs(documents, texts)
+    serial = {a: results for a, results in compare_rows(rows, texts)}
+    parallel = {a: results for a, results in compare_rows(rows, texts, workers=2, max_pending=1)}
+    assert serial == parallel
+    assert set(serial) == set(rows)
+    for results in serial.values():
+        for result in results:
+            similarity, _ = compare_texts(texts[result['document_a']], texts[result['document_b']])
+            assert result['similarity'] == similarity
+
+
+def test_select_documents_by_user_and_assigned_institution(session, user, cohort):
+    other = User(username='bob', email='bob@example.com', password='x', institution='Example University')
+    session.add(other)
+    session.commit()
+    ids = [document.id for document in cohort.values()]
+    assert [document.id for document in select_documents(usernames=['alice'])] == ids
+    assert select_documents(institution='Example University') == []
+
+    user.verified_institution = 'Example University'
+    session.commit()
+    assert [document.id for document in select_documents(institution='example university')] == ids
+    assert select_documents() == []
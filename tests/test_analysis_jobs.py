@@ -0,0 +1,271 @@
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.models import db, AnalysisJob, Document, ExtractedText, SimilarityMatch
+from src.services import analysis_jobs
+from src.services.analysis_jobs import (
+    Heartbeat, JobLost, cancel_jobs, claim_next_job, enqueue_analysis, process_job, run_worker, _reclaim_stale_jobs,
+    _set_progress, _now,
+)
+from src.services.storage import key_to_path, save_stream
+
+
+@pytest.fixture
+def queued_document(make_document):
+    document = make_document(CorpusGenerator(3).essay(300), 'essay')
+    enqueue_analysis(document)
+    db.session.commit()
+    return document
+
+
+def _make_stale(job_id):
+    stale = _now() - timedelta(seconds=analysis_jobs.ANALYSIS_JOB_STALE_SECONDS + 60)
+    AnalysisJob.query.filter_by(id=job_id).update({'heartbeat_at': stale})
+    db.session.commit()
+
+
+def _job(job_id):
+    db.session.expire_all()
+    return db.session.get(AnalysisJob, job_id)
+
+
+def test_enqueue_merges_into_queued_job(queued_document):
+    first = AnalysisJob.query.filter_by(document_id=queued_document.id).one()
+    again = enqueue_analysis(queued_document, 'previous-hash', profile_requested=True)
+    db.session.commit()
+    assert again.id == first.id
+    assert again.profile_requested is True
+    # The queued job keeps the content hash it was created with
+    assert again.previous_content_hash is None
+    assert AnalysisJob.query.count() == 1
+
+
+def test_enqueue_after_claim_creates_new_job(queued_document):
+    claimed = claim_next_job('worker-a')
+    job = enqueue_analysis(queued_document)
+    db.session.commit()
+    assert job.id != claimed.id
+    assert AnalysisJob.query.filter_by(status='queued').count() == 1
+
+
+def test_worker_completes_job(app, queued_document):
+    run_worker(app, 'worker-a', once=True)
+    job = AnalysisJob.query.filter_by(document_id=queued_document.id).one()
+    assert (job.status, job.stage, job.progress, job.attempts) == ('done', 'done', 1.0, 1)
+    document = db.session.get(Document, queued_document.id)
+    assert document.analysis_status == 'complete'
+    assert document.analyzed_content_hash == document.content_hash
+    assert 0.0 <= document.originality_score <= 1.0
+
+
+def test_stale_job_reclaimed_and_finished_by_new_worker(app, queued_document):
+    lost = claim_next_job('worker-a')
+    _make_stale(lost.id)
+
+    taken = claim_next_job('worker-b')
+    assert taken.id == lost.id
+    assert (taken.worker_id, taken.attempts) == ('worker-b', 2)
+
+    # The first worker comes back: its writes are refused
+    with pytest.raises(JobLost):
+        _set_progress(lost, 'worker-a', 'comparing', 0.5)
+
+    process_job(taken, app.config['UPLOAD_FOLDER'])
+    job = _job(taken.id)
+    assert (job.status, job.worker_id) == ('done', 'worker-b')
+
+
+def test_reclaimed_worker_does_not_save_results(app, queued_document):
+    job = claim_next_job('worker-a')
+    # Taken over behind this worker's back, as another process would
+    with db.engine.begin() as connection:
+        connection.execute(AnalysisJob.__table__.update().where(AnalysisJob.__table__.c.id == job.id)
+                           .values(worker_id='worker-b'))
+
+    process_job(job, app.config['UPLOAD_FOLDER'])
+    job = _job(job.id)
+    assert (job.status, job.worker_id) == ('running', 'worker-b')
+    assert db.session.get(Document, queued_document.id).analyzed_content_hash is None
+
+
+def test_reclaim_gives_up_after_max_attempts(queued_document):
+    job = claim_next_job('worker-a')
+    AnalysisJob.query.filter_by(id=job.id).update({'attempts': analysis_jobs.ANALYSIS_MAX_ATTEMPTS})
+    db.session.commit()
+    _make_stale(job.id)
+
+    _reclaim_stale_jobs()
+    job = _job(job.id)
+    assert (job.status, job.worker_id) == ('failed', None)
+    assert db.session.get(Document, queued_document.id).analysis_status == 'failed'
+
+
+def test_recent_heartbeat_is_not_reclaimed(queued_document):
+    job = claim_next_job('worker-a')
+    _reclaim_stale_jobs()
+    assert _job(job.id).worker_id == 'worker-a'
+    assert claim_next_job('worker-b') is None
+
+
+def test_missing_file_requeues_then_fails(app, queued_document):
+    os.remove(key_to_path(queued_document.file_path))
+
+    for attempt in range(1, analysis_jobs.ANALYSIS_MAX_ATTEMPTS + 1):
+        job = claim_next_job('worker-a')
+        process_job(job, app.config['UPLOAD_FOLDER'])
+        job = _job(job.id)
+        assert job.attempts == attempt
+    assert job.status == 'failed'
+    assert 'File not found' in job.error
+    assert db.session.get(Document, queued_document.id).analysis_status == 'failed'
+
+
+def test_heartbeat_refreshes_and_detects_loss(queued_document):
+    job = claim_next_job('worker-a')
+    _make_stale(job.id)
+
+    with Heartbeat(AnalysisJob, job.id, 'worker-a', interval=0.05) as heartbeat:
+        time.sleep(0.3)
+    assert not heartbeat.lost
+    assert _now() - _job(job.id).heartbeat_at < timedelta(seconds=5)
+
+    AnalysisJob.query.filter_by(id=job.id).update({'worker_id': 'worker-b'})
+    db.session.commit()
+    with Heartbeat(AnalysisJob, job.id, 'worker-a', interval=0.05) as heartbeat:
+        time.sleep(0.3)
+    assert heartbeat.lost
+
+
+def test_concurrent_claims_take_each_job_once(app, make_document):
+    generator = CorpusGenerator(4)
+    for index in range(6):
+        enqueue_analysis(make_document(generator.essay(50), f'doc{index}'))
+    db.session.commit()
+
+    claimed = []
+    errors = []
+
+    def claim(worker_id):
+        try:
+            with app.app_context():
+                while True:
+                    job = claim_next_job(worker_id)
+                    if job is None:
+                        break
+                    claimed.append(job.id)
+                db.session.remove()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=claim, args=(f'worker-{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert sorted(claimed) == [job_id for (job_id,) in db.session.query(AnalysisJob.id).order_by(AnalysisJob.id)]
+
+
+def test_previous_text_released_once_unreferenced(app, make_document):
+    generator = CorpusGenerator(8)
+    shared = generator.essay(200)
+    first = make_document(shared, 'first')
+    second = make_document(shared, 'second')
+    enqueue_analysis(first)
+    enqueue_analysis(second)
+    db.session.commit()
+    run_worker(app, 'worker-a', once=True)
+    shared_hash = first.content_hash
+    assert db.session.get(ExtractedText, shared_hash) is not None
+
+    def edit(document):
+        stored = save_stream(io.BytesIO(generator.essay(200).encode('utf-8')), 'edit.txt')
+        previous_hash = document.content_hash
+        document.file_path = stored.storage_key
+        document.content_hash = stored.content_hash
+        enqueue_analysis(document, previous_hash)
+        db.session.commit()
+        run_worker(app, 'worker-a', once=True)
+        db.session.expire_all()
+
+    # Still the text of the other document
+    edit(db.session.get(Document, first.id))
+    assert db.session.get(ExtractedText, shared_hash) is not None
+    edit(db.session.get(Document, second.id))
+    assert db.session.get(ExtractedText, shared_hash) is None
+
+
+def test_cancelled_jobs_return_held_texts(queued_document):
+    job = enqueue_analysis(queued_document)
+    db.session.commit()
+    claim_next_job('worker-a')
+    edited = enqueue_analysis(queued_document, 'held-hash')
+    db.session.commit()
+    assert edited.id != job.id
+    assert cancel_jobs(queued_document.id) == ['held-hash']
+    db.session.commit()
+    assert AnalysisJob.query.count() == 0
+
+
+def test_failure_logs_the_traceback(app, queued_document, caplog):
+    os.remove(key_to_path(queued_document.file_path))
+    logger = logging.getLogger('paperlit.events')
+    logger.addHandler(caplog.handler)
+    try:
+        process_job(claim_next_job('worker-a'), app.config['UPLOAD_FOLDER'])
+    finally:
+        logger.removeHandler(caplog.handler)
+    [event] = [json.loads(record.getMessage()) for record in caplog.records
+               if '"analysis.job_failed"' in record.getMessage()]
+    assert 'FileNotFoundError' in event['traceback']
+
+
+def test_view_of_failed_analysis_shows_the_failure(client, queued_document):
+    Document.query.filter_by(id=queued_document.id).update({'analysis_status': 'failed'})
+    db.session.commit()
+    response = client.get(f'/view_document/{queued_document.id}', follow_redirects=True)
+    page = response.get_data(as_text=True)
+    assert 'The originality check for this document failed' in page
+    assert 'still running' not in page
+
+
+def test_edited_document_is_matched_incrementally(app, make_document):
+    generator = CorpusGenerator(6)
+    source = generator.essay(800)
+    make_document(source, 'source')
+    text = generator.plagiarise(generator.essay(800), [source], 0.3).text
+    document = make_document(text, 'copy')
+    for pending in Document.query.all():
+        enqueue_analysis(pending)
+    db.session.commit()
+    run_worker(app, 'worker-a', once=True)
+    document = db.session.get(Document, document.id)
+    assert document.get_similarity_details()['similar_documents']
+
+    previous_hash = document.content_hash
+    edited = text[:len(text) // 2] + ' ' + generator.essay(40) + ' ' + text[len(text) // 2:]
+    stored = save_stream(io.BytesIO(edited.encode('utf-8')), 'copy.txt')
+    document.file_path = stored.storage_key
+    document.content_hash = stored.content_hash
+    job = enqueue_analysis(document, previous_hash)
+    db.session.commit()
+    run_worker(app, 'worker-a', once=True)
+
+    job = _job(job.id)
+    assert job.status == 'done'
+    reuse = json.loads(job.reuse_stats)
+    assert reuse['documents_incremental'] == 1
+    assert reuse['reused_fraction'] > 0.5
+    match = SimilarityMatch.query.filter_by(document_id=document.id, document_name='source').one()
+    assert match.blocks
+    for block in match.blocks:
+        assert edited[block.a_start:block.a_end] == source[block.b_start:block.b_end]
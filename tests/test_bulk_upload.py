@@ -0,0 +1,140 @@
+import io
+import json
+import logging
+import zipfile
+from datetime import timedelta
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from benchmarks.corpus import CorpusGenerator
+from src.models import db, BulkBatch, Document
+from src.services import analysis_jobs, bulk_upload
+from src.services.analysis_jobs import run_worker, _now
+from src.services.bulk_upload import claim_next_batch, create_batch, get_batch_progress, process_batch
+
+
+@pytest.fixture(autouse=True)
+def extract_in_process(monkeypatch):
+    monkeypatch.setattr(bulk_upload, 'BULK_EXTRACT_WORKERS', 1)
+
+
+def _upload(filename, data):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def _archive(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, text in members.items():
+            archive.writestr(name, text)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def batch(user):
+    generator = CorpusGenerator(21)
+    source = generator.essay(400)
+    copy = generator.plagiarise(generator.essay(400), [source], 0.7).text
+    batch, _ = create_batch(user.id, [
+        _upload('source.txt', source.encode('utf-8')),
+        _upload('essays.zip', _archive({'class/copy.txt': copy, 'class/notes.exe': 'x', '__MACOSX/._copy.txt': 'x'})),
+        _upload('image.png', b'not a document'),
+    ])
+    return batch
+
+
+def _batch(batch_id):
+    db.session.expire_all()
+    return db.session.get(BulkBatch, batch_id)
+
+
+def _take_over(batch_id, worker_id):
+    # Reclaimed behind this worker's back, as another process would
+    table = BulkBatch.__table__
+    with db.engine.begin() as connection:
+        connection.execute(table.update().where(table.c.id == batch_id).values(worker_id=worker_id))
+
+
+def test_create_batch_unpacks_archives(batch):
+    documents = Document.query.filter_by(batch_id=batch.id).order_by(Document.id).all()
+    assert [document.document_name for document in documents] == ['source', 'copy']
+    assert {document.analysis_status for document in documents} == {'pending'}
+    assert batch.total_files == 2
+    skipped = json.loads(batch.summary)['skipped_files']
+    assert sorted(item['filename'] for item in skipped) == ['class/notes.exe', 'image.png']
+
+
+def test_worker_analyses_the_batch_against_itself(app, batch):
+    run_worker(app, 'worker-a', once=True)
+    progress = get_batch_progress(_batch(batch.id))
+    assert (progress['status'], progress['progress'], progress['processed_files']) == ('done', 1.0, 2)
+    summary = progress['summary']
+    assert summary['analysed'] == 2 and summary['failed'] == []
+    [pair] = summary['similar_pairs']
+    assert sorted(pair['documents']) == ['copy', 'source']
+    assert {document.analysis_status for document in Document.query.filter_by(batch_id=batch.id)} == {'complete'}
+
+
+def test_reclaimed_batch_is_left_to_the_new_worker(app, batch, caplog):
+    claimed = claim_next_batch('worker-a')
+    _take_over(claimed.id, 'worker-b')
+
+    logger = logging.getLogger('paperlit.events')
+    logger.addHandler(caplog.handler)
+    try:
+        process_batch(claimed, app.config['UPLOAD_FOLDER'])
+    finally:
+        logger.removeHandler(caplog.handler)
+
+    batch = _batch(claimed.id)
+    assert (batch.status, batch.worker_id, batch.stage, batch.progress) == ('running', 'worker-b', 'starting', 0.0)
+    assert 'similar_pairs' not in json.loads(batch.summary)
+    assert any('"bulk.batch_lost"' in record.getMessage() for record in caplog.records)
+
+
+def test_stale_batch_requeued_then_failed(batch):
+    for attempt in range(1, analysis_jobs.ANALYSIS_MAX_ATTEMPTS + 1):
+        claimed = claim_next_batch('worker-a')
+        assert claimed.attempts == attempt
+        stale = _now() - timedelta(seconds=bulk_upload.ANALYSIS_JOB_STALE_SECONDS + 60)
+        BulkBatch.query.filter_by(id=claimed.id).update({'heartbeat_at': stale})
+        db.session.commit()
+
+    assert claim_next_batch('worker-b') is None
+    batch = _batch(batch.id)
+    assert (batch.status, batch.worker_id, batch.error) == ('failed', None, 'Worker stopped responding')
+    assert {document.analysis_status for document in Document.query.filter_by(batch_id=batch.id)} == {'failed'}
+
+
+def test_error_requeues_the_batch_for_its_owner_only(app, batch, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('extractor crashed')
+
+    monkeypatch.setattr(bulk_upload, '_extract_missing', broken)
+    claimed = claim_next_batch('worker-a')
+    process_batch(claimed, app.config['UPLOAD_FOLDER'])
+    batch = _batch(claimed.id)
+    assert (batch.status, batch.worker_id, batch.error) == ('queued', None, 'extractor crashed')
+
+    claimed = claim_next_batch('worker-a')
+    _take_over(claimed.id, 'worker-b')
+    process_batch(claimed, app.config['UPLOAD_FOLDER'])
+    batch = _batch(claimed.id)
+    assert (batch.status, batch.worker_id) == ('running', 'worker-b')
+
+
+def test_lost_heartbeat_stops_the_batch(app, batch, monkeypatch):
+    class LostHeartbeat(analysis_jobs.Heartbeat):
+        def __enter__(self):
+            self.lost = True
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+    monkeypatch.setattr(bulk_upload, 'Heartbeat', LostHeartbeat)
+    claimed = claim_next_batch('worker-a')
+    process_batch(claimed, app.config['UPLOAD_FOLDER'])
+    batch = _batch(claimed.id)
+    assert (batch.status, batch.worker_id, batch.stage) == ('running', 'worker-a', 'starting')
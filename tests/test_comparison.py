@@ -0,0 +1,66 @@
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.services.comparison import (
+    PreparedText, compare_texts, quick_ratio, real_quick_ratio, get_comparison_stats, reset_comparison_stats,
+)
+from src.services.suffix_matcher import SuffixAutomaton, find_common_blocks, block_similarity, swap_sides
+
+MIN_SIZE = 30
+
+
+def _text_pairs():
+    generator = CorpusGenerator(7)
+    sources = generator.corpus(3, 800)
+    return [(generator.plagiarise(generator.essay(800), sources, rate, 40).text, source)
+            for rate, source in zip((0.1, 0.3, 0.6), sources)]
+
+
+PAIRS = _text_pairs()
+IDS = ['plagiarised-10', 'plagiarised-30', 'plagiarised-60']
+
+
+@pytest.mark.parametrize('text1, text2', PAIRS, ids=IDS)
+def test_prepared_text_reused_across_comparisons(text1, text2):
+    prepared = PreparedText(text1, MIN_SIZE)
+    first = compare_texts(prepared, text2, MIN_SIZE, 0, 0)
+    again = compare_texts(prepared, text2, MIN_SIZE, 0, 0)
+    assert first == again == compare_texts(text1, text2, MIN_SIZE, 0, 0)
+    assert prepared.quick_ratio(text2) == quick_ratio(text1, text2, MIN_SIZE)
+
+
+@pytest.mark.parametrize('text1, text2', PAIRS, ids=IDS)
+def test_swap_sides_matches_other_direction(text1, text2):
+    blocks = swap_sides(SuffixAutomaton(text1).matching_blocks(text2, MIN_SIZE), text1, MIN_SIZE)
+    covered = 0
+    for block in blocks:
+        assert text1[block['a_start']:block['a_end']] == text2[block['b_start']:block['b_end']] == block['text']
+        assert block['a_start'] >= covered
+        covered = block['a_end']
+    direct = find_common_blocks(text1, text2, MIN_SIZE)
+    score = block_similarity(blocks, len(text1), len(text2))
+    assert score == pytest.approx(block_similarity(direct, len(text1), len(text2)), abs=2e-3)
+
+
+@pytest.mark.parametrize('text1, text2', PAIRS, ids=IDS)
+def test_quick_ratios_bound_the_score(text1, text2):
+    score, _ = compare_texts(text1, text2, MIN_SIZE, 0, 0)
+    assert score <= quick_ratio(text1, text2, MIN_SIZE) + 1e-9
+    assert quick_ratio(text1, text2, MIN_SIZE) <= real_quick_ratio(len(text1), len(text2)) + 1e-9
+
+
+def test_cascade_rejects_hopeless_pairs_early():
+    generator = CorpusGenerator(8)
+    text = generator.essay(500)
+    reset_comparison_stats()
+
+    # Very different lengths: rejected from the lengths alone
+    assert compare_texts(text, 'x' * 40, MIN_SIZE, real_quick_threshold=0.5) == (0.0, [])
+    # Nothing in common: rejected by the chunk bound
+    assert compare_texts(text, '0123456789 ' * 300, MIN_SIZE) == (0.0, [])
+    score, blocks = compare_texts(text, text, MIN_SIZE)
+    assert score == 1.0 and blocks
+
+    stats = get_comparison_stats()
+    assert (stats['pairs'], stats['rejected_real_quick'], stats['rejected_quick'], stats['matched']) == (3, 1, 1, 1)
+    reset_comparison_stats()
@@ -0,0 +1,67 @@
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.models import db, User, Document
+from src.services.corpus_search import move_user_documents, rebuild_corpus_index, search_corpus
+from src.services.fingerprint_index import document_scope, fingerprint_text, index_document
+
+
+@pytest.fixture
+def texts():
+    generator = CorpusGenerator(9)
+    source = generator.essay(600)
+    return source, generator.plagiarise(generator.essay(600), [source], 0.5).text
+
+
+@pytest.fixture
+def other_document(session, texts):
+    bob = User(username='bob', email='bob@example.com', password='x', institution='Example University',
+               verified_institution='Example University')
+    session.add(bob)
+    session.commit()
+    document = Document(user_id=bob.id, document_name='bob-essay', file_path='unused')
+    session.add(document)
+    session.commit()
+    index_document(document, texts[0])
+    session.commit()
+    return document
+
+
+def _search(user, text, exclude_document_id=None):
+    scope = document_scope(Document(user_id=user.id))
+    return [document_id for document_id, _ in search_corpus(fingerprint_text(text), scope, exclude_document_id)]
+
+
+def test_profile_institution_does_not_join_a_corpus(client, user, other_document, texts):
+    response = client.post('/edit_profile', data={'username': user.username, 'email': user.email,
+                                                  'institution': 'Example University'})
+    assert response.status_code == 302
+    user = db.session.get(User, user.id)
+    assert user.institution == 'Example University'
+    assert user.verified_institution is None
+    assert _search(user, texts[1]) == []
+
+
+def test_assigned_institution_joins_the_corpus(user, other_document, texts):
+    user.verified_institution = ' example  UNIVERSITY '
+    db.session.commit()
+    assert _search(user, texts[1]) == [other_document.id]
+
+
+def test_documents_follow_the_assigned_institution(user, other_document, texts):
+    document = Document(user_id=user.id, document_name='alice-essay', file_path='unused')
+    db.session.add(document)
+    db.session.commit()
+    index_document(document, texts[1])
+    db.session.commit()
+    bob = db.session.get(User, other_document.user_id)
+    assert _search(bob, texts[0], other_document.id) == []
+
+    user.verified_institution = 'Example University'
+    db.session.commit()
+    assert move_user_documents(user.id, user.verified_institution) == 1
+    assert _search(bob, texts[0], other_document.id) == [document.id]
+
+    # A rebuild derives the same scopes from the assigned institutions
+    rebuild_corpus_index()
+    assert _search(bob, texts[0], other_document.id) == [document.id]
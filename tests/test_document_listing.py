@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.models import User, Document
+from src.services.document_listing import decode_cursor, list_documents
+
+
+@pytest.fixture
+def documents(session, user):
+    """Eleven documents, newest first, with some sharing an upload time."""
+    start = datetime(2024, 1, 1)
+    created = []
+    for index in range(11):
+        document = Document(user_id=user.id, document_name=f'doc{index}', file_path=f'blobs/x/{index}',
+                            uploaded_at=start + timedelta(minutes=index // 3))
+        session.add(document)
+        created.append(document)
+    other = User(username='bob', email='bob@example.com', password='x')
+    session.add(other)
+    session.flush()
+    session.add(Document(user_id=other.id, document_name='not mine', file_path='blobs/x/other', uploaded_at=start))
+    session.commit()
+    return sorted(created, key=lambda document: (document.uploaded_at, document.id), reverse=True)
+
+
+def _ids(documents):
+    return [document.id for document in documents]
+
+
+def test_pages_towards_older_documents(user, documents):
+    seen = []
+    before = None
+    while True:
+        page, newer, older = list_documents(user.id, before=before, page_size=4)
+        assert (newer is None) == (before is None)
+        seen += _ids(page)
+        if older is None:
+            break
+        before = older
+    assert seen == _ids(documents)
+
+
+def test_pages_back_towards_newer_documents(user, documents):
+    _, _, older = list_documents(user.id, page_size=4)
+    second, newer, _ = list_documents(user.id, before=older, page_size=4)
+    _, _, older = list_documents(user.id, before=older, page_size=4)
+    last, newer_from_last, older_from_last = list_documents(user.id, before=older, page_size=4)
+    assert older_from_last is None
+
+    back, _, _ = list_documents(user.id, after=newer_from_last, page_size=4)
+    assert _ids(back) == _ids(second)
+    first, newest, _ = list_documents(user.id, after=newer, page_size=4)
+    assert _ids(first) == _ids(documents[:4])
+    assert newest is None
+
+
+def test_only_summary_columns_loaded(session, user, documents):
+    user_id = user.id
+    session.expunge_all()
+    page, _, _ = list_documents(user_id, page_size=4)
+    assert 'similarity_details' not in page[0].__dict__
+    assert 'document_name' in page[0].__dict__
+
+
+@pytest.mark.parametrize('cursor', ['', 'garbage', 'notadate_5', '2024-01-01T00:00:00_x'])
+def test_invalid_cursor_is_ignored(user, documents, cursor):
+    assert decode_cursor(cursor) is None
+    page, newer, _ = list_documents(user.id, before=cursor, page_size=4)
+    assert _ids(page) == _ids(documents[:4])
+    assert newer is None
+
+
+def test_empty_listing(session, user):
+    assert list_documents(user.id) == ([], None, None)
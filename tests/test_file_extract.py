@@ -0,0 +1,88 @@
+import pytest
+
+from benchmarks.corpus import CorpusGenerator, write_pdf, write_text
+from src.utils.file_extract import (
+    extract_text_from_file, extract_text_with_page_map, iter_file_pages, iter_pdf_pages, pack_page_map, page_spans,
+    unpack_page_map, _run_offsets,
+)
+
+
+@pytest.fixture(scope='module')
+def pdf_path(tmp_path_factory):
+    text = CorpusGenerator(14).essay(3000)
+    return write_pdf(str(tmp_path_factory.mktemp('pdf') / 'essay.pdf'), text)
+
+
+def test_pages_are_streamed_in_order(pdf_path):
+    pages = list(iter_pdf_pages(pdf_path))
+    assert len(pages) > 2
+    assert [page.page_number for page in pages] == list(range(1, len(pages) + 1))
+    offset = 0
+    for page in pages:
+        assert page.offset == offset
+        offset += len(page.text)
+    assert extract_text_from_file(pdf_path) == ''.join(page.text for page in pages)
+
+
+def test_page_and_character_caps(pdf_path):
+    assert len(list(iter_pdf_pages(pdf_path, max_pages=2))) == 2
+    pages = list(iter_pdf_pages(pdf_path, max_chars=100))
+    assert len(pages) == 1
+    assert len(pages[0].text) == 100
+    first_pages = list(iter_pdf_pages(pdf_path))
+    pages = list(iter_pdf_pages(pdf_path, max_chars=len(first_pages[0].text) + 10))
+    assert [len(page.text) for page in pages] == [len(first_pages[0].text), 10]
+
+
+def test_time_cap_stops_at_the_next_page_boundary(pdf_path):
+    # The cap is checked between pages, so the page in progress is always finished
+    pages = list(iter_pdf_pages(pdf_path, max_seconds=1e-9))
+    assert len(pages) == 1
+    assert pages[0].text == next(iter_pdf_pages(pdf_path)).text
+
+
+def test_text_files_and_missing_files(tmp_path):
+    path = write_text(str(tmp_path / 'essay.txt'), 'plain text, ünïcode')
+    [page] = list(iter_file_pages(path))
+    assert (page.page_number, page.text, page.items) == (1, 'plain text, ünïcode', None)
+    assert list(iter_file_pages(path, max_chars=5))[0].text == 'plain'
+    assert list(iter_file_pages(str(tmp_path / 'missing.pdf'))) == []
+    assert extract_text_from_file(str(tmp_path / 'missing.pdf')) == ''
+
+
+def test_run_offsets_follow_the_page_text():
+    page_text = 'First line\nsecond  line\nthird'
+    runs = ['First line', '\n', 'second line', '', 'third', 'not there']
+    # Whitespace-only runs keep their number; a normalised run is found by its first line
+    assert _run_offsets(page_text, runs) == [0, -1, -1, -1, 24, -1]
+    assert _run_offsets('aaa', ['a', 'a', 'a']) == [0, 1, 2]
+    assert _run_offsets('one\ntwo', ['one\nTWO', 'two']) == [0, 4]
+
+
+def test_page_map_round_trip_is_sorted():
+    entries = [(40, 2, 0), (0, 1, 0), (12, 1, 2)]
+    assert unpack_page_map(pack_page_map(entries)) == sorted(entries)
+
+
+def test_page_spans_group_items_per_page():
+    page_map = [(0, 1, 0), (10, 1, 1), (20, 1, 3), (30, 2, 0), (45, 2, 2)]
+    assert page_spans(page_map, 12, 35) == [{'page': 1, 'start_item': 1, 'end_item': 3},
+                                            {'page': 2, 'start_item': 0, 'end_item': 0}]
+    assert page_spans(page_map, 46, 60) == [{'page': 2, 'start_item': 2, 'end_item': 2}]
+    assert page_spans(page_map, 0, 0) == []
+
+
+def test_pdf_page_map_points_into_the_text(pdf_path):
+    text, packed = extract_text_with_page_map(pdf_path)
+    page_map = unpack_page_map(packed)
+    pages = list(iter_pdf_pages(pdf_path))
+    assert [entry[0] for entry in page_map] == sorted(entry[0] for entry in page_map)
+    assert {page for _, page, _ in page_map} == {page.page_number for page in pages}
+    for offset, page_number, _ in page_map:
+        page = pages[page_number - 1]
+        assert page.offset <= offset < page.offset + len(page.text)
+
+    second = pages[1]
+    spans = page_spans(page_map, second.offset + 5, second.offset + 50)
+    assert [span['page'] for span in spans] == [2]
+    assert extract_text_with_page_map(write_text(pdf_path + '.txt', 'plain')) == ('plain', None)
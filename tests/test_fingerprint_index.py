@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.services.fingerprint_index import (
+    FINGERPRINT_K, FINGERPRINT_WINDOW, fingerprint_text, find_candidates, index_document, winnow,
+)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_winnow_selects_a_minimum_of_every_window(seed):
+    rnd = random.Random(seed)
+    # A small range gives ties, which must go to the rightmost minimum
+    hashes = [rnd.randrange(20) for _ in range(300)]
+    selected = winnow(hashes, FINGERPRINT_WINDOW)
+    positions = [position for _, position in selected]
+    assert positions == sorted(set(positions))
+    assert all(hashes[position] == value for value, position in selected)
+    for start in range(len(hashes) - FINGERPRINT_WINDOW + 1):
+        window = hashes[start:start + FINGERPRINT_WINDOW]
+        rightmost_minimum = start + max(i for i, value in enumerate(window) if value == min(window))
+        assert rightmost_minimum in positions
+
+
+def test_winnow_short_input():
+    assert winnow([]) == []
+    assert winnow([5, 3, 3], 4) == [(3, 2)]
+
+
+def test_shared_passage_shares_a_fingerprint():
+    generator = CorpusGenerator(9)
+    words = generator.essay(200).split(' ')
+    # The guarantee threshold: a shared run of window + k - 1 words
+    passage = ' '.join(words[50:50 + FINGERPRINT_WINDOW + FINGERPRINT_K - 1])
+    text1 = generator.essay(200) + ' ' + passage + ' ' + generator.essay(200)
+    text2 = generator.essay(200) + ' ' + passage
+    shared = {h for h, _ in fingerprint_text(text1)} & {h for h, _ in fingerprint_text(text2)}
+    assert shared
+
+
+def test_fingerprint_offsets_point_at_words():
+    text = 'One two three, four five six seven eight nine ten eleven twelve.'
+    for _, offset in fingerprint_text(text):
+        assert text[offset].isalnum()
+        assert offset == 0 or not text[offset - 1].isalnum()
+
+
+def test_candidates_share_fingerprints(make_document):
+    generator = CorpusGenerator(10)
+    source = generator.essay(400)
+    other = generator.essay(400)
+    copied = make_document(source, 'copied')
+    index_document(copied, source)
+    index_document(make_document(other, 'unrelated'), other)
+
+    suspect = generator.essay(200) + ' ' + source[500:1500]
+    candidates = find_candidates(fingerprint_text(suspect), user_id=copied.user_id)
+    assert [document_id for document_id, _ in candidates] == [copied.id]
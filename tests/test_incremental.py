@@ -0,0 +1,84 @@
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.services.incremental import TextDiff, incremental_results, split_units
+from src.services.suffix_matcher import find_common_blocks, block_similarity, MATCH_MIN_SIZE
+
+
+@pytest.fixture(scope='module')
+def texts():
+    generator = CorpusGenerator(5)
+    sources = generator.corpus(2, 1500)
+    old_text = generator.plagiarise(generator.essay(1500), sources, 0.4).text
+    return old_text, sources, generator
+
+
+def _full(new_text, sources):
+    results = {}
+    for document_id, source in enumerate(sources):
+        blocks = find_common_blocks(new_text, source)
+        results[document_id] = (block_similarity(blocks, len(new_text), len(source)), blocks)
+    return results
+
+
+def _incremental(old_text, new_text, sources):
+    candidates = {document_id: (sources[document_id], blocks)
+                  for document_id, (_, blocks) in _full(old_text, sources).items()}
+    return incremental_results(old_text, new_text, candidates)
+
+
+def _edit(text, position, replacement, removed=0):
+    return text[:position] + replacement + text[position + removed:]
+
+
+def test_split_units_keeps_text():
+    text = 'short line\n' + ' '.join(f'word{i}' for i in range(500)) + '\nlast'
+    units = split_units(text)
+    assert ''.join(units) == text
+    assert len(units) > 3
+
+
+def test_diff_maps_unchanged_ranges():
+    old_text = 'first line\nsecond line\nthird line\n'
+    new_text = 'first line\ninserted line\nsecond line\nthird line\n'
+    diff = TextDiff(old_text, new_text)
+    start = old_text.index('second')
+    [(old_start, new_start, length)] = diff.map_range(start, len(old_text))
+    assert new_text[new_start:new_start + length] == old_text[old_start:old_start + length]
+    assert diff.changed == [(new_text.index('inserted'), new_text.index('second'))]
+
+
+def test_unchanged_text_reuses_every_block(texts):
+    old_text, sources, _ = texts
+    results, summary = _incremental(old_text, old_text, sources)
+    assert summary['chars_rematched'] == 0
+    assert summary['blocks_recomputed'] == 0
+    for document_id, (score, blocks) in _full(old_text, sources).items():
+        assert results[document_id][0] == pytest.approx(score)
+        assert [(b['a_start'], b['b_start'], b['size']) for b in results[document_id][1]] == \
+            [(b['a_start'], b['b_start'], b['size']) for b in blocks]
+
+
+@pytest.mark.parametrize('edit', ['insert', 'delete', 'replace', 'copy'])
+def test_edit_matches_full_comparison(texts, edit):
+    old_text, sources, generator = texts
+    middle = len(old_text) // 2
+    if edit == 'insert':
+        new_text = _edit(old_text, middle, ' ' + generator.essay(80) + ' ')
+    elif edit == 'delete':
+        new_text = _edit(old_text, middle, '', 400)
+    elif edit == 'replace':
+        new_text = _edit(old_text, middle, generator.essay(60), 300)
+    else:
+        # A passage newly copied from a source must be found in the edited region
+        new_text = _edit(old_text, middle, ' ' + sources[1][1000:1600] + ' ')
+
+    results, summary = _incremental(old_text, new_text, sources)
+    assert summary['chars_rematched'] < len(new_text) / 2
+    for document_id, (score, blocks) in _full(new_text, sources).items():
+        incremental_score, incremental_blocks = results[document_id]
+        for block in incremental_blocks:
+            assert block['size'] >= MATCH_MIN_SIZE
+            assert new_text[block['a_start']:block['a_end']] == sources[document_id][block['b_start']:block['b_end']]
+        # Boundaries at the edit may differ by a character from a full comparison
+        assert incremental_score == pytest.approx(score, abs=2e-3)
@@ -0,0 +1,82 @@
+import gzip
+import json
+
+import pytest
+
+from src.models import db, User
+
+
+def _block(position):
+    start = position * 40
+    return {'a_start': start, 'a_end': start + 30, 'b_start': start, 'b_end': start + 30, 'size': 30,
+            'text': f'passage {position} ' * 3}
+
+
+@pytest.fixture
+def analysed(make_document):
+    document = make_document('text', 'essay')
+    document.set_similarity_details({'similar_documents': [
+        {'document_name': f'source-{rank}', 'document_type': 'User Document', 'similarity_score': 0.9 - rank / 10,
+         'matching_blocks': [_block(position) for position in range(count)]}
+        for rank, count in enumerate((120, 3, 0))
+    ]})
+    document.originality_score = 0.2
+    db.session.commit()
+    return document
+
+
+def test_sources_are_paged_with_block_counts(client, analysed):
+    first = client.get(f'/document_matches/{analysed.id}?per_page=2').get_json()
+    assert [(source['rank'], source['document_name'], source['block_count']) for source in first['sources']] == \
+        [(0, 'source-0', 120), (1, 'source-1', 3)]
+    assert (first['total'], first['next_page']) == (3, 2)
+
+    second = client.get(f'/document_matches/{analysed.id}?per_page=2&page=2').get_json()
+    assert [source['document_name'] for source in second['sources']] == ['source-2']
+    assert second['next_page'] is None
+
+
+def test_blocks_are_paged_per_source(client, analysed):
+    page = client.get(f'/document_matches/{analysed.id}/0/blocks?per_page=50&page=3').get_json()
+    assert (page['rank'], page['total'], page['next_page']) == (0, 120, None)
+    assert [block['a_start'] for block in page['blocks']] == [position * 40 for position in range(100, 120)]
+    assert client.get(f'/document_matches/{analysed.id}/3/blocks').status_code == 404
+
+
+def test_unchanged_page_is_not_modified(client, analysed):
+    response = client.get(f'/document_matches/{analysed.id}')
+    etag = response.headers['ETag']
+    assert {directive.strip() for directive in response.headers['Cache-Control'].split(',')} == {'private', 'no-cache'}
+
+    again = client.get(f'/document_matches/{analysed.id}', headers={'If-None-Match': etag})
+    assert again.status_code == 304 and again.data == b''
+
+    analysed.set_similarity_details({'similar_documents': []})
+    db.session.commit()
+    changed = client.get(f'/document_matches/{analysed.id}', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.get_json()['total'] == 0
+
+
+def test_large_pages_are_gzipped_for_clients_that_accept_it(client, analysed):
+    url = f'/document_matches/{analysed.id}/0/blocks?per_page=120'
+    plain = client.get(url)
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+
+def test_other_users_documents_are_refused(app, session, analysed):
+    other = User(username='bob', email='bob@example.com', password='x')
+    session.add(other)
+    session.commit()
+    client = app.test_client()
+    assert client.get(f'/document_matches/{analysed.id}').status_code == 401
+    with client.session_transaction() as flask_session:
+        flask_session['user'] = other.username
+        flask_session['user_id'] = other.id
+    assert client.get(f'/document_matches/{analysed.id}').status_code == 403
+    assert client.get(f'/document_matches/{analysed.id}/0/blocks').status_code == 403
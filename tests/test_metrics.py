@@ -0,0 +1,88 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import pytest
+
+import src.app
+from src.services.metrics import Registry
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return Registry(str(tmp_path))
+
+
+def _write_snapshot(registry, process_id, value):
+    other = Registry(registry.directory)
+    other.process_id = process_id
+    other.counter('paperlit_test_total', "Test counter", ('kind',)).inc(value, kind='a')
+    other.flush()
+    return os.path.join(registry.directory, f'{process_id}.json')
+
+
+def test_render_counters_and_histograms(registry):
+    counter = registry.counter('paperlit_test_total', "Test counter", ('kind',))
+    counter.inc(kind='a')
+    counter.inc(2, kind='a"b')
+    histogram = registry.histogram('paperlit_test_seconds', "Test timings", buckets=(0.1, 1.0))
+    histogram.observe(0.5)
+    lines = registry.render().splitlines()
+    assert 'paperlit_test_total{kind="a"} 1' in lines
+    assert 'paperlit_test_total{kind="a\\"b"} 2' in lines
+    assert 'paperlit_test_seconds_bucket{le="0.1"} 0' in lines
+    assert 'paperlit_test_seconds_bucket{le="1"} 1' in lines
+    assert 'paperlit_test_seconds_bucket{le="+Inf"} 1' in lines
+    assert 'paperlit_test_seconds_sum 0.5' in lines
+
+
+def test_snapshots_of_running_processes_are_added(registry):
+    registry.counter('paperlit_test_total', "Test counter", ('kind',)).inc(1, kind='a')
+    _write_snapshot(registry, f'{socket.gethostname()}-{os.getpid()}-1', 4)
+    assert registry.collect()['paperlit_test_total']['values'] == {('a',): 5.0}
+
+
+def test_snapshots_of_stopped_processes_are_pruned(registry):
+    finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                              capture_output=True, text=True)
+    dead_pid = int(finished.stdout)
+    dead = _write_snapshot(registry, f'{socket.gethostname()}-{dead_pid}-1', 4)
+    remote = _write_snapshot(registry, 'elsewhere-123-1', 2)
+    os.utime(remote, (0, 0))
+    with open(os.path.join(registry.directory, 'broken.json'), 'w') as f:
+        f.write('{')
+
+    assert 'paperlit_test_total' not in registry.collect()
+    assert not os.path.exists(dead) and not os.path.exists(remote)
+
+
+def test_flush_writes_only_changes(registry):
+    counter = registry.counter('paperlit_test_total', "Test counter", ('kind',))
+    counter.inc(kind='a')
+    registry.flush()
+    with open(registry._path()) as f:
+        assert json.load(f)['paperlit_test_total']['values'] == [[['a'], 1.0]]
+    os.remove(registry._path())
+    registry.flush()
+    assert not os.path.exists(registry._path())
+
+
+def test_endpoint_answers_localhost_only(app, monkeypatch):
+    monkeypatch.setattr(src.app, 'METRICS_TOKEN', '')
+    client = app.test_client()
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '203.0.113.5'}).status_code == 403
+    response = client.get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'})
+    assert response.status_code == 200
+    assert '# TYPE paperlit_stage_seconds histogram' in response.get_data(as_text=True)
+
+
+def test_endpoint_requires_the_token(app, monkeypatch):
+    monkeypatch.setattr(src.app, 'METRICS_TOKEN', 'secret')
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'},
+                          environ_base={'REMOTE_ADDR': '203.0.113.5'})
+    assert response.status_code == 200
@@ -0,0 +1,82 @@
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.services import minhash
+from src.services.fingerprint_index import kgram_hashes, tokenize
+from src.services.minhash import (
+    compute_signature, estimate_jaccard, band_buckets, pack_signature, unpack_signature, _MERSENNE_PRIME,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _kgram_set(text):
+    return set(kgram_hashes(tokenize(text)))
+
+
+@pytest.mark.skipif(not minhash.NUMPY_AVAILABLE, reason='NumPy is not installed')
+@pytest.mark.parametrize('words', [5, 50, 6000])
+def test_numpy_signature_equals_python_fallback(monkeypatch, words):
+    text = CorpusGenerator(words).essay(words)
+    vectorized = compute_signature(text)
+    monkeypatch.setattr(minhash, 'NUMPY_AVAILABLE', False)
+    assert compute_signature(text) == vectorized
+
+
+@pytest.mark.skipif(not minhash.NUMPY_AVAILABLE, reason='NumPy is not installed')
+def test_mulmod_is_exact_near_the_prime():
+    np = minhash.np
+    rnd = random.Random(1)
+    values = [0, 1, 2, (1 << 32) - 1, 1 << 32, (1 << 60) + 7, _MERSENNE_PRIME - 1]
+    values += [rnd.randrange(_MERSENNE_PRIME) for _ in range(200)]
+    a = np.array(values, dtype=np.uint64)[:, None]
+    x = np.array(values, dtype=np.uint64)[None, :]
+    result = minhash._mulmod_mersenne(a, x).tolist()
+    for i, left in enumerate(values):
+        assert result[i] == [left * right % _MERSENNE_PRIME for right in values]
+
+
+def test_signature_estimates_jaccard():
+    generator = CorpusGenerator(12)
+    base = generator.essay(3000)
+    edited = generator.plagiarise(base, [generator.essay(3000)], 0.2).text
+    signature1 = compute_signature(base)
+    signature2 = compute_signature(edited)
+    assert len(signature1) == minhash.MINHASH_PERMUTATIONS
+    assert all(0 <= value <= minhash._MAX_HASH for value in signature1)
+
+    set1, set2 = _kgram_set(base), _kgram_set(edited)
+    jaccard = len(set1 & set2) / len(set1 | set2)
+    assert estimate_jaccard(signature1, signature2) == pytest.approx(jaccard, abs=0.15)
+    assert estimate_jaccard(signature1, compute_signature(base)) == 1.0
+
+
+def test_signature_edge_cases():
+    assert compute_signature('') is None
+    assert compute_signature('too few words') is None
+    assert estimate_jaccard([], []) == 0.0
+    assert estimate_jaccard([1, 2], [1]) == 0.0
+
+
+def test_packed_signature_and_buckets():
+    signature = compute_signature(CorpusGenerator(2).essay(100))
+    assert unpack_signature(pack_signature(signature)) == signature
+    assert unpack_signature(None) is None
+    buckets = band_buckets(signature)
+    assert len(buckets) == minhash.MINHASH_BANDS
+    assert buckets == band_buckets(list(signature))
+    assert all(-(1 << 63) <= bucket < (1 << 63) for bucket in buckets)
+
+
+@pytest.mark.parametrize('permutations, bands', [('128', '12'), ('128', '0')])
+def test_bands_must_divide_permutations(permutations, bands):
+    env = dict(os.environ, MINHASH_PERMUTATIONS=permutations, MINHASH_BANDS=bands)
+    result = subprocess.run([sys.executable, '-c', 'import src.services.minhash'], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode != 0
+    assert f'MINHASH_BANDS ({bands}) must be a positive divisor of MINHASH_PERMUTATIONS (128)' in result.stderr
@@ -0,0 +1,41 @@
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.services import parallel_compare
+from src.services.comparison import compare_texts
+from src.services.parallel_compare import compare_in_parallel, should_compare_in_parallel, _balance
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(parallel_compare, 'PARALLEL_COMPARE_WORKERS', 2)
+    yield
+    parallel_compare.shutdown_pool()
+
+
+def test_parallel_results_match_sequential(pool):
+    generator = CorpusGenerator(13)
+    sources = generator.corpus(5, 300)
+    new_text = generator.plagiarise(generator.essay(600), sources, 0.4).text
+    # Multi-byte characters: texts are sliced from shared memory by byte offsets
+    texts = sources + ['Zitat aus der Quelle: ' + sources[0][:400] + ' – naïve café', '', new_text]
+    assert compare_in_parallel(new_text, texts) == [compare_texts(new_text, text) for text in texts]
+    assert compare_in_parallel(new_text, []) == []
+
+
+def test_balance_spreads_texts_by_length():
+    spans = [(0, 100), (100, 110), (110, 200), (200, 205), (205, 300)]
+    tasks = _balance(spans, 2)
+    assert sorted(index for task in tasks for index, _, _ in task) == list(range(len(spans)))
+    loads = [sum(end - start for _, start, end in task) for task in tasks]
+    assert max(loads) - min(loads) <= 100
+
+
+def test_parallel_only_when_enabled_and_worth_it(monkeypatch):
+    monkeypatch.setattr(parallel_compare, 'PARALLEL_COMPARE_WORKERS', 4)
+    monkeypatch.setattr(parallel_compare, 'PARALLEL_COMPARE_MIN_DOCS', 8)
+    monkeypatch.setattr(parallel_compare, 'PARALLEL_COMPARE_ENABLED', False)
+    assert not should_compare_in_parallel(100)
+    monkeypatch.setattr(parallel_compare, 'PARALLEL_COMPARE_ENABLED', True)
+    assert not should_compare_in_parallel(7)
+    assert should_compare_in_parallel(8)
@@ -0,0 +1,36 @@
+from src.models import db, RequestProfile, User
+
+
+def _grant_admin(user):
+    user.is_admin = True
+    db.session.commit()
+
+
+def test_flag_ignored_for_users_without_admin_rights(client):
+    assert client.get('/home', headers={'X-Paperlit-Profile': '1'}).status_code == 200
+    assert client.get('/home?profile=1').status_code == 200
+    assert RequestProfile.query.count() == 0
+
+
+def test_admin_flag_profiles_the_request(client, user):
+    _grant_admin(user)
+    assert client.get('/home', headers={'X-Paperlit-Profile': '1'}).status_code == 200
+    assert client.get('/home', headers={'X-Paperlit-Profile': '0'}).status_code == 200
+    profile = RequestProfile.query.one()
+    assert (profile.endpoint, profile.trigger, profile.status_code, profile.username) == ('home', 'flag', 200, 'alice')
+    assert profile.summary
+
+    response = client.get(f'/admin/profiles/{profile.id}/download')
+    assert response.status_code == 200
+    assert response.data == profile.stats
+
+
+def test_admin_pages_hidden_from_other_users(client, user):
+    assert client.get('/admin/profiles').status_code == 404
+    # Taking the name of an admin gives no rights: they are stored on the admin's row
+    admin = User(username='admin', email='admin@example.com', password='x', is_admin=True)
+    db.session.add(admin)
+    db.session.commit()
+    with client.session_transaction() as flask_session:
+        flask_session['user'] = 'admin'
+    assert client.get('/admin/profiles').status_code == 404
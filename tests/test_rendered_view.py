@@ -0,0 +1,60 @@
+import io
+
+from src.models import db, RenderedView
+from src.services.rendered_view import get_rendered_view, highlight_html, highlight_spans
+from src.services.storage import key_to_path, save_stream
+from src.services.text_store import store_text
+
+
+def _source(score, *blocks, document_type='User Document'):
+    return {'similarity_score': score, 'document_type': document_type,
+            'matching_blocks': [{'a_start': start, 'a_end': end} for start, end in blocks]}
+
+
+def test_most_similar_source_wins_overlaps():
+    sources = [_source(0.2, (0, 10)), _source(0.8, (5, 15), (15, 20)), _source(0.5, (18, 30))]
+    assert highlight_spans(100, sources) == [(0, 5, 0), (5, 20, 1), (20, 30, 2)]
+
+
+def test_blocks_are_clamped_to_the_text():
+    sources = [_source(0.5, (-5, 3), (8, 50), (60, 70), (4, 4))]
+    assert highlight_spans(10, sources) == [(0, 3, 0), (8, 10, 0)]
+    assert highlight_spans(10, [{'matching_blocks': None}]) == []
+
+
+def test_html_is_escaped_inside_and_outside_spans():
+    text = '<b>one</b> & <script>two</script>'
+    html = highlight_html(text, [_source(0.9, (13, 33), document_type='Published Material')])
+    assert html == ('&lt;b&gt;one&lt;/b&gt; &amp; <span class="highlight-published-strong" data-source="0">'
+                    '&lt;script&gt;two&lt;/script&gt;</span>')
+
+
+def _set_text(document, text):
+    stored = save_stream(io.BytesIO(text.encode('utf-8')), 'essay.txt')
+    store_text(stored.content_hash, text, key_to_path(stored.storage_key))
+    document.file_path = stored.storage_key
+    document.content_hash = stored.content_hash
+    db.session.commit()
+
+
+def test_view_is_cached_and_rebuilt_for_new_text(make_document):
+    document = make_document('placeholder', 'essay')
+    _set_text(document, 'copied <text> here')
+    document.set_similarity_details({'similar_documents': [_source(0.4, (0, 6))]})
+    db.session.commit()
+
+    view = get_rendered_view(document)
+    assert view.text_html == '<span class="highlight-user" data-source="0">copied</span> &lt;text&gt; here'
+    assert view.match_count == 1
+    assert get_rendered_view(document) is view
+
+    _set_text(document, 'edited text')
+    view = get_rendered_view(document)
+    assert view.content_hash == document.content_hash
+    assert view.text_html.endswith(' text')
+
+    # New results drop the stored view
+    document.set_similarity_details({'similar_documents': []})
+    db.session.commit()
+    assert db.session.get(RenderedView, document.id) is None
+    assert get_rendered_view(document).text_html == 'edited text'
@@ -0,0 +1,61 @@
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.models import db, ExtractedText
+from src.services import shingle_engine
+from src.utils.file_extract import EXTRACTOR_VERSION
+
+pytestmark = pytest.mark.skipif(not shingle_engine.NUMPY_AVAILABLE, reason='NumPy is not installed')
+
+
+def _dice(text1, text2):
+    set1 = set(shingle_engine.shingle_array(text1).tolist())
+    set2 = set(shingle_engine.shingle_array(text2).tolist())
+    return 2 * len(set1 & set2) / (len(set1) + len(set2))
+
+
+def test_dice_scores_equal_set_arithmetic():
+    generator = CorpusGenerator(11)
+    sources = generator.corpus(5, 400)
+    new_text = generator.plagiarise(generator.essay(400), sources[:2], 0.4).text
+    arrays = [shingle_engine.shingle_array(text) for text in sources]
+    scores = shingle_engine.dice_scores(shingle_engine.shingle_array(new_text), arrays)
+    assert scores.tolist() == pytest.approx([_dice(new_text, text) for text in sources])
+    assert scores[0] > 0.05 and scores[1] > 0.05
+
+
+def test_dice_scores_empty_inputs():
+    array = shingle_engine.shingle_array(CorpusGenerator(1).essay(50))
+    empty = shingle_engine.shingle_array('')
+    assert len(shingle_engine.dice_scores(array, [])) == 0
+    assert shingle_engine.dice_scores(empty, [array]).tolist() == [0.0]
+    assert shingle_engine.dice_scores(array, [empty, array]).tolist() == [0.0, 1.0]
+
+
+def test_score_texts_details_only_the_best():
+    generator = CorpusGenerator(12)
+    sources = generator.corpus(4, 300)
+    new_text = generator.plagiarise(generator.essay(300), sources[:3], 0.6).text
+    results = shingle_engine.score_texts(new_text, sources, detail_limit=1)
+    scores = [score for score, _ in results]
+    best = scores.index(max(scores))
+    assert [bool(blocks) for _, blocks in results] == [index == best for index in range(len(sources))]
+    for block in results[best][1]:
+        assert new_text[block['a_start']:block['a_end']] == sources[best][block['b_start']:block['b_end']]
+
+
+def test_packed_arrays_record_k():
+    array = shingle_engine.shingle_array(CorpusGenerator(2).essay(100))
+    packed = shingle_engine.pack_shingles(array)
+    assert shingle_engine.unpack_shingles(packed).tolist() == array.tolist()
+    assert shingle_engine.unpack_shingles(packed, k=shingle_engine.SHINGLE_K + 1) is None
+    assert shingle_engine.unpack_shingles(None) is None
+
+
+def test_missing_arrays_are_stored_with_the_text(session):
+    text = CorpusGenerator(3).essay(200)
+    session.add(ExtractedText(content_hash='a' * 64, extractor_version=EXTRACTOR_VERSION, text=text))
+    session.commit()
+    arrays = shingle_engine.load_shingle_arrays(['a' * 64, None])
+    assert arrays['a' * 64].tolist() == shingle_engine.shingle_array(text).tolist()
+    assert db.session.get(ExtractedText, 'a' * 64).shingles == shingle_engine.pack_shingles(arrays['a' * 64])
@@ -0,0 +1,144 @@
+import io
+import os
+import threading
+
+import pytest
+
+from src.models import db, Blob
+from src.services.storage import (
+    blob_extension, is_blob_key, key_to_path, save_stream, release_file, reconcile_storage, resolve_path,
+)
+
+
+def _save(content: bytes, filename: str = 'upload.txt'):
+    stored = save_stream(io.BytesIO(content), filename)
+    db.session.commit()
+    return stored
+
+
+def _ref_count(storage_key):
+    db.session.expire_all()
+    blob = db.session.get(Blob, storage_key)
+    return None if blob is None else blob.ref_count
+
+
+@pytest.mark.parametrize('filename, extension', [
+    ('essay.txt', '.txt'),
+    ('Essay.PDF', '.pdf'),
+    ('../../etc/x.pdf', '.pdf'),
+    ('evil.p/../../df', ''),
+    ('program.exe', ''),
+    ('no_extension', ''),
+    (None, ''),
+])
+def test_blob_extension_is_allow_listed(filename, extension):
+    assert blob_extension(filename) == extension
+
+
+def test_same_content_shares_one_blob(session):
+    first = _save(b'the same bytes', 'a.txt')
+    second = _save(b'the same bytes', 'b.txt')
+    assert first.storage_key == second.storage_key
+    assert is_blob_key(first.storage_key)
+    assert _ref_count(first.storage_key) == 2
+    assert Blob.query.count() == 1
+
+    other = _save(b'other bytes', 'a.txt')
+    assert other.storage_key != first.storage_key
+    assert _ref_count(other.storage_key) == 1
+
+
+def test_blob_removed_with_last_reference(session):
+    stored = _save(b'shared content')
+    _save(b'shared content')
+
+    assert release_file(stored.storage_key) is False
+    assert os.path.exists(stored.path)
+    assert _ref_count(stored.storage_key) == 1
+
+    assert release_file(stored.storage_key) is True
+    assert not os.path.exists(stored.path)
+    assert _ref_count(stored.storage_key) is None
+
+
+def test_upload_after_last_release_stores_again(session):
+    stored = _save(b'content uploaded again')
+    release_file(stored.storage_key)
+    again = _save(b'content uploaded again')
+    assert again.storage_key == stored.storage_key
+    assert os.path.exists(again.path)
+    assert _ref_count(again.storage_key) == 1
+
+
+def test_release_of_unknown_blob(session):
+    key = 'blobs/00/00/' + '0' * 64 + '.txt'
+    assert release_file(key) is False
+    assert release_file(None) is False
+    assert Blob.query.count() == 0
+
+
+def test_reconcile_fixes_ref_counts_and_orphans(session, make_document):
+    document = make_document('document text', 'doc')
+    orphan = _save(b'no document uses this')
+    Blob.query.filter_by(storage_key=document.file_path).update({'ref_count': 5})
+    db.session.commit()
+
+    stats = reconcile_storage()
+    assert stats['ref_counts_fixed'] == 1
+    assert stats['orphans_removed'] == 1
+    assert _ref_count(document.file_path) == 1
+    assert _ref_count(orphan.storage_key) is None
+    assert not os.path.exists(orphan.path)
+    assert resolve_path(document) == key_to_path(document.file_path)
+
+
+def test_concurrent_uploads_count_every_reference(app, session):
+    uploads = 8
+    errors = []
+    keys = []
+
+    def upload():
+        try:
+            with app.app_context():
+                keys.append(_save(b'uploaded by every thread').storage_key)
+                db.session.remove()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=upload) for _ in range(uploads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(set(keys)) == 1
+    assert _ref_count(keys[0]) == uploads
+    assert os.path.exists(key_to_path(keys[0]))
+
+
+def test_concurrent_release_and_upload_keep_the_file(app, session):
+    stored = _save(b'released while uploaded')
+    barrier = threading.Barrier(2)
+    errors = []
+
+    def run(action):
+        try:
+            with app.app_context():
+                barrier.wait()
+                action()
+                db.session.remove()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(lambda: release_file(stored.storage_key),)),
+               threading.Thread(target=run, args=(lambda: _save(b'released while uploaded'),))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Whichever ran first, the upload's reference is counted and its file exists
+    assert errors == []
+    assert _ref_count(stored.storage_key) == 1
+    assert os.path.exists(stored.path)
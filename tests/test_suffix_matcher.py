@@ -0,0 +1,95 @@
+import difflib
+import random
+
+import pytest
+
+from benchmarks.corpus import CorpusGenerator
+from src.services.plagiarism_service import find_matching_blocks
+from src.services.suffix_matcher import find_common_blocks, block_similarity
+
+MIN_SIZE = 30
+
+
+def _text_pairs():
+    generator = CorpusGenerator(7)
+    sources = generator.corpus(3, 800)
+    pairs = [(generator.plagiarise(generator.essay(800), sources, rate, 40).text, source)
+             for rate, source in zip((0.1, 0.3, 0.6), sources)]
+    # Small alphabets give many short, overlapping repeats
+    rnd = random.Random(3)
+    for alphabet in ('ab', 'abc ', 'abcdefgh '):
+        base = ''.join(rnd.choice(alphabet) for _ in range(600))
+        edited = ''.join(c if rnd.random() > 0.02 else rnd.choice(alphabet) for c in base)
+        pairs.append((edited, base))
+    return pairs
+
+
+PAIRS = _text_pairs()
+IDS = ['plagiarised-10', 'plagiarised-30', 'plagiarised-60', 'alphabet-2', 'alphabet-4', 'alphabet-9']
+
+
+def _difflib_blocks(text1, text2, min_size):
+    """The matching of the original implementation, without its truncation."""
+    matcher = difflib.SequenceMatcher(None, text1, text2, autojunk=False)
+    return [block for block in matcher.get_matching_blocks() if block.size >= min_size]
+
+
+def _assert_valid(blocks, text1, text2, min_size):
+    covered = 0
+    for block in blocks:
+        assert block['size'] >= min_size
+        assert block['a_end'] - block['a_start'] == block['size'] == block['b_end'] - block['b_start']
+        assert text1[block['a_start']:block['a_end']] == text2[block['b_start']:block['b_end']] == block['text']
+        # Ordered by position in text1 and never overlapping there
+        assert block['a_start'] >= covered
+        covered = block['a_end']
+
+
+@pytest.mark.parametrize('text1, text2', PAIRS, ids=IDS)
+def test_blocks_are_common_substrings(text1, text2):
+    _assert_valid(find_common_blocks(text1, text2, MIN_SIZE), text1, text2, MIN_SIZE)
+
+
+@pytest.mark.parametrize('text1, text2', PAIRS, ids=IDS)
+def test_covers_every_difflib_block(text1, text2):
+    blocks = find_common_blocks(text1, text2, MIN_SIZE)
+    covered = set()
+    for block in blocks:
+        covered.update(range(block['a_start'], block['a_end']))
+    for a, b, size in _difflib_blocks(text1, text2, MIN_SIZE):
+        assert covered.issuperset(range(a, a + size))
+
+
+def test_no_truncation_of_long_texts():
+    # The original implementation only looked at the first 10000 characters
+    generator = CorpusGenerator(11)
+    source = generator.essay(4000)
+    passage = source[-2000:]
+    text = generator.essay(3000) + ' ' + passage
+    blocks = find_common_blocks(text, source, MIN_SIZE)
+    assert len(text) > 10000 and len(source) > 10000
+    assert max(block['size'] for block in blocks) >= len(passage)
+
+
+def test_empty_texts():
+    assert find_common_blocks('', 'abc') == []
+    assert find_common_blocks('abc', '') == []
+    assert find_matching_blocks('', 'abc') == []
+    assert block_similarity([], 0, 10) == 0.0
+
+
+def test_repeated_passage_scores_at_most_one():
+    passage = 'the same passage copied over and over again. '
+    text1 = passage * 20
+    blocks = find_common_blocks(text1, passage, 10)
+    assert block_similarity(blocks, len(text1), len(passage)) <= 1.0
+    assert block_similarity(find_common_blocks(passage, passage, 10), len(passage), len(passage)) == 1.0
+
+
+def test_find_matching_blocks_keeps_its_default_block_size():
+    # Short common runs are still reported by the public helper, as they were with difflib
+    text1 = 'the cat sat on the mat'
+    text2 = 'a cat sat on a hat'
+    blocks = find_matching_blocks(text1, text2)
+    assert [block['text'] for block in blocks] == [' cat sat on ']
+    assert blocks == find_common_blocks(text1, text2, 5)
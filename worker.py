@@ -0,0 +1,46 @@
+"""
+Standalone analysis worker for Paperlit.
+Processes queued originality analyses from the database. Run one or more of these next
+to the web server (with ANALYSIS_WORKER_THREADS=0 there) to keep analysis off web workers.
+Usage: python worker.py [--threads N] [--once]
+"""
+import os
+import sys
+import signal
+import argparse
+import threading
+
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from src.app import app
+from src.services.analysis_jobs import run_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paperlit analysis worker")
+    parser.add_argument('--threads', type=int, default=1, help="Number of worker threads")
+    parser.add_argument('--once', action='store_true', help="Exit when the queue is empty")
+    args = parser.parse_args()
+
+    if args.once:
+        run_worker(app, once=True)
+        return
+
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+
+    threads = [
+        threading.Thread(target=run_worker, args=(app,), kwargs={'stop_event': stop_event}, name=f"analysis-worker-{i}")
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print("Analysis worker stopped")
+
+
+if __name__ == "__main__":
+    main()